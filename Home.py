@@ -1,4 +1,13 @@
+import os
+from pathlib import Path
+
 import streamlit as st
+from model_pool import get_model_pool, PRELOAD_AT_STARTUP
+
+# Resource images are shown at most this wide (twice the centered layout, for HiDPI screens)
+RESOURCES_DIR = Path("resources")
+RESIZED_DIR = Path(os.environ.get("RDD_RESOURCE_CACHE_DIR", "temp/resources"))
+MAX_IMAGE_WIDTH = 1400
 
 st.set_page_config(
     page_title="Road Damage Detection",
@@ -6,6 +15,30 @@ st.set_page_config(
     initial_sidebar_state="collapsed",
 )
 
+# Optionally load and warm up the downloaded models while the home page is being read
+if PRELOAD_AT_STARTUP:
+    get_model_pool().preload_directory()
+
+@st.cache_data(show_spinner=False)
+def resource_image(name: str, max_width: int = MAX_IMAGE_WIDTH) -> bytes:
+    """A resource image as JPEG bytes no wider than ``max_width``.
+
+    Resized copies are kept on disk (regenerated when the source changes) and in
+    memory, so neither a restart nor a rerun decodes the full-size PNGs again.
+    """
+    source = RESOURCES_DIR / name
+    resized = RESIZED_DIR / f"{source.stem}-{max_width}.jpg"
+    if not resized.exists() or resized.stat().st_mtime < source.stat().st_mtime:
+        from PIL import Image
+
+        image = Image.open(source).convert("RGB")
+        image.thumbnail((max_width, max_width * 4))
+        RESIZED_DIR.mkdir(parents=True, exist_ok=True)
+        temp_path = resized.with_suffix(".tmp")
+        image.save(temp_path, "JPEG", quality=85, optimize=True)
+        os.replace(temp_path, resized)
+    return resized.read_bytes()
+
 # Apply custom CSS
 st.markdown(
     """
@@ -18,7 +51,7 @@ st.markdown(
         font-size: 36px;
         font-weight: bold;
     }
-    .subheader {http://localhost:8501/Realtime_Detection
+    .subheader {
         font-size: 24px;
     }
     .section-title {
@@ -49,7 +82,7 @@ st.markdown(
 )
 
 # Display a banner image (replace 'path_to_image' with actual image path or URL)
-st.image(r'resources/banner.png', use_column_width=True)
+st.image(resource_image('banner.png'), use_column_width=True)
 
 # Divide the content into columns for better layout
 st.markdown(
@@ -69,30 +102,30 @@ st.markdown(
 st.divider()
 
 st.markdown('**Vertical Cracks Example**', unsafe_allow_html=True)
-st.image(r'resources/vertical_crack.png', caption="Vertical Crack", use_column_width=True, width=200)
+st.image(resource_image('vertical_crack.png'), caption="Vertical Crack", use_column_width=True, width=200)
 
 st.divider()
 
 st.markdown('**Horizontal Cracks Example**', unsafe_allow_html=True)
-st.image(r'resources/horizontal_crack.png', caption="Horizontal Crack", use_column_width=True, width=200)
+st.image(resource_image('horizontal_crack.png'), caption="Horizontal Crack", use_column_width=True, width=200)
 
 st.divider()
 
 st.markdown('**Potholes Example**', unsafe_allow_html=True)
-st.image(r'resources/pothole.png', caption="Pothole", use_column_width=True, width=200)
+st.image(resource_image('pothole.png'), caption="Pothole", use_column_width=True, width=200)
 
 st.divider()
 
 st.markdown('**Alligator Cracks Example**', unsafe_allow_html=True)
-st.image(r'resources/alligator_crack.png', caption="Alligator Crack", use_column_width=True, width=200)
+st.image(resource_image('alligator_crack.png'), caption="Alligator Crack", use_column_width=True, width=200)
 
 st.markdown('**Shoving Example**', unsafe_allow_html=True)
-st.image(r'resources/shoving.png', caption="Shoving", use_column_width=True, width=200)
+st.image(resource_image('shoving.png'), caption="Shoving", use_column_width=True, width=200)
 
 st.divider()
 
 st.markdown('**Ravelling Example**', unsafe_allow_html=True)
-st.image(r'resources/ravelling.png', caption="Ravelling", use_column_width=True, width=200)
+st.image(resource_image('ravelling.png'), caption="Ravelling", use_column_width=True, width=200)
 
 st.markdown("---")
 
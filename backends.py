@@ -0,0 +1,202 @@
+"""Pluggable inference backends for the YOLO models.
+
+The PyTorch ``.pt`` weights can be exported to ONNX (run with ONNX Runtime, optionally
+with dynamic INT8 quantization) or OpenVINO for faster CPU inference. Exported files
+are cached next to the weights under a name that includes the weights' hash, so a
+re-downloaded or retrained model is exported again. All backends are loaded through
+``ultralytics.YOLO`` and therefore return the same ``Results``/``Boxes`` structure.
+
+Run this module to check that a backend matches PyTorch on the example images:
+    python backends.py models/YOLOv8_Small_RDD.pt --backend onnx --int8
+``tests/test_backends.py`` runs the same check for ONNX on a small random model.
+"""
+import argparse
+import glob
+import hashlib
+import importlib.util
+import logging
+import os
+import shutil
+import sys
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "openvino")
+# Packages each backend needs to export and run a model (see requirements-backends.txt)
+BACKEND_PACKAGES = {"torch": ("torch",), "onnx": ("onnx", "onnxruntime"), "openvino": ("openvino",)}
+DEFAULT_BACKEND = os.environ.get("RDD_BACKEND", "torch")
+DEFAULT_INT8 = os.environ.get("RDD_INT8", "0") == "1"
+EXPORT_IMGSZ = 640
+
+_hash_cache: Dict[tuple, str] = {}
+_export_locks: Dict[str, threading.Lock] = {}
+_export_locks_lock = threading.Lock()
+
+def available_backends() -> List[str]:
+    """The backends whose packages are installed, without importing them."""
+    return [backend for backend in BACKENDS
+            if all(importlib.util.find_spec(package) for package in BACKEND_PACKAGES[backend])]
+
+def weights_hash(weights_path: str) -> str:
+    """Short SHA-256 of a weights file, cached per (path, size, mtime)."""
+    stat = os.stat(weights_path)
+    key = (os.path.abspath(weights_path), stat.st_size, stat.st_mtime)
+    if key not in _hash_cache:
+        digest = hashlib.sha256()
+        with open(weights_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        _hash_cache[key] = digest.hexdigest()[:16]
+    return _hash_cache[key]
+
+def artifact_path(weights_path: str, backend: str, int8: bool = False) -> str:
+    """Where the exported model for ``backend`` is cached."""
+    stem = os.path.splitext(weights_path)[0]
+    digest = weights_hash(weights_path)
+    if backend == "onnx":
+        return f"{stem}.{digest}{'.int8' if int8 else ''}.onnx"
+    if backend == "openvino":
+        return f"{stem}.{digest}_openvino_model"
+    raise ValueError(f"No exported artifact for backend: {backend}")
+
+def export_model(weights_path: str, backend: str, int8: bool = False) -> str:
+    """Exports ``weights_path`` for ``backend`` unless a cached export exists. Returns its path."""
+    if backend not in ("onnx", "openvino"):
+        raise ValueError(f"Cannot export to backend: {backend}")
+    if int8 and backend != "onnx":
+        raise ValueError("INT8 quantization is only available for the ONNX backend")
+
+    target = artifact_path(weights_path, backend, int8)
+    with _export_locks_lock:
+        lock = _export_locks.setdefault(target, threading.Lock())
+    with lock:
+        if os.path.exists(target):
+            return target
+        if int8:
+            _quantize_dynamic(export_model(weights_path, "onnx"), target)
+            return target
+
+        from ultralytics import YOLO
+
+        logger.info("Exporting %s to %s", weights_path, backend)
+        exported = YOLO(weights_path).export(format=backend, imgsz=EXPORT_IMGSZ, dynamic=True)
+        # Exports land at a fixed name next to the weights; move them to the hashed name
+        if backend == "onnx":
+            os.replace(exported, target)
+        else:
+            shutil.move(exported, target)
+        return target
+
+def _quantize_dynamic(onnx_path: str, target: str) -> None:
+    """Quantizes ONNX weights to INT8 (activations are quantized at runtime)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    logger.info("Quantizing %s to INT8", onnx_path)
+    temp_path = f"{target}.tmp"
+    quantize_dynamic(onnx_path, temp_path, weight_type=QuantType.QUInt8)
+    os.replace(temp_path, target)
+
+def load_model(weights_path: str, backend: str = DEFAULT_BACKEND, int8: bool = False):
+    """Loads a ``.pt`` model for the given backend, exporting it first when needed."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if backend not in available_backends():
+        raise ImportError(f"The {backend} backend needs {', '.join(BACKEND_PACKAGES[backend])} installed")
+
+    from ultralytics import YOLO
+
+    if backend == "torch":
+        if int8:
+            raise ValueError("INT8 quantization is only available for the ONNX backend")
+        return YOLO(weights_path)
+    return YOLO(export_model(weights_path, backend, int8), task="detect")
+
+class ParityReport(NamedTuple):
+    images: int
+    reference_detections: int
+    backend_detections: int
+    reference_matched: int
+    backend_matched: int
+    max_score_diff: float
+
+    @property
+    def passed(self) -> bool:
+        return (self.reference_matched == self.reference_detections
+                and self.backend_matched == self.backend_detections)
+
+def _count_matches(detections, candidates, iou_tolerance: float, score_tolerance: float):
+    """Number of ``detections`` with a same-class, overlapping, similarly scored candidate."""
+    from tracker import greedy_match, iou_matrix
+
+    iou = iou_matrix(detections.xyxy, candidates.xyxy)
+    iou[detections.class_id[:, None] != candidates.class_id[None, :]] = 0
+    rows, cols = greedy_match(iou, iou_tolerance)
+    score_diff = np.abs(detections.score[rows] - candidates.score[cols])
+    return int((score_diff <= score_tolerance).sum()), float(score_diff.max()) if len(score_diff) else 0.0
+
+def check_parity(weights_path: str, backend: str, int8: bool = False, images: Optional[Sequence[str]] = None,
+                 threshold: float = 0.25, iou_tolerance: float = 0.9, score_tolerance: float = 0.05) -> ParityReport:
+    """Compares a backend's detections with the PyTorch model on the same images.
+
+    Two detections match when they have the same class, IoU of at least ``iou_tolerance``
+    and scores within ``score_tolerance``. Every detection scoring above
+    ``threshold + score_tolerance`` on either side must have a match on the other side,
+    which may score down to ``threshold - score_tolerance``.
+    """
+    import cv2
+    from detection import DetectionBatch
+    from preprocess import Letterbox
+
+    images = list(images or sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", "*.png"))))
+    reference_model = load_model(weights_path, "torch")
+    backend_model = load_model(weights_path, backend, int8)
+    letterbox = Letterbox()
+
+    totals = np.zeros(4, dtype=int)
+    max_score_diff = 0.0
+    for image_path in images:
+        image = cv2.imread(image_path)
+        if image is None:
+            raise IOError(f"Cannot read image file: {image_path}")
+        model_input, info = letterbox(image)
+        batches: List[DetectionBatch] = []
+        for model in (reference_model, backend_model):
+            result = model.predict(model_input, conf=max(threshold - score_tolerance, 0.01), verbose=False)[0]
+            batches.append(DetectionBatch.from_result(result, letterbox_info=info))
+        reference, candidate = batches
+        # Borderline boxes only have to be matched, not to match
+        strict_reference = reference.filter(min_score=threshold + score_tolerance)
+        strict_candidate = candidate.filter(min_score=threshold + score_tolerance)
+        reference_matched, diff = _count_matches(strict_reference, candidate, iou_tolerance, score_tolerance)
+        backend_matched, _ = _count_matches(strict_candidate, reference, iou_tolerance, score_tolerance)
+        max_score_diff = max(max_score_diff, diff)
+        totals += (len(strict_reference), len(strict_candidate), reference_matched, backend_matched)
+
+    return ParityReport(len(images), *(int(total) for total in totals), max_score_diff)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check that an exported backend matches the PyTorch model.")
+    parser.add_argument("weights", help="Path to the .pt weights")
+    parser.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx")
+    parser.add_argument("--int8", action="store_true", help="Check the INT8-quantized ONNX model")
+    parser.add_argument("--score-tolerance", type=float, default=0.05)
+    parser.add_argument("--iou-tolerance", type=float, default=0.9)
+    parser.add_argument("images", nargs="*", help="Images to compare on (default: resources/*.png)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    report = check_parity(args.weights, args.backend, args.int8, args.images,
+                          iou_tolerance=args.iou_tolerance, score_tolerance=args.score_tolerance)
+    print(f"{args.backend}{' int8' if args.int8 else ''} on {report.images} images: "
+          f"{report.reference_matched}/{report.reference_detections} PyTorch detections matched, "
+          f"{report.backend_matched}/{report.backend_detections} backend detections matched, "
+          f"max score difference {report.max_score_diff:.3f}")
+    print("PASS" if report.passed else "FAIL")
+    return 0 if report.passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
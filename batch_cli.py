@@ -0,0 +1,283 @@
+"""Headless batch processing of image folders and video directories.
+
+Walks INPUT_DIR for images and .mp4 videos, runs damage detection on a pool of worker
+processes and mirrors the tree into OUTPUT_DIR: an annotated copy of every file plus a
+``<name>.json`` with its detections. Video detections are streamed frame by frame to
+``<name>.detections.<format>`` (JSONL, NPZ or Parquet) and referenced from the JSON.
+With ``--track`` each physical defect in a video is tracked across frames and listed
+once in the JSON, with its best crop saved under ``<name>.tracks/``.
+``--render-every N`` annotates only every Nth video frame and ``--render-every 0``
+skips the annotated copies altogether.
+A video with a GPS sidecar next to it (``<name>.gpx``/``.csv``) gets positions in its
+exported detections and a ``<name>.geojson`` of its located defects; with
+``--defect-index`` those are also merged with every other survey's defects.
+The JSON file is written last, so files that already have one are skipped and an
+interrupted run can simply be started again.
+
+Example:
+    python batch_cli.py surveys/ results/ --model YOLOv8_Small_RDD --workers 4 --threads 2
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg'}
+VIDEO_EXTENSIONS = {'.mp4'}
+
+logger = logging.getLogger("batch_cli")
+
+# Per-worker state, set by _init_worker
+_model = None
+_settings = None
+
+def find_inputs(input_dir: Path) -> List[Path]:
+    """Returns all supported images and videos under ``input_dir``, sorted."""
+    extensions = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+    return sorted(path for path in input_dir.rglob('*') if path.is_file() and path.suffix.lower() in extensions)
+
+def output_paths(input_path: Path, input_dir: Path, output_dir: Path) -> Tuple[Path, Path]:
+    """Returns the annotated output path and detections JSON path for an input file."""
+    relative = input_path.relative_to(input_dir)
+    annotated_path = output_dir / relative
+    return annotated_path, annotated_path.with_name(annotated_path.name + '.json')
+
+def resolve_model(model: str) -> str:
+    """Returns a local path for a model given as a path or a catalog name, downloading it if needed."""
+    from model import check_and_download_model, models_dir
+
+    if os.path.isfile(model):
+        return model
+    name = model if model.endswith('.pt') else f"{model}.pt"
+    local_path = os.path.join(models_dir, name)
+    if os.path.isfile(local_path):
+        return local_path
+    downloaded_path = check_and_download_model(name)
+    if downloaded_path is None:
+        raise SystemExit(f"Could not find or download model {model}")
+    return downloaded_path
+
+def _init_worker(model_path: str, threads: int, settings: dict) -> None:
+    """Limits intra-op threads and loads the model once per worker process.
+
+    ONNX Runtime and OpenVINO take their limit from ``OMP_NUM_THREADS``, set before
+    the workers are spawned, so torch is only imported for the torch backend.
+    """
+    import cv2
+    from model_pool import get_model_pool
+
+    global _model, _settings
+    if settings['backend'] == "torch":
+        import torch
+
+        torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    _model = get_model_pool().get(model_path, settings['backend'], settings['int8'])
+    _settings = settings
+
+def _write_json(path: Path, payload: dict) -> None:
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(payload, f)
+    os.replace(temp_path, path)
+
+def process_file(input_path: str, annotated_path: str, detections_path: str) -> int:
+    """Processes one image or video in a worker and returns the number of detections."""
+    input_path, annotated_path, detections_path = Path(input_path), Path(annotated_path), Path(detections_path)
+    annotated_path.parent.mkdir(parents=True, exist_ok=True)
+    # Write next to the final file and rename, so partial outputs never look finished
+    temp_path = annotated_path.with_name(f".{annotated_path.stem}.partial{annotated_path.suffix}")
+    render = _settings['render_every'] != 0
+    summary = {
+        'source': str(input_path),
+        'annotated': str(annotated_path) if render else None,
+        'model': os.path.basename(_settings['model_path']),
+        'threshold': _settings['threshold'],
+    }
+    if input_path.suffix.lower() in VIDEO_EXTENSIONS:
+        export_path = annotated_path.with_name(f"{annotated_path.name}.detections.{_settings['export_format']}")
+        tracks_dir = annotated_path.with_name(f"{annotated_path.name}.tracks") if _settings['track'] else None
+        geojson_path = annotated_path.with_name(f"{annotated_path.name}.geojson")
+        count, tracks, geo = _process_video(input_path, temp_path if render else None, export_path, tracks_dir, geojson_path)
+        summary.update(detection_count=count, detections_file=str(export_path))
+        if tracks is not None:
+            summary.update(track_count=len(tracks), tracks=tracks)
+        if geo is not None:
+            summary.update(geo=geo)
+    else:
+        detections = _process_image(input_path, temp_path if render else None)
+        count = len(detections)
+        summary.update(detection_count=count, detections=detections.to_records())
+    if render:
+        os.replace(temp_path, annotated_path)
+
+    _write_json(detections_path, summary)
+    return count
+
+def _process_image(input_path: Path, output_path: Optional[Path]):
+    import cv2
+    from detection import draw_detections
+    from inference import predict_image
+
+    image = cv2.imread(str(input_path))
+    if image is None:
+        raise IOError(f"Cannot read image file: {input_path}")
+    detections, _ = predict_image(_model, image, _settings['threshold'], tiling=_settings['tiling'])
+    if output_path is not None and not cv2.imwrite(str(output_path), draw_detections(image, detections)):
+        raise IOError(f"Cannot write image file: {output_path}")
+    return detections
+
+def _process_video(input_path: Path, output_path: Optional[Path], export_path: Path, tracks_dir: Optional[Path],
+                   geojson_path: Path):
+    """Returns the number of exported detections, one dict per tracked defect (when tracking)
+    and a summary of the located defects (when the video has a GPS sidecar)."""
+    import cv2
+    from export import open_exporter
+    from geo import GeoTagger, GpsTrack, find_sidecar, merge_into_index
+    from tracker import DefectTracker
+    from video_engine import VideoEngine, probe_video
+
+    info = probe_video(input_path)
+    if info is None:
+        raise IOError(f"Cannot open video file: {input_path}")
+    tracker = DefectTracker(high_score=max(_settings['threshold'], 0.5)) if tracks_dir else None
+    sidecar = find_sidecar(input_path)
+    gps = GpsTrack.load(sidecar, _settings['gps_offset']) if sidecar else None
+    geotagger = GeoTagger(gps, info.fps, survey=str(input_path)) if gps else None
+    with open_exporter(export_path, info.fps, _settings['export_format'], gps=gps) as exporter:
+        sinks = [exporter] + ([tracker] if tracker else []) + ([geotagger] if geotagger else [])
+        engine = VideoEngine(_model, _settings['threshold'], batch_size=_settings['batch_size'],
+                             queue_depth=_settings['queue_depth'], tiling=_settings['tiling'], sinks=sinks,
+                             io=_settings['io'], render_every=_settings['render_every'])
+        engine.run(input_path, output_path)
+    geo = None
+    if geotagger:
+        survey_index = geotagger.close()
+        survey_index.write_geojson(geojson_path)
+        geo = {'sidecar': str(sidecar), 'defects': len(survey_index), 'untagged_detections': geotagger.untagged,
+               'geojson': str(geojson_path)}
+        if _settings['defect_index']:
+            geo['matched_known'], geo['added_new'] = merge_into_index(survey_index, Path(_settings['defect_index']))
+    if tracker is None:
+        return exporter.rows_written, None, geo
+
+    tracks = []
+    tracks_dir.mkdir(parents=True, exist_ok=True)
+    for record in tracker.close():
+        entry = record.to_record()
+        if record.best_crop is not None:
+            crop_path = tracks_dir / f"track_{record.track_id:05d}.jpg"
+            cv2.imwrite(str(crop_path), record.best_crop)
+            entry['crop'] = str(crop_path)
+        tracks.append(entry)
+    return exporter.rows_written, tracks, geo
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run road damage detection over a directory of images and videos.")
+    parser.add_argument("input_dir", type=Path, help="Directory tree with images and .mp4 videos")
+    parser.add_argument("output_dir", type=Path, help="Directory for annotated files and detection JSON")
+    parser.add_argument("--model", required=True, help="Model name from the catalog or path to a .pt file")
+    parser.add_argument("--backend", choices=["torch", "onnx", "openvino"], default=None,
+                        help="Inference backend (default: $RDD_BACKEND or torch)")
+    parser.add_argument("--int8", action="store_true", help="Use the INT8-quantized ONNX model")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Confidence threshold (default: 0.5)")
+    parser.add_argument("--workers", type=int, default=max(os.cpu_count() // 2, 1), help="Worker processes")
+    parser.add_argument("--threads", type=int, default=2, help="Intra-op threads per worker")
+    parser.add_argument("--batch-size", type=int, default=4, help="Video frames per predict call")
+    parser.add_argument("--queue-depth", type=int, default=8, help="Frames buffered between video stages")
+    parser.add_argument("--tile-size", type=int, default=0, help="Enable sliced inference with this tile size")
+    parser.add_argument("--tile-overlap", type=float, default=0.2, help="Overlap between tiles (default: 0.2)")
+    parser.add_argument("--video-backend", choices=["opencv", "pyav"], default=None,
+                        help="Video decode/encode backend (default: $RDD_VIDEO_BACKEND, else pyav if installed)")
+    parser.add_argument("--crf", type=int, default=23, help="H.264 quality with the pyav backend (default: 23)")
+    parser.add_argument("--preset", default="veryfast", help="H.264 preset with the pyav backend (default: veryfast)")
+    parser.add_argument("--render-every", type=int, default=1,
+                        help="Draw and encode every Nth video frame; 0 skips annotated images and videos (default: 1)")
+    parser.add_argument("--export-format", choices=["jsonl", "npz", "parquet"], default="jsonl",
+                        help="Format of per-frame video detections (default: jsonl)")
+    parser.add_argument("--track", action="store_true", help="Track defects across video frames and count each once")
+    parser.add_argument("--gps-offset", type=float, default=0.0,
+                        help="Seconds into each GPS sidecar track at which its video starts (default: 0)")
+    parser.add_argument("--defect-index", type=Path, default=None,
+                        help="Merge located defects of all videos into this index file (.npz, shared across runs)")
+    parser.add_argument("--force", action="store_true", help="Reprocess files that already have results")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)-7s %(name)s: %(message)s")
+
+    # Keep each worker's native thread pools at the requested size (inherited by workers)
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(variable, str(args.threads))
+
+    from backends import BACKEND_PACKAGES, DEFAULT_BACKEND, available_backends, export_model
+    from export import available_export_formats
+    from tiling import TileConfig
+    from video_io import DEFAULT_VIDEO_BACKEND, VideoIOConfig
+
+    inputs = find_inputs(args.input_dir)
+    jobs = []
+    for input_path in inputs:
+        annotated_path, detections_path = output_paths(input_path, args.input_dir, args.output_dir)
+        if detections_path.exists() and not args.force:
+            continue
+        jobs.append((str(input_path), str(annotated_path), str(detections_path)))
+    logger.info("%d files found, %d already done, %d to process", len(inputs), len(inputs) - len(jobs), len(jobs))
+    if not jobs:
+        return 0
+
+    if args.export_format not in available_export_formats():
+        raise SystemExit(f"--export-format {args.export_format} needs pyarrow (pip install pyarrow)")
+    backend = args.backend or DEFAULT_BACKEND
+    if backend not in available_backends():
+        raise SystemExit(f"The {backend} backend needs {', '.join(BACKEND_PACKAGES[backend])} "
+                         f"(pip install -r requirements-backends.txt)")
+    if args.int8 and backend != "onnx":
+        raise SystemExit("--int8 is only available with the onnx backend")
+    model_path = resolve_model(args.model)
+    if backend != "torch":
+        # Export once up front instead of racing in every worker
+        export_model(model_path, backend, args.int8)
+    settings = {
+        'model_path': model_path,
+        'backend': backend,
+        'int8': args.int8,
+        'threshold': args.threshold,
+        'batch_size': args.batch_size,
+        'queue_depth': args.queue_depth,
+        'export_format': args.export_format,
+        'track': args.track,
+        'tiling': TileConfig(tile_size=args.tile_size, overlap=args.tile_overlap) if args.tile_size else None,
+        'io': VideoIOConfig(backend=args.video_backend or DEFAULT_VIDEO_BACKEND, preset=args.preset, crf=args.crf),
+        'render_every': args.render_every,
+        'gps_offset': args.gps_offset,
+        'defect_index': str(args.defect_index) if args.defect_index else None,
+    }
+
+    failed = 0
+    start = time.perf_counter()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context, initializer=_init_worker,
+                             initargs=(model_path, args.threads, settings)) as pool:
+        futures = {pool.submit(process_file, *job): job[0] for job in jobs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            input_path = futures[future]
+            try:
+                count = future.result()
+                logger.info("[%d/%d] %s: %d detections", done, len(jobs), input_path, count)
+            except Exception as e:
+                failed += 1
+                logger.error("[%d/%d] %s failed: %s", done, len(jobs), input_path, e)
+
+    logger.info("Finished %d files in %.1fs, %d failed", len(jobs), time.perf_counter() - start, failed)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
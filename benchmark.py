@@ -0,0 +1,334 @@
+"""Reproducible, offline benchmark of the image and video inference paths.
+
+Every configuration (mode x resolution x batch size x thread count) runs in a fresh
+process so thread settings and peak RSS are measured in isolation. Inputs are
+synthetic images and videos generated from a fixed seed, and unless ``--weights`` is
+given the model is a tiny randomly initialized YOLOv8n with the project's six classes,
+so no download or network access is needed.
+
+Per-frame latency is recorded for each stage (decode, letterbox, predict, extract,
+annotate, encode) and reported as mean/p50/p95/p99 in milliseconds,
+together with frames/sec and peak RSS. ``predict`` is the wall time of the
+``model.predict`` call; the model's own split of it (ultralytics ``Results.speed``) is
+reported separately as ``model_preprocess``/``model_inference``/``model_postprocess``. The video mode also reports the throughput of
+the pipelined ``VideoEngine`` on the same clip.
+
+Examples:
+    python benchmark.py --output bench.json
+    python benchmark.py --resolutions 1280x720,3840x2160 --batch-sizes 1,8 --threads 1,4
+    python benchmark.py --compare before.json after.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+STAGES = ("decode", "letterbox", "predict", "model_preprocess", "model_inference", "model_postprocess",
+          "extract", "annotate", "encode")
+SEED = 0
+
+def synthetic_frame(rng: np.random.Generator, width: int, height: int, t: int = 0) -> np.ndarray:
+    """A road-like BGR frame: gray asphalt texture with dark crack lines and blobs."""
+    import cv2
+
+    frame = rng.normal(110, 18, (height, width, 1)).clip(0, 255).astype(np.uint8).repeat(3, axis=2)
+    shift = (t * 7) % max(height, 1)
+    for _ in range(6):
+        x = int(rng.integers(0, width))
+        cv2.line(frame, (x, (shift - height) % height), (x + int(rng.integers(-60, 60)), (shift + height // 2) % height),
+                 (40, 40, 40), int(rng.integers(2, 6)))
+    for _ in range(3):
+        center = (int(rng.integers(0, width)), (int(rng.integers(0, height)) + shift) % height)
+        cv2.ellipse(frame, center, (int(rng.integers(20, 80)), int(rng.integers(10, 40))), 0, 0, 360, (30, 30, 35), -1)
+    return frame
+
+def synthetic_video(path: Path, width: int, height: int, frames: int, fps: float = 30.0) -> Path:
+    import cv2
+
+    rng = np.random.default_rng(SEED)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    base = synthetic_frame(rng, width, height)
+    for t in range(frames):
+        # Scroll a base frame like a dashcam moving forward, which is cheap to generate
+        writer.write(np.roll(base, t * 7, axis=0))
+    writer.release()
+    return path
+
+def build_model(weights: Optional[str]):
+    """Loads ``weights`` or builds a tiny random YOLOv8n with the project's classes."""
+    import torch
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import DetectionModel
+    from detection import CLASSES
+
+    if weights:
+        return YOLO(weights)
+    torch.manual_seed(SEED)
+    model = YOLO("yolov8n.yaml", task="detect")
+    model.model = DetectionModel("yolov8n.yaml", nc=len(CLASSES), verbose=False)
+    model.model.names = dict(enumerate(CLASSES))
+    return model
+
+def summarize(samples: Dict[str, List[float]]) -> Dict[str, dict]:
+    """Mean and p50/p95/p99 in milliseconds for each stage's per-frame samples."""
+    summary = {}
+    for stage in STAGES:
+        values = np.array(samples.get(stage) or [0.0]) * 1000
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summary[stage] = {'mean_ms': round(float(values.mean()), 3), 'p50_ms': round(float(p50), 3),
+                          'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3)}
+    return summary
+
+def _record(samples: Dict[str, List[float]], stage: str, seconds: float, frames: int = 1) -> None:
+    """Adds a batch-level timing as ``frames`` per-frame samples."""
+    samples.setdefault(stage, []).extend([seconds / frames] * frames)
+
+def _model_split(samples: Dict[str, List[float]], results) -> None:
+    """Adds the model's own preprocess/inference/postprocess split (ultralytics ``Results.speed``)."""
+    for result in results:
+        for stage in ("preprocess", "inference", "postprocess"):
+            samples.setdefault(f"model_{stage}", []).append(result.speed.get(stage, 0.0) / 1000)
+
+def bench_images(model, width: int, height: int, frames: int, batch_size: int, conf: float) -> dict:
+    import cv2
+    from detection import DetectionBatch, draw_detections
+    from preprocess import Letterbox
+
+    rng = np.random.default_rng(SEED)
+    encoded = [cv2.imencode('.jpg', synthetic_frame(rng, width, height, t))[1] for t in range(min(frames, 8))]
+    letterbox = Letterbox(slots=batch_size)
+    samples: Dict[str, List[float]] = {}
+
+    start = time.perf_counter()
+    for first in range(0, frames, batch_size):
+        count = min(batch_size, frames - first)
+        t0 = time.perf_counter()
+        images = [cv2.imdecode(encoded[(first + i) % len(encoded)], cv2.IMREAD_COLOR) for i in range(count)]
+        t1 = time.perf_counter()
+        inputs, infos = zip(*(letterbox(image) for image in images))
+        t2 = time.perf_counter()
+        results = model.predict(list(inputs), conf=conf, verbose=False)
+        t3 = time.perf_counter()
+        batches = [DetectionBatch.from_result(result, first + i, info) for i, (result, info) in enumerate(zip(results, infos))]
+        t4 = time.perf_counter()
+        for image, detections in zip(images, batches):
+            draw_detections(image, detections)
+        t5 = time.perf_counter()
+        for image in images:
+            cv2.imencode('.png', image)
+        t6 = time.perf_counter()
+
+        _record(samples, "decode", t1 - t0, count)
+        _record(samples, "letterbox", t2 - t1, count)
+        _record(samples, "predict", t3 - t2, count)
+        _model_split(samples, results)
+        _record(samples, "extract", t4 - t3, count)
+        _record(samples, "annotate", t5 - t4, count)
+        _record(samples, "encode", t6 - t5, count)
+    elapsed = time.perf_counter() - start
+    return {'fps': round(frames / elapsed, 2), 'stages': summarize(samples)}
+
+def bench_video(model, width: int, height: int, frames: int, batch_size: int, conf: float, workdir: Path,
+                video_backend: str = "opencv") -> dict:
+    from detection import DetectionBatch, draw_detections
+    from preprocess import Letterbox
+    from video_engine import VideoEngine
+    from video_io import VideoIOConfig, open_reader, open_writer
+
+    video_path = synthetic_video(workdir / f"synthetic_{width}x{height}.mp4", width, height, frames)
+    io = VideoIOConfig(backend=video_backend)
+    capture = open_reader(video_path, io)
+    writer = open_writer(workdir / "serial_output.mp4", capture.info, io, source=capture)
+    letterbox = Letterbox(slots=batch_size)
+    samples: Dict[str, List[float]] = {}
+
+    # Serial pass: every stage timed on its own
+    start = time.perf_counter()
+    done = False
+    processed = 0
+    while not done:
+        t0 = time.perf_counter()
+        batch = []
+        while len(batch) < batch_size:
+            ret, frame = capture.read()
+            if not ret:
+                done = True
+                break
+            batch.append(frame)
+        if not batch:
+            break
+        t1 = time.perf_counter()
+        inputs, infos = zip(*(letterbox(frame) for frame in batch))
+        t2 = time.perf_counter()
+        results = model.predict(list(inputs), conf=conf, verbose=False)
+        t3 = time.perf_counter()
+        batches = [DetectionBatch.from_result(result, processed + i, info) for i, (result, info) in enumerate(zip(results, infos))]
+        t4 = time.perf_counter()
+        for frame, detections in zip(batch, batches):
+            draw_detections(frame, detections)
+        t5 = time.perf_counter()
+        for frame in batch:
+            writer.write(frame)
+        t6 = time.perf_counter()
+
+        count = len(batch)
+        processed += count
+        _record(samples, "decode", t1 - t0, count)
+        _record(samples, "letterbox", t2 - t1, count)
+        _record(samples, "predict", t3 - t2, count)
+        _model_split(samples, results)
+        _record(samples, "extract", t4 - t3, count)
+        _record(samples, "annotate", t5 - t4, count)
+        _record(samples, "encode", t6 - t5, count)
+    capture.close()
+    writer.close()
+    serial_seconds = time.perf_counter() - start
+
+    # Pipelined pass through the production engine
+    engine = VideoEngine(model, conf, batch_size=batch_size, io=io)
+    engine_stats = engine.run(video_path, workdir / "engine_output.mp4")
+
+    return {
+        'fps': round(processed / serial_seconds, 2),
+        'video_backend': video_backend,
+        'pipeline_fps': round(engine_stats.fps, 2),
+        'pipeline_stage_fps': {name: round(stage.fps, 2) for name, stage in engine_stats.stages.items()},
+        'stages': summarize(samples),
+    }
+
+def run_config(config: dict) -> dict:
+    """Runs one benchmark configuration; meant to be called in a fresh process."""
+    import cv2
+    import torch
+
+    torch.set_num_threads(config['threads'])
+    cv2.setNumThreads(config['threads'])
+    width, height = config['resolution']
+
+    t0 = time.perf_counter()
+    model = build_model(config['weights'])
+    # Warm up so lazy initialization is not counted as inference
+    model.predict(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
+    load_seconds = time.perf_counter() - t0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if config['mode'] == 'video':
+            result = bench_video(model, width, height, config['frames'], config['batch_size'], config['conf'], Path(workdir),
+                                 config['video_backend'])
+        else:
+            result = bench_images(model, width, height, config['frames'], config['batch_size'], config['conf'])
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss_mb = peak_rss / 1024 if sys.platform != 'darwin' else peak_rss / 1024 / 1024
+    return {
+        'mode': config['mode'],
+        'resolution': f"{width}x{height}",
+        'batch_size': config['batch_size'],
+        'threads': config['threads'],
+        'frames': config['frames'],
+        'model_load_seconds': round(load_seconds, 3),
+        'peak_rss_mb': round(peak_rss_mb, 1),
+        **result,
+    }
+
+def environment(weights: Optional[str]) -> dict:
+    import cv2
+    import torch
+    import ultralytics
+
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'ultralytics': ultralytics.__version__,
+        'opencv': cv2.__version__,
+        'model': weights or 'random yolov8n (nc=6)',
+    }
+
+def _inference_p95(result: dict) -> float:
+    stages = result['stages']
+    # Result files from before the stage split named it "inference"
+    return (stages.get('model_inference') or stages['inference'])['p95_ms']
+
+def compare(before_path: str, after_path: str) -> None:
+    """Prints the FPS and p95 inference change for every configuration present in both runs."""
+    def index(path):
+        with open(path) as f:
+            runs = json.load(f)['results']
+        return {(r['mode'], r['resolution'], r['batch_size'], r['threads'], r.get('video_backend') or ''): r for r in runs}
+
+    before, after = index(before_path), index(after_path)
+    print(f"{'mode':6} {'resolution':>10} {'batch':>5} {'threads':>7} {'io':>6} {'fps before':>10} {'fps after':>9} {'change':>7} {'p95 inf ms':>16}")
+    for key in sorted(before.keys() & after.keys()):
+        b, a = before[key], after[key]
+        change = (a['fps'] / b['fps'] - 1) * 100 if b['fps'] else 0.0
+        p95 = f"{_inference_p95(b):.1f}->{_inference_p95(a):.1f}"
+        print(f"{key[0]:6} {key[1]:>10} {key[2]:>5} {key[3]:>7} {key[4]:>6} {b['fps']:>10.1f} {a['fps']:>9.1f} {change:>+6.1f}% {p95:>16}")
+
+def _parse_resolution(value: str):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the image and video inference paths on synthetic data.")
+    parser.add_argument("--modes", default="image,video", help="Comma-separated: image, video")
+    parser.add_argument("--resolutions", default="1280x720,1920x1080", help="Comma-separated WIDTHxHEIGHT")
+    parser.add_argument("--batch-sizes", default="1,4", help="Comma-separated batch sizes")
+    parser.add_argument("--threads", default=str(min(os.cpu_count() or 1, 4)), help="Comma-separated torch/OpenCV thread counts")
+    parser.add_argument("--video-backends", default="opencv", help="Comma-separated video I/O backends for the pipelined run: opencv, pyav")
+    parser.add_argument("--frames", type=int, default=64, help="Images or video frames per configuration")
+    parser.add_argument("--conf", type=float, default=0.01, help="Confidence threshold (low, so random weights still produce boxes)")
+    parser.add_argument("--weights", help="Benchmark these .pt weights instead of a random model")
+    parser.add_argument("--output", default="benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    configs = [
+        {'mode': mode, 'resolution': resolution, 'batch_size': batch_size, 'threads': threads,
+         'frames': args.frames, 'conf': args.conf, 'weights': args.weights, 'video_backend': video_backend}
+        for mode, resolution, batch_size, threads in product(
+            args.modes.split(','),
+            [_parse_resolution(r) for r in args.resolutions.split(',')],
+            [int(b) for b in args.batch_sizes.split(',')],
+            [int(t) for t in args.threads.split(',')],
+        )
+        # Only the video mode depends on the video I/O backend
+        for video_backend in (args.video_backends.split(',') if mode == 'video' else [None])
+    ]
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for i, config in enumerate(configs, start=1):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            result = pool.submit(run_config, config).result()
+        results.append(result)
+        print(f"[{i}/{len(configs)}] {result['mode']:5} {result['resolution']:>9} batch={result['batch_size']:<2} "
+              f"threads={result['threads']:<2} {result.get('video_backend') or '':6} {result['fps']:7.1f} FPS  p95 inference "
+              f"{_inference_p95(result):.1f} ms  peak RSS {result['peak_rss_mb']:.0f} MB", flush=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(args.weights), 'results': results}, f, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
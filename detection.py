@@ -0,0 +1,146 @@
+from typing import NamedTuple, List, Optional, Sequence
+import numpy as np
+import cv2
+
+from preprocess import LetterboxInfo, scale_boxes
+from renderer import Renderer
+
+# Class labels in the order used by the trained models
+CLASSES = [
+    'Alligator Crack',
+    'Vertical Crack',
+    'Potholes',
+    'Raveling',
+    'Shoving',
+    'Horizontal Crack'
+]
+
+# Fixed BGR color per class
+CLASS_COLORS = [
+    (56, 56, 255),
+    (151, 157, 255),
+    (31, 112, 255),
+    (29, 178, 255),
+    (49, 210, 207),
+    (10, 249, 72),
+]
+
+# Detection named tuple
+class Detection(NamedTuple):
+    class_id: int
+    label: str
+    score: float
+    box: np.ndarray
+
+class DetectionBatch:
+    """Columnar detections for one or more frames.
+
+    Each column is a NumPy array with one row per box: ``class_id`` (int32), ``score``
+    (float32), ``xyxy`` (float32, N x 4, original image pixels), ``frame_index``
+    (int64, ascending) and ``timestamp`` (float64, the frame's decoder timestamp in
+    seconds, NaN where it is unknown). Slicing with a ``slice`` returns views of the same
+    arrays; ``Detection`` tuples are only built by ``to_detections`` for display.
+    """
+
+    __slots__ = ("class_id", "score", "xyxy", "frame_index", "timestamp")
+
+    def __init__(self, class_id: np.ndarray, score: np.ndarray, xyxy: np.ndarray, frame_index: np.ndarray,
+                 timestamp: Optional[np.ndarray] = None):
+        self.class_id = class_id
+        self.score = score
+        self.xyxy = xyxy
+        self.frame_index = frame_index
+        self.timestamp = np.full(len(score), np.nan) if timestamp is None else timestamp
+
+    @classmethod
+    def empty(cls) -> "DetectionBatch":
+        return cls(np.empty(0, np.int32), np.empty(0, np.float32), np.empty((0, 4), np.float32), np.empty(0, np.int64))
+
+    @classmethod
+    def from_result(cls, result, frame_index: int = 0, letterbox_info: Optional[LetterboxInfo] = None) -> "DetectionBatch":
+        """Builds a batch from a YOLO result in one pass over ``result.boxes.data``.
+
+        With ``letterbox_info`` the boxes are mapped from the letterboxed model input back
+        to the original image's pixel coordinates.
+        """
+        data = result.boxes.cpu().numpy().data
+        xyxy = data[:, :4]
+        if letterbox_info is not None:
+            xyxy = scale_boxes(xyxy, letterbox_info)
+        return cls(
+            class_id=data[:, 5].astype(np.int32),
+            score=data[:, 4].astype(np.float32, copy=False),
+            xyxy=xyxy.astype(np.float32, copy=False),
+            frame_index=np.full(len(data), frame_index, dtype=np.int64),
+        )
+
+    @classmethod
+    def concatenate(cls, batches: List["DetectionBatch"]) -> "DetectionBatch":
+        if not batches:
+            return cls.empty()
+        return cls(
+            np.concatenate([b.class_id for b in batches]),
+            np.concatenate([b.score for b in batches]),
+            np.concatenate([b.xyxy for b in batches]),
+            np.concatenate([b.frame_index for b in batches]),
+            np.concatenate([b.timestamp for b in batches]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.score)
+
+    def __getitem__(self, key) -> "DetectionBatch":
+        """Row selection: slices are zero-copy views, masks and index arrays copy."""
+        return DetectionBatch(self.class_id[key], self.score[key], self.xyxy[key], self.frame_index[key], self.timestamp[key])
+
+    def filter(self, classes: Optional[Sequence[int]] = None, min_score: Optional[float] = None) -> "DetectionBatch":
+        """Keeps rows whose class is in ``classes`` and whose score is at least ``min_score``."""
+        mask = np.ones(len(self), dtype=bool)
+        if classes is not None:
+            mask &= np.isin(self.class_id, classes)
+        if min_score is not None:
+            mask &= self.score >= min_score
+        return self if mask.all() else self[mask]
+
+    def for_frame(self, frame_index: int) -> "DetectionBatch":
+        """Zero-copy view of one frame's rows."""
+        start, stop = np.searchsorted(self.frame_index, [frame_index, frame_index + 1])
+        return self[start:stop]
+
+    def with_frame_index(self, frame_index: int) -> "DetectionBatch":
+        """The same boxes attributed to another frame (used to carry detections forward)."""
+        return DetectionBatch(self.class_id, self.score, self.xyxy, np.full(len(self), frame_index, dtype=np.int64))
+
+    def with_timestamp(self, timestamp: Optional[float]) -> "DetectionBatch":
+        """The same rows stamped with their frame's decoder timestamp (seconds, None if unknown)."""
+        value = np.nan if timestamp is None else timestamp
+        return DetectionBatch(self.class_id, self.score, self.xyxy, self.frame_index, np.full(len(self), value))
+
+    def to_records(self) -> List[dict]:
+        """Converts to JSON-serializable dicts, one per box."""
+        return [
+            {'frame': frame, 'class_id': class_id, 'label': CLASSES[class_id], 'score': round(score, 4),
+             'box': [round(v, 1) for v in box]}
+            for frame, class_id, score, box in zip(self.frame_index.tolist(), self.class_id.tolist(),
+                                                   self.score.tolist(), self.xyxy.tolist())
+        ]
+
+    def to_detections(self) -> List[Detection]:
+        """Converts to ``Detection`` tuples for display."""
+        return [
+            Detection(class_id=class_id, label=CLASSES[class_id], score=score, box=box)
+            for class_id, score, box in zip(self.class_id.tolist(), self.score.tolist(), self.xyxy.astype(int))
+        ]
+
+# Sprite-caching renderers for BGR and RGB images
+_RENDERERS = {
+    False: Renderer(CLASSES, CLASS_COLORS),
+    True: Renderer(CLASSES, [color[::-1] for color in CLASS_COLORS]),
+}
+
+def draw_detections(image: np.ndarray, detections: DetectionBatch, rgb: bool = False) -> np.ndarray:
+    """Draws boxes and labels onto ``image`` in place and returns it.
+
+    Colors are BGR by default; pass ``rgb=True`` for images in RGB order.
+    """
+    return _RENDERERS[rgb].draw(image, detections)
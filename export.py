@@ -0,0 +1,200 @@
+import importlib.util
+import json
+import zipfile
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from detection import CLASSES, DetectionBatch
+
+# Supported export formats, keyed by file extension
+EXPORT_FORMATS = ("jsonl", "npz", "parquet")
+DEFAULT_CHUNK_ROWS = 10_000
+
+def available_export_formats() -> List[str]:
+    """The formats that can be written here; Parquet needs pyarrow."""
+    return [name for name in EXPORT_FORMATS if name != "parquet" or importlib.util.find_spec("pyarrow")]
+
+class DetectionExporter:
+    """Streams per-frame detections to disk in fixed-size column chunks.
+
+    Use as a ``VideoEngine`` sink: ``write`` buffers at most ``chunk_rows`` boxes before
+    they are appended to the file, so memory stays bounded however long the video is.
+    Every row holds frame index, timestamp (seconds), class id, score and the x1, y1,
+    x2, y2 box in original video pixels. The timestamp is the frame's decoder timestamp,
+    so it is exact for variable frame rate clips; ``frame_index / fps`` is only used for
+    rows without one. With a ``gps`` track (``geo.GpsTrack``) rows
+    also carry the camera's interpolated ``lat`` and ``lon`` (NaN outside the track).
+    """
+
+    def __init__(self, path: Path, fps: float, chunk_rows: int = DEFAULT_CHUNK_ROWS, gps=None):
+        self.path = Path(path)
+        self.fps = fps
+        self.chunk_rows = chunk_rows
+        self.gps = gps
+        self.rows_written = 0
+        self.chunks_written = 0
+        self._pending: List[DetectionBatch] = []
+        self._pending_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def write(self, frame_idx: int, frame, detections: DetectionBatch) -> None:
+        if not len(detections):
+            return
+        self._pending.append(detections)
+        self._pending_rows += len(detections)
+        if self._pending_rows >= self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        """Appends the buffered rows to the file as one chunk."""
+        if not self._pending:
+            return
+        batch = DetectionBatch.concatenate(self._pending)
+        self._pending = []
+        self._pending_rows = 0
+        fps = self.fps if self.fps and self.fps > 0 else 1.0
+        timestamp = np.where(np.isnan(batch.timestamp), batch.frame_index / fps, batch.timestamp)
+        columns = {
+            'frame_index': batch.frame_index,
+            'timestamp': timestamp.astype(np.float64),
+            'class_id': batch.class_id,
+            'score': batch.score,
+            'x1': batch.xyxy[:, 0],
+            'y1': batch.xyxy[:, 1],
+            'x2': batch.xyxy[:, 2],
+            'y2': batch.xyxy[:, 3],
+        }
+        if self.gps is not None:
+            columns['lat'], columns['lon'] = self.gps.interpolate(columns['timestamp'])
+        self._write_chunk(columns)
+        self.rows_written += len(batch)
+        self.chunks_written += 1
+
+    def close(self) -> None:
+        self.flush()
+
+    def _write_chunk(self, columns: Dict[str, np.ndarray]) -> None:
+        raise NotImplementedError
+
+class JsonlExporter(DetectionExporter):
+    """One JSON object per detection, appended line by line."""
+
+    def __init__(self, path: Path, fps: float, chunk_rows: int = DEFAULT_CHUNK_ROWS, gps=None):
+        super().__init__(path, fps, chunk_rows, gps)
+        self._file = open(self.path, 'w')
+
+    def _write_chunk(self, columns: Dict[str, np.ndarray]) -> None:
+        rows = zip(*(columns[name].tolist() for name in columns))
+        lines = []
+        for frame_index, timestamp, class_id, score, x1, y1, x2, y2, *position in rows:
+            row = {
+                'frame_index': frame_index,
+                'timestamp': round(timestamp, 4),
+                'class_id': class_id,
+                'label': CLASSES[class_id],
+                'score': round(score, 4),
+                'box': [round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1)],
+            }
+            if position:
+                row['lat'], row['lon'] = (None if v != v else round(v, 7) for v in position)
+            lines.append(json.dumps(row))
+        self._file.write('\n'.join(lines) + '\n')
+
+    def close(self) -> None:
+        super().close()
+        self._file.close()
+
+class NpzExporter(DetectionExporter):
+    """Columns appended to a single .npz archive as ``chunk_NNNNN/<column>`` arrays.
+
+    ``load_npz_detections`` concatenates the chunks back into one array per column.
+    """
+
+    def __init__(self, path: Path, fps: float, chunk_rows: int = DEFAULT_CHUNK_ROWS, gps=None):
+        super().__init__(path, fps, chunk_rows, gps)
+        self._zip = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+        self._write_array('classes', np.array(CLASSES))
+        self._write_array('fps', np.array(fps, dtype=np.float64))
+
+    def _write_chunk(self, columns: Dict[str, np.ndarray]) -> None:
+        for name, values in columns.items():
+            self._write_array(f"chunk_{self.chunks_written:05d}/{name}", values)
+
+    def _write_array(self, name: str, values: np.ndarray) -> None:
+        with self._zip.open(f"{name}.npy", 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.ascontiguousarray(values), allow_pickle=False)
+
+    def close(self) -> None:
+        super().close()
+        self._zip.close()
+
+class ParquetExporter(DetectionExporter):
+    """Columns appended to a Parquet file, one row group per chunk (requires pyarrow)."""
+
+    def __init__(self, path: Path, fps: float, chunk_rows: int = DEFAULT_CHUNK_ROWS, gps=None):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export requires pyarrow: pip install pyarrow") from e
+        super().__init__(path, fps, chunk_rows, gps)
+        self._pa = pa
+        fields = [
+            ('frame_index', pa.int64()),
+            ('timestamp', pa.float64()),
+            ('class_id', pa.int32()),
+            ('score', pa.float32()),
+            ('x1', pa.float32()),
+            ('y1', pa.float32()),
+            ('x2', pa.float32()),
+            ('y2', pa.float32()),
+        ]
+        if gps is not None:
+            fields += [('lat', pa.float64()), ('lon', pa.float64())]
+        self._schema = pa.schema(
+            fields,
+            metadata={'classes': json.dumps(CLASSES), 'fps': str(fps)},
+        )
+        self._writer = pq.ParquetWriter(str(self.path), self._schema)
+
+    def _write_chunk(self, columns: Dict[str, np.ndarray]) -> None:
+        table = self._pa.Table.from_arrays([self._pa.array(columns[name]) for name in self._schema.names], schema=self._schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        super().close()
+        self._writer.close()
+
+_EXPORTERS = {
+    'jsonl': JsonlExporter,
+    'npz': NpzExporter,
+    'parquet': ParquetExporter,
+}
+
+def open_exporter(path: Path, fps: float, export_format: str = None, chunk_rows: int = DEFAULT_CHUNK_ROWS,
+                  gps=None) -> DetectionExporter:
+    """Creates an exporter for ``export_format``, or for the file extension of ``path``."""
+    export_format = export_format or Path(path).suffix.lstrip('.').lower()
+    if export_format not in _EXPORTERS:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return _EXPORTERS[export_format](path, fps, chunk_rows, gps)
+
+def load_npz_detections(path: Path) -> Dict[str, np.ndarray]:
+    """Reads an ``NpzExporter`` file back into one concatenated array per column."""
+    with np.load(path) as archive:
+        chunks = sorted({name.split('/')[0] for name in archive.files if name.startswith('chunk_')})
+        columns = {}
+        names = ['frame_index', 'timestamp', 'class_id', 'score', 'x1', 'y1', 'x2', 'y2']
+        if chunks and f"{chunks[0]}/lat" in archive.files:
+            names += ['lat', 'lon']
+        for name in names:
+            parts = [archive[f"{chunk}/{name}"] for chunk in chunks]
+            columns[name] = np.concatenate(parts) if parts else np.empty(0)
+        return columns
@@ -0,0 +1,450 @@
+"""GPS sidecars, geo-tagged detections and a spatial index of defects across surveys.
+
+A dashcam video's GPS track (GPX, or CSV with time/lat/lon columns) is loaded as a
+``GpsTrack`` and interpolated at each frame's timestamp. Positions are those of the
+camera, not of the defect in the image, which is close enough to find a pothole
+again on the road.
+
+``DefectIndex`` merges sightings of the same class within ``radius_m`` metres into
+one defect record, within one survey and across surveys. Records live in NumPy
+columns and are found through a grid of ``radius_m``-sized cells, so a lookup only
+checks the defects in the 3x3 cells around a point. The grid is a sorted array of
+integer cell keys, re-sorted (vectorized) after each batch of changes, and a whole
+survey is matched against it in one vectorized pass, so indexes with millions of
+defects load, query and merge without per-defect Python objects.
+
+``GeoTagger`` is a ``VideoEngine`` sink that collects one video's positioned
+detections and adds them to its own index in chunks of ``GEO_CHUNK_ROWS`` (each
+``add`` re-sorts the grid); ``merge_into_index`` then folds that survey into the
+shared index file.
+"""
+import contextlib
+import csv
+import json
+import logging
+import math
+import os
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from detection import CLASSES, DetectionBatch
+
+logger = logging.getLogger(__name__)
+
+DEFECT_INDEX_PATH = Path(os.environ.get("RDD_DEFECT_INDEX", "temp/defects.npz"))
+MERGE_RADIUS_METERS = float(os.environ.get("RDD_MERGE_RADIUS_M", "3"))
+METERS_PER_DEGREE = 111_320.0
+# Frames this far outside the GPS track still get its first/last position
+GPS_TOLERANCE_SECONDS = 2.0
+GPS_EXTENSIONS = ('.gpx', '.csv')
+# Sightings a GeoTagger buffers before adding them to its index
+GEO_CHUNK_ROWS = int(os.environ.get("RDD_GEO_CHUNK_ROWS", "50000"))
+
+_CSV_TIME = ('time', 'timestamp', 'datetime', 'seconds', 't')
+_CSV_LAT = ('lat', 'latitude')
+_CSV_LON = ('lon', 'lng', 'long', 'longitude')
+
+def _parse_time(value: str) -> float:
+    """Seconds from a number or an ISO 8601 timestamp (``Z`` suffix allowed)."""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.strip().replace('Z', '+00:00')).timestamp()
+
+class GpsTrack:
+    """Positions over time; ``seconds`` are relative to the first fix."""
+
+    def __init__(self, seconds: np.ndarray, lat: np.ndarray, lon: np.ndarray, offset: float = 0.0):
+        order = np.argsort(seconds, kind='stable')
+        self.seconds = np.asarray(seconds, np.float64)[order]
+        self.lat = np.asarray(lat, np.float64)[order]
+        self.lon = np.asarray(lon, np.float64)[order]
+        if len(self.seconds) < 1:
+            raise ValueError("GPS track has no positions")
+        self.seconds -= self.seconds[0]
+        self.offset = offset  # seconds into the track at which the video starts
+
+    @classmethod
+    def from_gpx(cls, path: Path, offset: float = 0.0) -> "GpsTrack":
+        seconds, lat, lon = [], [], []
+        for _, element in ET.iterparse(str(path)):
+            if element.tag.rsplit('}', 1)[-1] not in ('trkpt', 'rtept', 'wpt'):
+                continue
+            time_element = next((child for child in element if child.tag.rsplit('}', 1)[-1] == 'time'), None)
+            if time_element is not None and time_element.text:
+                seconds.append(_parse_time(time_element.text))
+                lat.append(float(element.get('lat')))
+                lon.append(float(element.get('lon')))
+            element.clear()
+        if not seconds:
+            raise ValueError(f"No timestamped track points in {path}")
+        return cls(np.array(seconds), np.array(lat), np.array(lon), offset)
+
+    @classmethod
+    def from_csv(cls, path: Path, offset: float = 0.0) -> "GpsTrack":
+        with open(path, newline='') as f:
+            reader = csv.DictReader(f)
+            fields = {name.strip().lower(): name for name in reader.fieldnames or []}
+            try:
+                time_field, lat_field, lon_field = (next(fields[name] for name in names if name in fields)
+                                                    for names in (_CSV_TIME, _CSV_LAT, _CSV_LON))
+            except StopIteration:
+                raise ValueError(f"{path} needs time, lat and lon columns, found {reader.fieldnames}") from None
+            rows = [(_parse_time(row[time_field]), float(row[lat_field]), float(row[lon_field]))
+                    for row in reader if row[time_field] and row[lat_field] and row[lon_field]]
+        if not rows:
+            raise ValueError(f"No positions in {path}")
+        seconds, lat, lon = map(np.array, zip(*rows))
+        return cls(seconds, lat, lon, offset)
+
+    @classmethod
+    def load(cls, path: Path, offset: float = 0.0) -> "GpsTrack":
+        suffix = Path(path).suffix.lower()
+        if suffix == '.gpx':
+            return cls.from_gpx(path, offset)
+        if suffix == '.csv':
+            return cls.from_csv(path, offset)
+        raise ValueError(f"Unsupported GPS sidecar: {path} (expected .gpx or .csv)")
+
+    def interpolate(self, video_seconds) -> Tuple[np.ndarray, np.ndarray]:
+        """Latitude and longitude at video times; NaN where the track does not cover them."""
+        t = np.atleast_1d(np.asarray(video_seconds, np.float64)) + self.offset
+        lat = np.interp(t, self.seconds, self.lat)
+        lon = np.interp(t, self.seconds, self.lon)
+        outside = (t < self.seconds[0] - GPS_TOLERANCE_SECONDS) | (t > self.seconds[-1] + GPS_TOLERANCE_SECONDS)
+        lat[outside] = np.nan
+        lon[outside] = np.nan
+        return lat, lon
+
+def find_sidecar(video_path: Path) -> Optional[Path]:
+    """``<video>.gpx``/``.csv`` or ``<video stem>.gpx``/``.csv`` next to a video, if present."""
+    video_path = Path(video_path)
+    for extension in GPS_EXTENSIONS:
+        for candidate in (video_path.with_name(video_path.name + extension), video_path.with_suffix(extension)):
+            if candidate.is_file():
+                return candidate
+    return None
+
+class DefectRecord(NamedTuple):
+    defect_id: int
+    class_id: int
+    label: str
+    lat: float
+    lon: float
+    sightings: int
+    surveys: int
+    best_score: float
+    first_survey: str
+    last_survey: str
+
+    def to_feature(self) -> dict:
+        """GeoJSON point feature."""
+        properties = self._asdict()
+        lat, lon = properties.pop('lat'), properties.pop('lon')
+        properties['best_score'] = round(self.best_score, 4)
+        return {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [round(lon, 7), round(lat, 7)]},
+                'properties': properties}
+
+_COLUMNS = {
+    'lat': np.float64, 'lon': np.float64, 'class_id': np.int32, 'sightings': np.int64,
+    'surveys': np.int32, 'best_score': np.float32, 'first_survey': np.int32, 'last_survey': np.int32,
+}
+_ROW_OFFSET = 1 << 24
+_COL_OFFSET = 1 << 25
+
+class DefectIndex:
+    """Defect records on a grid of ``radius_m`` cells; see the module docstring."""
+
+    def __init__(self, radius_m: float = MERGE_RADIUS_METERS):
+        if radius_m < 1:
+            raise ValueError("radius_m must be at least 1 metre")
+        self.radius_m = radius_m
+        self._cell_degrees = radius_m / METERS_PER_DEGREE
+        self.surveys: List[str] = []
+        self._survey_ids: Dict[str, int] = {}
+        self._size = 0
+        self._columns = {name: np.empty(0, dtype) for name, dtype in _COLUMNS.items()}
+        self._keys = np.empty(0, np.int64)      # sorted cell keys ...
+        self._key_ids = np.empty(0, np.int64)   # ... and the defect in each
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def column(self, name: str) -> np.ndarray:
+        return self._columns[name][:self._size]
+
+    def _cell_keys(self, lat: np.ndarray, lon: np.ndarray, class_id: np.ndarray, row_shift: int = 0) -> np.ndarray:
+        """Cell keys of points (optionally of the cell ``row_shift`` rows above/below)."""
+        row = np.floor(lat / self._cell_degrees).astype(np.int64) + row_shift
+        # Columns are narrower in degrees away from the equator, to stay ~radius_m wide
+        row_lat = np.clip((row + 0.5) * self._cell_degrees, -89.9, 89.9)
+        col = np.floor(lon * np.cos(np.radians(row_lat)) / self._cell_degrees).astype(np.int64)
+        return (np.asarray(class_id, np.int64) << 51) | ((row + _ROW_OFFSET) << 26) | (col + _COL_OFFSET)
+
+    def _index(self) -> None:
+        """Re-sorts the cell keys after defects were added or moved."""
+        if not self._dirty:
+            return
+        keys = self._cell_keys(self.column('lat'), self.column('lon'), self.column('class_id'))
+        order = np.argsort(keys, kind='stable')
+        self._keys, self._key_ids = keys[order], order.astype(np.int64)
+        self._dirty = False
+
+    def _pairs(self, lat: np.ndarray, lon: np.ndarray, class_id: np.ndarray, reach: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """(point, defect) pairs for every defect in the cells within ``reach`` of each point."""
+        spans = [self._cell_keys(lat, lon, class_id, shift) for shift in range(-reach, reach + 1)]
+        keys = np.stack(spans, axis=1)
+        # Neighbouring columns of a row have consecutive keys
+        start = np.searchsorted(self._keys, keys - reach, 'left').ravel()
+        counts = np.searchsorted(self._keys, keys + reach, 'right').ravel() - start
+        points = np.repeat(np.repeat(np.arange(len(lat)), keys.shape[1]), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return points, self._key_ids[np.repeat(start, counts) + offsets]
+
+    def nearest(self, lat, lon, class_id) -> np.ndarray:
+        """Per point, the closest defect of the same class within ``radius_m``, or -1."""
+        self._index()
+        lat, lon = np.asarray(lat, np.float64), np.asarray(lon, np.float64)
+        matches = np.full(len(lat), -1, np.int64)
+        points, defects = self._pairs(lat, lon, np.asarray(class_id, np.int64))
+        distances = _distance_m(lat[points], lon[points], self._columns['lat'][defects], self._columns['lon'][defects])
+        close = distances <= self.radius_m
+        points, defects, distances = points[close], defects[close], distances[close]
+        order = np.lexsort((distances, points))
+        first = np.unique(points[order], return_index=True)[1]
+        matches[points[order][first]] = defects[order][first]
+        return matches
+
+    def query(self, lat: float, lon: float, radius_m: Optional[float] = None) -> np.ndarray:
+        """Ids of all defects (any class) within ``radius_m`` (default: the merge radius) of a point."""
+        self._index()
+        radius_m = radius_m or self.radius_m
+        classes = np.arange(len(CLASSES))
+        _, defects = self._pairs(np.full(len(classes), lat), np.full(len(classes), lon), classes,
+                                 reach=math.ceil(radius_m / self.radius_m))
+        defects = np.unique(defects)
+        distances = _distance_m(lat, lon, self._columns['lat'][defects], self._columns['lon'][defects])
+        return defects[distances <= radius_m]
+
+    def _grow(self, size: int) -> None:
+        capacity = len(self._columns['lat'])
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        for name, values in self._columns.items():
+            grown = np.empty(capacity, values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._columns[name] = grown
+
+    def _survey_id(self, survey: str) -> int:
+        if survey not in self._survey_ids:
+            self._survey_ids[survey] = len(self.surveys)
+            self.surveys.append(survey)
+        return self._survey_ids[survey]
+
+    def add(self, survey: str, lat, lon, class_id, score, sightings=None) -> np.ndarray:
+        """Adds sightings (arrays, one per detection) and returns the defect id of each.
+
+        A sighting within ``radius_m`` of a defect of the same class is merged into it
+        (the position becomes the sighting-weighted mean); otherwise it starts a new
+        defect. Rows with a NaN position are skipped and get id -1.
+        """
+        lat, lon = np.asarray(lat, np.float64), np.asarray(lon, np.float64)
+        class_id, score = np.asarray(class_id, np.int64), np.asarray(score, np.float64)
+        sightings = np.ones(len(lat), np.int64) if sightings is None else np.asarray(sightings, np.int64)
+        survey_id = self._survey_id(survey)
+        ids = np.full(len(lat), -1, np.int64)
+        valid = np.flatnonzero(~(np.isnan(lat) | np.isnan(lon)))
+        ids[valid] = self.nearest(lat[valid], lon[valid], class_id[valid])
+
+        # Sightings of known defects, merged in one vectorized update
+        matched = valid[ids[valid] >= 0]
+        if len(matched):
+            self._merge_rows(ids[matched], lat[matched], lon[matched], score[matched], sightings[matched], survey_id)
+
+        # The rest start new defects, unless an earlier row of this batch already did nearby
+        new = valid[ids[valid] < 0]
+        if len(new):
+            c = self._columns
+            self._grow(self._size + len(new))
+            cells: Dict[int, List[int]] = {}
+            neighbours = np.stack([self._cell_keys(lat[new], lon[new], class_id[new], shift) + column
+                                   for shift in (-1, 0, 1) for column in (-1, 0, 1)], axis=1).tolist()
+            own_cells = self._cell_keys(lat[new], lon[new], class_id[new]).tolist()
+            for i, row, keys, own_cell in zip(range(len(new)), new.tolist(), neighbours, own_cells):
+                candidates = [defect for key in keys for defect in cells.get(key, ())]
+                if candidates:
+                    distances = _distance_m(lat[row], lon[row], c['lat'][candidates], c['lon'][candidates])
+                    best = int(np.argmin(distances))
+                    if distances[best] <= self.radius_m:
+                        ids[row] = candidates[best]
+                        self._merge_rows(ids[row:row + 1], lat[row:row + 1], lon[row:row + 1], score[row:row + 1],
+                                         sightings[row:row + 1], survey_id)
+                        continue
+                defect = ids[row] = self._size
+                self._size += 1
+                for name, value in (('lat', lat[row]), ('lon', lon[row]), ('class_id', class_id[row]),
+                                    ('sightings', sightings[row]), ('surveys', 1), ('best_score', score[row]),
+                                    ('first_survey', survey_id), ('last_survey', survey_id)):
+                    c[name][defect] = value
+                cells.setdefault(own_cell, []).append(defect)
+        self._dirty = True
+        return ids
+
+    def _merge_rows(self, defects: np.ndarray, lat: np.ndarray, lon: np.ndarray, score: np.ndarray,
+                    sightings: np.ndarray, survey_id: int) -> None:
+        c = self._columns
+        unique = np.unique(defects)
+        weights = c['sightings'][unique].astype(np.float64)
+        lat_sum = np.zeros(len(unique))
+        lon_sum = np.zeros(len(unique))
+        added = np.zeros(len(unique), np.int64)
+        slots = np.searchsorted(unique, defects)
+        np.add.at(lat_sum, slots, lat * sightings)
+        np.add.at(lon_sum, slots, lon * sightings)
+        np.add.at(added, slots, sightings)
+        c['lat'][unique] = (c['lat'][unique] * weights + lat_sum) / (weights + added)
+        c['lon'][unique] = (c['lon'][unique] * weights + lon_sum) / (weights + added)
+        c['sightings'][unique] += added
+        np.maximum.at(c['best_score'], defects, score.astype(np.float32))
+        new_survey = unique[c['last_survey'][unique] != survey_id]
+        c['surveys'][new_survey] += 1
+        c['last_survey'][new_survey] = survey_id
+
+    def merge(self, other: "DefectIndex") -> np.ndarray:
+        """Folds every defect of ``other`` in, weighted by its sightings, per source survey."""
+        ids = np.full(len(other), -1, np.int64)
+        last_survey = other.column('last_survey')
+        for survey_id, survey in enumerate(other.surveys):
+            rows = np.flatnonzero(last_survey == survey_id)
+            if len(rows):
+                ids[rows] = self.add(survey, other.column('lat')[rows], other.column('lon')[rows],
+                                     other.column('class_id')[rows], other.column('best_score')[rows],
+                                     other.column('sightings')[rows])
+        return ids
+
+    def records(self) -> Iterator[DefectRecord]:
+        c = {name: self.column(name).tolist() for name in _COLUMNS}
+        for i in range(self._size):
+            yield DefectRecord(i, c['class_id'][i], CLASSES[c['class_id'][i]], c['lat'][i], c['lon'][i], c['sightings'][i],
+                               c['surveys'][i], c['best_score'][i], self.surveys[c['first_survey'][i]],
+                               self.surveys[c['last_survey'][i]])
+
+    def write_geojson(self, path: Path) -> Path:
+        """Writes every defect as a GeoJSON point feature, one record at a time."""
+        temp_path = Path(path).with_name(Path(path).name + '.tmp')
+        with open(temp_path, 'w') as f:
+            f.write('{"type": "FeatureCollection", "features": [')
+            for i, record in enumerate(self.records()):
+                f.write((',\n' if i else '\n') + json.dumps(record.to_feature()))
+            f.write('\n]}\n')
+        os.replace(temp_path, path)
+        return Path(path)
+
+    def save(self, path: Path) -> None:
+        temp_path = Path(path).with_name(Path(path).name + '.tmp')
+        with open(temp_path, 'wb') as f:
+            np.savez(f, radius_m=np.array(self.radius_m), survey_names=np.array(self.surveys, dtype=str),
+                     **{name: self.column(name) for name in _COLUMNS})
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "DefectIndex":
+        with np.load(path) as archive:
+            index = cls(float(archive['radius_m']))
+            index.surveys = archive['survey_names'].tolist()
+            index._columns = {name: archive[name].astype(dtype, copy=False) for name, dtype in _COLUMNS.items()}
+        index._survey_ids = {survey: i for i, survey in enumerate(index.surveys)}
+        index._size = len(index._columns['lat'])
+        index._dirty = True
+        return index
+
+def _distance_m(lat, lon, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Equirectangular distance in metres (accurate at merge-radius scales)."""
+    dx = (lons - lon) * np.cos(np.radians((lats + lat) / 2))
+    return np.hypot(dx, lats - lat) * METERS_PER_DEGREE
+
+class GeoTagger:
+    """``VideoEngine`` sink that positions each frame's detections and merges them into ``index``.
+
+    Sightings are buffered and added in chunks; call ``close`` before reading ``index``.
+    """
+
+    def __init__(self, track: GpsTrack, fps: float, survey: str, radius_m: float = MERGE_RADIUS_METERS,
+                 chunk_rows: int = GEO_CHUNK_ROWS):
+        self.track = track
+        self.fps = fps if fps and fps > 0 else 1.0
+        self.survey = survey
+        self.index = DefectIndex(radius_m)
+        self.chunk_rows = chunk_rows
+        self.untagged = 0  # detections in frames the GPS track does not cover
+        self._pending: List[Tuple[float, float, np.ndarray, np.ndarray]] = []
+        self._pending_rows = 0
+
+    def write(self, frame_idx: int, frame, detections: DetectionBatch) -> None:
+        if not len(detections):
+            return
+        # The decoder timestamp, like the exported rows; frame_index / fps only without one
+        timestamp = detections.timestamp[0]
+        (lat,), (lon,) = self.track.interpolate(frame_idx / self.fps if np.isnan(timestamp) else timestamp)
+        if np.isnan(lat):
+            self.untagged += len(detections)
+            return
+        self._pending.append((lat, lon, detections.class_id, detections.score))
+        self._pending_rows += len(detections)
+        if self._pending_rows >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        lat, lon, class_id, score = zip(*self._pending)
+        counts = [len(c) for c in class_id]
+        self.index.add(self.survey, np.repeat(lat, counts), np.repeat(lon, counts),
+                       np.concatenate(class_id), np.concatenate(score))
+        self._pending, self._pending_rows = [], 0
+
+    def close(self) -> DefectIndex:
+        """Adds the buffered sightings and returns the survey's index."""
+        self._flush()
+        return self.index
+
+@contextlib.contextmanager
+def _locked(path: Path):
+    """Exclusive lock on ``path`` between processes (a no-op where fcntl is unavailable)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(path.name + '.lock'), 'w') as lock_file:
+        try:
+            import fcntl
+        except ImportError:
+            fcntl = None
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def merge_into_index(survey_index: DefectIndex, path: Path = DEFECT_INDEX_PATH) -> Tuple[int, int]:
+    """Merges one survey into the shared index file; returns (defects matched, defects added).
+
+    Surveys already in the shared index are skipped, so reprocessing a video does not
+    count its sightings twice.
+    """
+    path = Path(path)
+    with _locked(path):
+        index = DefectIndex.load(path) if path.exists() else DefectIndex(survey_index.radius_m)
+        if all(survey in index._survey_ids for survey in survey_index.surveys):
+            logger.info("Surveys %s are already in %s", survey_index.surveys, path)
+            return 0, 0
+        before = len(index)
+        ids = index.merge(survey_index)
+        added = len(index) - before
+        index.save(path)
+    return int(np.count_nonzero(ids[ids >= 0] < before)), added
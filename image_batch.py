@@ -0,0 +1,206 @@
+"""Batched detection over many uploaded images (files or zip archives).
+
+Images are read one at a time, decoded on a thread pool and sent to the model in
+batches, with at most ``2 * batch_size`` decoded images alive at once. Only the raw
+detections are kept per image; thumbnails and annotated copies are rendered again
+from the source bytes when they are needed, so memory stays bounded however many
+images are uploaded.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+from PIL import ExifTags, Image, ImageOps
+
+from detection import CLASSES, DetectionBatch, draw_detections
+from metrics import get_metrics
+from preprocess import Letterbox
+from result_cache import ResultCache, cache_key
+from tiling import TileConfig, sliced_predict
+from upload_store import MAX_ARTIFACT_AGE
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+THUMBNAIL_SIZE = 320
+# Download bundles are written here, one directory per session
+BUNDLE_DIR = Path(os.environ.get("RDD_BUNDLE_DIR", "temp/bundles"))
+
+class ImageSource(NamedTuple):
+    name: str
+    read: Callable[[], bytes]
+
+class ImageResult(NamedTuple):
+    name: str
+    digest: str
+    detections: DetectionBatch  # raw, at the confidence the batch was run with
+
+def expand_uploads(files) -> List[ImageSource]:
+    """One source per uploaded image and per image inside uploaded zip archives."""
+    sources = []
+    for file in files:
+        if file.name.lower().endswith('.zip'):
+            archive = zipfile.ZipFile(file)
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.startswith('__MACOSX/') or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                sources.append(ImageSource(f"{file.name}/{info.filename}", partial(archive.read, info)))
+        elif file.name.lower().endswith(IMAGE_EXTENSIONS):
+            sources.append(ImageSource(file.name, file.getvalue))
+    return sources
+
+# EXIF orientations (5-8) that turn the stored image by 90 degrees
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def _decode(data: bytes) -> Optional[np.ndarray]:
+    # Applies the EXIF orientation, like ``open_image``
+    return cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+
+def open_image(file) -> Image.Image:
+    """Opens an image upright, with its EXIF orientation applied as ``cv2.imdecode`` does.
+
+    Every path that detects or draws on an image must see the same orientation, or boxes
+    (and cached detections, which are shared between paths) end up rotated.
+    """
+    return ImageOps.exif_transpose(Image.open(file))
+
+def detect_images(model, sources: List[ImageSource], conf: float, batch_size: int = 8, workers: int = 4,
+                  tiling: Optional[TileConfig] = None, cache: Optional[ResultCache] = None,
+                  model_digest: str = "", cache_settings: Optional[dict] = None,
+                  on_progress: Optional[Callable[[int, int], None]] = None) -> List[ImageResult]:
+    """Detects damage in every source, ``batch_size`` images per predict call.
+
+    With a ``cache`` each image's detections are looked up by content hash first. Images
+    that cannot be decoded get an empty result.
+    """
+    metrics = get_metrics()
+    letterbox = Letterbox(slots=batch_size)
+    results: List[Optional[ImageResult]] = [None] * len(sources)
+    pending = deque()
+    done = [0]
+
+    def _finish(index: int, result: ImageResult) -> None:
+        results[index] = result
+        done[0] += 1
+        if on_progress:
+            on_progress(done[0], len(sources))
+
+    def _flush(count: int) -> None:
+        batch = [pending.popleft() for _ in range(min(count, len(pending)))]
+        decoded = []
+        for index, name, digest, key, future in batch:
+            image = future.result()
+            if image is None:
+                _finish(index, ImageResult(name, digest, DetectionBatch.empty()))
+            else:
+                decoded.append((index, name, digest, key, image))
+        if not decoded:
+            return
+        with metrics.timer("image.batch_inference", count=len(decoded)):
+            if tiling is not None:
+                batches = [sliced_predict(model, image, conf, tiling)[0] for *_, image in decoded]
+            else:
+                inputs, infos = zip(*(letterbox(image) for *_, image in decoded))
+                predictions = model.predict(list(inputs), conf=conf, verbose=False)
+                batches = [DetectionBatch.from_result(result, letterbox_info=info) for result, info in zip(predictions, infos)]
+        for (index, name, digest, key, _), detections in zip(decoded, batches):
+            if cache is not None:
+                cache.put(key, detections)
+            _finish(index, ImageResult(name, digest, detections))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="image-decode") as pool:
+        for index, source in enumerate(sources):
+            # Archives are read sequentially here; only decoding runs on the pool
+            data = source.read()
+            digest = hashlib.sha256(data).hexdigest()
+            key = cache_key(digest, model_digest, cache_settings) if cache is not None else None
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                _finish(index, ImageResult(source.name, digest, cached))
+                continue
+            pending.append((index, source.name, digest, key, pool.submit(_decode, data)))
+            if len(pending) >= 2 * batch_size:
+                _flush(batch_size)
+        while pending:
+            _flush(batch_size)
+    return results
+
+def class_summary(results: List[ImageResult], threshold: float) -> List[Dict]:
+    """Detections, affected images and mean score per class above ``threshold``."""
+    counts = np.zeros(len(CLASSES), dtype=int)
+    images = np.zeros(len(CLASSES), dtype=int)
+    score_sums = np.zeros(len(CLASSES))
+    for result in results:
+        detections = result.detections.filter(min_score=threshold)
+        counts += np.bincount(detections.class_id, minlength=len(CLASSES))
+        images += np.bincount(np.unique(detections.class_id), minlength=len(CLASSES))
+        score_sums += np.bincount(detections.class_id, weights=detections.score, minlength=len(CLASSES))
+    return [
+        {'class': label, 'detections': int(counts[i]), 'images': int(images[i]),
+         'mean score': round(float(score_sums[i] / counts[i]), 3) if counts[i] else 0.0}
+        for i, label in enumerate(CLASSES)
+    ]
+
+def render_thumbnail(data: bytes, detections: DetectionBatch, size: int = THUMBNAIL_SIZE) -> np.ndarray:
+    """Upright RGB thumbnail with boxes; JPEGs are decoded at reduced scale directly."""
+    image = Image.open(io.BytesIO(data))
+    width, height = image.size
+    if image.getexif().get(ExifTags.Base.Orientation) in _TRANSPOSED_ORIENTATIONS:
+        width, height = height, width
+    image.draft('RGB', (size, size))
+    image = ImageOps.exif_transpose(image.convert('RGB'))
+    image.thumbnail((size, size))
+    scale = image.size[0] / width
+    thumbnail = np.array(image)
+    scaled = DetectionBatch(detections.class_id, detections.score, detections.xyxy * scale, detections.frame_index)
+    return draw_detections(thumbnail, scaled, rgb=True)
+
+def write_bundle(path: Path, sources: List[ImageSource], results: List[ImageResult], threshold: float,
+                 on_progress: Optional[Callable[[int, int], None]] = None) -> Path:
+    """Zip of annotated JPEGs plus detections.json and detections.csv, built one image at a time."""
+    records = []
+    with zipfile.ZipFile(path, 'w') as bundle:
+        for i, (source, result) in enumerate(zip(sources, results), start=1):
+            detections = result.detections.filter(min_score=threshold)
+            image = _decode(source.read())
+            if image is not None:
+                ok, encoded = cv2.imencode('.jpg', draw_detections(image, detections), [cv2.IMWRITE_JPEG_QUALITY, 90])
+                if ok:
+                    bundle.writestr(f"annotated/{Path(source.name).with_suffix('.jpg')}", encoded.tobytes())
+            records.append({'image': source.name, 'detections': detections.to_records()})
+            if on_progress:
+                on_progress(i, len(sources))
+
+        bundle.writestr('detections.json', json.dumps(records))
+        rows = io.StringIO()
+        writer = csv.writer(rows)
+        writer.writerow(['image', 'class_id', 'label', 'score', 'x1', 'y1', 'x2', 'y2'])
+        for record in records:
+            for detection in record['detections']:
+                writer.writerow([record['image'], detection['class_id'], detection['label'], detection['score'], *detection['box']])
+        bundle.writestr('detections.csv', rows.getvalue())
+    return path
+
+def evict_bundles(bundle_dir: Path = BUNDLE_DIR, max_age: float = MAX_ARTIFACT_AGE) -> int:
+    """Removes session bundle directories not written to for ``max_age`` seconds."""
+    if not bundle_dir.is_dir():
+        return 0
+    removed = 0
+    for path in bundle_dir.iterdir():
+        try:
+            if path.is_dir() and time.time() - path.stat().st_mtime > max_age:
+                shutil.rmtree(path)
+                removed += 1
+        except FileNotFoundError:
+            continue
+    return removed
@@ -0,0 +1,37 @@
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from detection import DetectionBatch
+from metrics import get_metrics
+from preprocess import Letterbox
+from tiling import TileConfig, TileTimings, sliced_predict
+
+def predict_image(model, image: np.ndarray, threshold: float, tiling: Optional[TileConfig] = None,
+                  letterbox: Optional[Letterbox] = None, rgb: bool = False) -> Tuple[DetectionBatch, Optional[TileTimings]]:
+    """Detects damage in one image, returning boxes in the image's own pixel coordinates.
+
+    Images are BGR unless ``rgb`` is set (the models expect BGR, so RGB input is swapped
+    after letterboxing, at model resolution). With ``tiling`` the image is predicted as
+    overlapping full-resolution tiles and the tile timings are returned as well.
+    """
+    metrics = get_metrics()
+    if tiling is not None:
+        bgr_image = image
+        if rgb:
+            with metrics.timer("image.color_convert"):
+                bgr_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        with metrics.timer("image.sliced_inference"):
+            return sliced_predict(model, bgr_image, threshold, tiling, letterbox=letterbox)
+
+    letterbox = letterbox or Letterbox()
+    with metrics.timer("image.preprocess"):
+        model_input, letterbox_info = letterbox(image)
+    if rgb:
+        with metrics.timer("image.color_convert"):
+            cv2.cvtColor(model_input, cv2.COLOR_RGB2BGR, dst=model_input)
+    with metrics.timer("image.inference"):
+        results = model.predict(model_input, conf=threshold, verbose=False)
+    with metrics.timer("image.postprocess"):
+        return DetectionBatch.from_result(results[0], letterbox_info=letterbox_info), None
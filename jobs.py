@@ -0,0 +1,454 @@
+"""Background video jobs: a SQLite job store and a worker process pool.
+
+The Streamlit pages submit video jobs and poll their state instead of processing in
+the script thread, so a long video no longer blocks the session and keeps running
+when the tab is closed or reloaded. Jobs are persisted in ``temp/jobs.sqlite3``
+(``RDD_JOBS_DB``); at most ``RDD_MAX_JOBS`` run at once, each in a pooled worker
+process that keeps its models loaded between jobs.
+
+Scheduling is fair across sessions: the next job comes from the session with the
+fewest running jobs, then the one served least recently, then the oldest job.
+A single app process is expected to own the job database; on start it requeues
+jobs whose worker is gone.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from metrics import get_metrics
+from result_cache import FLOOR_CONFIDENCE, cache_key, get_result_cache
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR = Path(os.environ.get("RDD_JOBS_DIR", "temp/jobs"))
+JOBS_DB = Path(os.environ.get("RDD_JOBS_DB", "temp/jobs.sqlite3"))
+MAX_CONCURRENT_JOBS = int(os.environ.get("RDD_MAX_JOBS", str(max(1, (os.cpu_count() or 2) // 4))))
+
+# How often workers write progress, and the dispatcher checks for work
+PROGRESS_INTERVAL = 0.5
+POLL_INTERVAL = 1.0
+
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    input_path TEXT NOT NULL,
+    output_path TEXT NOT NULL,
+    export_path TEXT,
+    settings TEXT NOT NULL,
+    frames_done INTEGER NOT NULL DEFAULT 0,
+    frame_count INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+"""
+
+class JobCancelled(Exception):
+    pass
+
+class Job(NamedTuple):
+    id: str
+    session: str
+    state: str
+    created_at: float
+    started_at: Optional[float]
+    finished_at: Optional[float]
+    input_path: str
+    output_path: str
+    export_path: Optional[str]
+    settings: dict
+    frames_done: int
+    frame_count: int
+    worker_pid: Optional[int]
+    result: Optional[dict]
+    error: Optional[str]
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def progress(self) -> float:
+        if self.state == "done":
+            return 1.0
+        return min(self.frames_done / self.frame_count, 1.0) if self.frame_count > 0 else 0.0
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        values = dict(row)
+        values['settings'] = json.loads(values['settings'])
+        values['result'] = json.loads(values['result']) if values['result'] else None
+        return cls(**values)
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+def job_directory(job_id: str) -> Path:
+    """Working directory for a job's input and outputs."""
+    path = JOBS_DIR / job_id
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobStore:
+    """Job states persisted in SQLite; safe to use from several threads and processes."""
+
+    def __init__(self, path: Path = JOBS_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Autocommit mode; claim_next opens its own transaction
+        connection = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def submit(self, job_id: str, session: str, input_path: Path, output_path: Path,
+               settings: dict, export_path: Optional[Path] = None) -> Job:
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT INTO jobs (id, session, state, created_at, input_path, output_path, export_path, settings) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)",
+                (job_id, session, time.time(), str(input_path), str(output_path),
+                 str(export_path) if export_path else None, json.dumps(settings)),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def list_jobs(self, session: Optional[str] = None, limit: int = 50) -> List[Job]:
+        """Most recent jobs first, optionally only those of one session."""
+        query = "SELECT * FROM jobs" + (" WHERE session = ?" if session else "") + " ORDER BY created_at DESC LIMIT ?"
+        params = (session, limit) if session else (limit,)
+        with self._connect() as connection:
+            return [Job.from_row(row) for row in connection.execute(query, params)]
+
+    def active_jobs(self) -> List[Job]:
+        """Queued and running jobs, whose files must be kept."""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT * FROM jobs WHERE state IN ('queued', 'running')").fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    def queue_position(self, job_id: str) -> int:
+        """Number of queued jobs submitted before ``job_id``."""
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE state = 'queued' "
+                "AND created_at < (SELECT created_at FROM jobs WHERE id = ?)", (job_id,)).fetchone()
+        return row[0]
+
+    def claim_next(self) -> Optional[Job]:
+        """Marks the next job to run (fair across sessions) as running and returns it."""
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    """
+                    SELECT j.id FROM jobs j WHERE j.state = 'queued'
+                    ORDER BY
+                        (SELECT COUNT(*) FROM jobs r WHERE r.session = j.session AND r.state = 'running'),
+                        COALESCE((SELECT MAX(r.started_at) FROM jobs r WHERE r.session = j.session), 0),
+                        j.created_at
+                    LIMIT 1
+                    """
+                ).fetchone()
+                if row is None:
+                    connection.execute("COMMIT")
+                    return None
+                connection.execute("UPDATE jobs SET state = 'running', started_at = ? WHERE id = ?", (time.time(), row[0]))
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return self.get(row[0])
+
+    def set_worker(self, job_id: str, pid: int, frame_count: int) -> None:
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET worker_pid = ?, frame_count = ? WHERE id = ?", (pid, frame_count, job_id))
+
+    def update_progress(self, job_id: str, frames_done: int) -> str:
+        """Stores progress and returns the job's current state (to notice cancellation)."""
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET frames_done = ? WHERE id = ?", (frames_done, job_id))
+            return connection.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+
+    def finish(self, job_id: str, state: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        if state not in FINISHED_STATES:
+            raise ValueError(f"Not a final job state: {state}")
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET state = ?, finished_at = ?, result = ?, error = ? WHERE id = ? AND state != 'cancelled'",
+                (state, time.time(), json.dumps(result) if result is not None else None, error, job_id),
+            )
+
+    def cancel(self, job_id: str) -> None:
+        """Cancels a queued job, or asks a running one to stop at its next progress update."""
+        with self._connect() as connection:
+            connection.execute("UPDATE jobs SET state = 'cancelled', finished_at = ? WHERE id = ? AND state IN ('queued', 'running')",
+                               (time.time(), job_id))
+
+    def requeue_interrupted(self) -> int:
+        """Puts running jobs whose worker process is gone back in the queue."""
+        with self._connect() as connection:
+            rows = connection.execute("SELECT id, worker_pid FROM jobs WHERE state = 'running'").fetchall()
+            orphans = [row['id'] for row in rows if not _pid_alive(row['worker_pid'])]
+            connection.executemany(
+                "UPDATE jobs SET state = 'queued', started_at = NULL, worker_pid = NULL, frames_done = 0 WHERE id = ?",
+                [(job_id,) for job_id in orphans])
+        return len(orphans)
+
+def run_job(db_path: str, job_id: str) -> None:
+    """Processes one video job inside a worker process, recording progress and results."""
+    store = JobStore(Path(db_path))
+    job = store.get(job_id)
+    if job is None or job.state != "running":
+        return
+    # Timings of this job only; the app process merges them into its own metrics
+    get_metrics().reset()
+    try:
+        result = _run_video_job(store, job)
+        result['metrics'] = get_metrics().state()
+        store.finish(job_id, "done", result=result)
+    except JobCancelled:
+        logger.info("Job %s cancelled", job_id)
+    except Exception as e:
+        logger.exception("Job %s failed", job_id)
+        store.finish(job_id, "failed", error=str(e))
+
+def _run_video_job(store: JobStore, job: Job) -> dict:
+    import cv2
+    from export import open_exporter
+    from geo import GeoTagger, GpsTrack, merge_into_index
+    from model_pool import get_model_pool
+    from progress import ProgressReporter
+    from sampling import FrameSampler
+    from tiling import TileConfig
+    from tracker import DefectTracker
+    from video_engine import VideoEngine, probe_video
+    from video_io import VideoIOConfig
+
+    settings = job.settings
+    info = probe_video(job.input_path)
+    if info is None:
+        raise IOError(f"Cannot open video file: {job.input_path}")
+    store.set_worker(job.id, os.getpid(), info.frame_count)
+
+    # Raw detections of the same video, model and settings are replayed without inference
+    cache = get_result_cache()
+    key = _cache_key(settings) if settings.get('content_digest') else None
+    replay = cache.get(key) if key else None
+    model = None if replay is not None else get_model_pool().get(settings['model_path'], settings['backend'], settings['int8'])
+    sampler = FrameSampler(**settings['sampling'])
+    tiling = TileConfig(*settings['tiling']) if settings.get('tiling') else None
+    io = VideoIOConfig(**settings.get('io', {}))
+    # Optional GPS sidecar: positions for exported rows and geo-deduplicated defects
+    gps = GpsTrack.load(settings['gps']['path'], settings['gps'].get('offset', 0.0)) if settings.get('gps') else None
+    geotagger = GeoTagger(gps, info.fps, survey=settings.get('content_digest') or job.id) if gps is not None else None
+    exporter = open_exporter(job.export_path, info.fps, gps=gps) if job.export_path else None
+    tracker = DefectTracker(high_score=max(settings['threshold'], 0.5)) if settings.get('track') else None
+    # Live counts, FPS/ETA and a preview frame for the page, published at most once per interval
+    reporter = ProgressReporter(Path(job.output_path).parent, info.frame_count, tracker=tracker)
+    sinks = [sink for sink in (exporter, tracker, geotagger, reporter) if sink is not None]
+
+    last_update = [0.0]
+
+    def _on_progress(frames_done: int, frame_count: int) -> None:
+        now = time.monotonic()
+        if now - last_update[0] < PROGRESS_INTERVAL:
+            return
+        last_update[0] = now
+        if store.update_progress(job.id, frames_done) == "cancelled":
+            raise JobCancelled()
+
+    engine = VideoEngine(model, settings['threshold'], batch_size=settings['batch_size'],
+                         queue_depth=settings['queue_depth'], sampler=sampler, tiling=tiling, sinks=sinks,
+                         record_floor=FLOOR_CONFIDENCE if key and replay is None else None, replay=replay, io=io,
+                         render_every=settings.get('render_every', 1))
+    try:
+        stats = engine.run(Path(job.input_path), Path(job.output_path), on_progress=_on_progress,
+                           progress_interval=PROGRESS_INTERVAL)
+    finally:
+        if exporter:
+            exporter.close()
+    reporter.close()
+    store.update_progress(job.id, stats.frames)
+    if key and engine.raw_detections is not None:
+        cache.put(key, engine.raw_detections)
+
+    result = {
+        'cached': replay is not None,
+        'frames': stats.frames,
+        'frames_inferred': stats.frames_inferred,
+        'wall_seconds': stats.wall_seconds,
+        'stages': {name: {'frames': stage.frames, 'busy_seconds': stage.busy_seconds} for name, stage in stats.stages.items()},
+    }
+    if exporter:
+        result.update(rows_written=exporter.rows_written, chunks_written=exporter.chunks_written)
+    if tracker:
+        tracks = []
+        tracks_dir = Path(job.output_path).parent / "tracks"
+        tracks_dir.mkdir(parents=True, exist_ok=True)
+        for record in tracker.close():
+            entry = record.to_record()
+            if record.best_crop is not None:
+                crop_path = tracks_dir / f"track_{record.track_id:05d}.jpg"
+                cv2.imwrite(str(crop_path), record.best_crop)
+                entry['crop'] = str(crop_path)
+            tracks.append(entry)
+        result['tracks'] = tracks
+    if geotagger:
+        survey_index = geotagger.close()
+        geojson_path = survey_index.write_geojson(Path(job.output_path).parent / "defects.geojson")
+        matched, added = merge_into_index(survey_index)
+        result['geo'] = {'defects': len(survey_index), 'untagged_detections': geotagger.untagged,
+                         'geojson': str(geojson_path), 'matched_known': matched, 'added_new': added}
+    return result
+
+def _cache_key(settings: dict) -> str:
+    """Result cache key of a video job; threshold and batching do not change raw detections.
+
+    The video I/O backend is keyed because OpenCV and PyAV can decode different frames.
+    """
+    from backends import weights_hash
+    from video_io import DEFAULT_VIDEO_BACKEND
+
+    io = settings.get('io', {})
+    return cache_key(settings['content_digest'], weights_hash(settings['model_path']), {
+        'kind': 'video',
+        'backend': settings['backend'],
+        'int8': settings['int8'],
+        'sampling': settings['sampling'],
+        'io_backend': io.get('backend') or DEFAULT_VIDEO_BACKEND,
+        'decode_scale': io.get('decode_scale', 1.0),
+        'tiling': settings.get('tiling'),
+        'floor': FLOOR_CONFIDENCE,
+    })
+
+def _init_worker(threads: int) -> None:
+    """Shares the CPU between concurrently running jobs."""
+    # Metrics are reported through the job result, not served by each worker
+    os.environ.pop("RDD_METRICS_PORT", None)
+    os.environ.pop("RDD_METRICS_FILE", None)
+    import cv2
+    import torch
+
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+
+class JobQueue:
+    """Dispatches queued jobs from the store to a pool of worker processes."""
+
+    def __init__(self, store: JobStore, max_concurrent: int = MAX_CONCURRENT_JOBS):
+        self.store = store
+        self.max_concurrent = max(max_concurrent, 1)
+        self._threads_per_worker = max(1, (os.cpu_count() or 1) // self.max_concurrent)
+        self._pool = self._new_pool()
+        self._running: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        requeued = store.requeue_interrupted()
+        if requeued:
+            logger.info("Requeued %d interrupted jobs", requeued)
+        threading.Thread(target=self._dispatch, name="job-dispatcher", daemon=True).start()
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.max_concurrent, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(self._threads_per_worker,))
+
+    def submit(self, job_id: str, session: str, input_path: Path, output_path: Path,
+               settings: dict, export_path: Optional[Path] = None) -> Job:
+        job = self.store.submit(job_id, session, input_path, output_path, settings, export_path)
+        self._wake.set()
+        return job
+
+    def cancel(self, job_id: str) -> None:
+        self.store.cancel(job_id)
+
+    @property
+    def running(self) -> int:
+        with self._lock:
+            return len(self._running)
+
+    def _dispatch(self) -> None:
+        while True:
+            try:
+                while self.running < self.max_concurrent:
+                    job = self.store.claim_next()
+                    if job is None:
+                        break
+                    logger.info("Starting job %s for session %s", job.id, job.session)
+                    with self._lock:
+                        pool = self._pool
+                        future = pool.submit(run_job, str(self.store.path), job.id)
+                        self._running[job.id] = future
+                    future.add_done_callback(lambda future, job_id=job.id, pool=pool: self._on_done(job_id, future, pool))
+            except Exception:
+                logger.exception("Job dispatcher failed")
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+
+    def _on_done(self, job_id: str, future: Future, pool: ProcessPoolExecutor) -> None:
+        with self._lock:
+            self._running.pop(job_id, None)
+            error = future.exception()
+            if isinstance(error, BrokenProcessPool) and pool is self._pool:
+                # A worker died (e.g. out of memory); later jobs need a fresh pool
+                self._pool = self._new_pool()
+        if error is not None:
+            self.store.finish(job_id, "failed", error=f"Worker failed: {error}")
+        else:
+            job = self.store.get(job_id)
+            if job is not None and job.result and 'metrics' in job.result:
+                get_metrics().merge(job.result['metrics'])
+        self._wake.set()
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue shared by all Streamlit sessions."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = JobQueue(JobStore())
+    return _job_queue
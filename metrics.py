@@ -0,0 +1,265 @@
+"""Lightweight timing instrumentation for the image and video hot paths.
+
+Stages are recorded by name, ``<path>.<stage>`` (e.g. ``video.decode``), into
+histograms that keep both cumulative Prometheus-style buckets and a rolling window of
+recent samples for percentiles. Recording costs a bisect and a couple of array writes
+under a per-stage lock, so it is meant to stay on in production.
+
+Optional outputs, configured through environment variables:
+    RDD_METRICS=0            disable recording entirely
+    RDD_METRICS_PORT=9100    serve Prometheus text format on http://0.0.0.0:<port>/metrics
+    RDD_METRICS_FILE=path    periodically dump Prometheus text format to ``path``
+"""
+import bisect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("RDD_METRICS", "1") != "0"
+METRICS_PORT = int(os.environ.get("RDD_METRICS_PORT", "0"))
+METRICS_FILE = os.environ.get("RDD_METRICS_FILE")
+METRICS_DUMP_INTERVAL = float(os.environ.get("RDD_METRICS_DUMP_INTERVAL", "15"))
+
+# Samples kept per stage for rolling percentiles
+WINDOW_SIZE = 2048
+
+# Bucket upper bounds in seconds, 0.1 ms to 10 s
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class StageSummary(NamedTuple):
+    name: str
+    count: int
+    total_seconds: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+
+class Histogram:
+    """Cumulative bucket counts plus a ring buffer of the most recent samples."""
+
+    def __init__(self, name: str, window: int = WINDOW_SIZE):
+        self.name = name
+        self.bucket_counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._window = np.zeros(window, dtype=np.float64)
+        self._filled = 0
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, count: int = 1) -> None:
+        """Records ``count`` samples of ``seconds`` each (e.g. a batch's per-frame time)."""
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.bucket_counts[bucket] += count
+            self.count += count
+            self.sum += seconds * count
+            self._window[self._next] = seconds
+            self._next = (self._next + 1) % len(self._window)
+            self._filled = min(self._filled + 1, len(self._window))
+
+    def state(self) -> dict:
+        """JSON-serializable counts and recent samples, oldest first."""
+        with self._lock:
+            recent = np.roll(self._window, -self._next)[-self._filled:] if self._filled else self._window[:0]
+            return {'buckets': list(self.bucket_counts), 'count': self.count, 'sum': self.sum, 'recent': recent.tolist()}
+
+    def merge(self, state: dict) -> None:
+        """Adds the ``state()`` of a histogram recorded elsewhere (e.g. in a worker process)."""
+        recent = state['recent'][-len(self._window):]
+        with self._lock:
+            self.bucket_counts = [a + b for a, b in zip(self.bucket_counts, state['buckets'])]
+            self.count += state['count']
+            self.sum += state['sum']
+            for seconds in recent:
+                self._window[self._next] = seconds
+                self._next = (self._next + 1) % len(self._window)
+            self._filled = min(self._filled + len(recent), len(self._window))
+
+    def summary(self) -> StageSummary:
+        with self._lock:
+            recent = self._window[:self._filled].copy()
+            count, total = self.count, self.sum
+        if len(recent):
+            p50, p95, p99 = np.percentile(recent, [50, 95, 99]) * 1000
+        else:
+            p50 = p95 = p99 = 0.0
+        mean_ms = total / count * 1000 if count else 0.0
+        return StageSummary(self.name, count, total, mean_ms, float(p50), float(p95), float(p99))
+
+class _Timer:
+    """Context manager recording the time spent inside it."""
+    __slots__ = ("_histogram", "_count", "_start")
+
+    def __init__(self, histogram: Optional[Histogram], count: int):
+        self._histogram = histogram
+        self._count = count
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self._histogram is not None and self._count > 0:
+            self._histogram.observe((time.perf_counter() - self._start) / self._count, self._count)
+
+class Metrics:
+    """Registry of stage histograms.
+
+    Usage:
+        with metrics.timer("video.inference", count=len(batch)):
+            results = model.predict(batch)
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str) -> Histogram:
+        histogram = self._histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(name, Histogram(name))
+        return histogram
+
+    def observe(self, name: str, seconds: float, count: int = 1) -> None:
+        if self.enabled and count > 0:
+            self.histogram(name).observe(seconds / count, count)
+
+    def timer(self, name: str, count: int = 1) -> _Timer:
+        """Times a block; with ``count`` the time is recorded as ``count`` equal per-item samples."""
+        return _Timer(self.histogram(name) if self.enabled else None, count)
+
+    def summaries(self, prefix: str = "") -> List[StageSummary]:
+        with self._lock:
+            histograms = [h for name, h in sorted(self._histograms.items()) if name.startswith(prefix)]
+        return [histogram.summary() for histogram in histograms]
+
+    def state(self, prefix: str = "") -> Dict[str, dict]:
+        with self._lock:
+            histograms = [h for name, h in self._histograms.items() if name.startswith(prefix)]
+        return {histogram.name: histogram.state() for histogram in histograms}
+
+    def merge(self, states: Dict[str, dict]) -> None:
+        if self.enabled:
+            for name, state in states.items():
+                self.histogram(name).merge(state)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def to_prometheus(self) -> str:
+        """All histograms in the Prometheus text exposition format."""
+        lines = [
+            "# HELP rdd_stage_seconds Time spent per frame or image in each processing stage.",
+            "# TYPE rdd_stage_seconds histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        for name, histogram in histograms:
+            path, _, stage = name.rpartition(".")
+            labels = f'path="{path}",stage="{stage}"'
+            with histogram._lock:
+                bucket_counts = list(histogram.bucket_counts)
+                count, total = histogram.count, histogram.sum
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS + (float("inf"),), bucket_counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'rdd_stage_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"rdd_stage_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"rdd_stage_seconds_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Writes ``to_prometheus()`` to ``path`` atomically (node_exporter textfile format)."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+def serve_metrics(metrics: Metrics, port: int) -> ThreadingHTTPServer:
+    """Serves ``/metrics`` on ``port`` from a daemon thread."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics on port %d", port)
+    return server
+
+def _dump_periodically(metrics: Metrics, path: str, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            metrics.dump(path)
+        except OSError as e:
+            logger.warning("Failed to dump metrics to %s: %s", path, e)
+
+_metrics: Optional[Metrics] = None
+_metrics_lock = threading.Lock()
+
+def get_metrics() -> Metrics:
+    """Process-wide metrics registry; starts the configured endpoint or file dump on first use."""
+    global _metrics
+    if _metrics is None:
+        with _metrics_lock:
+            if _metrics is None:
+                metrics = Metrics(METRICS_ENABLED)
+                if METRICS_ENABLED and METRICS_PORT:
+                    try:
+                        serve_metrics(metrics, METRICS_PORT)
+                    except OSError as e:
+                        # Another process (e.g. a second Streamlit worker) may own the port
+                        logger.warning("Cannot serve metrics on port %d: %s", METRICS_PORT, e)
+                if METRICS_ENABLED and METRICS_FILE:
+                    threading.Thread(target=_dump_periodically, args=(metrics, METRICS_FILE, METRICS_DUMP_INTERVAL),
+                                     name="metrics-dump", daemon=True).start()
+                _metrics = metrics
+    return _metrics
+
+def metrics_panel(prefix: str = "") -> None:
+    """Sidebar expander with recent per-stage latency, slowest stage share first."""
+    import streamlit as st
+
+    summaries = get_metrics().summaries(prefix)
+    with st.sidebar.expander("⏱️ Stage Timings"):
+        if not summaries:
+            st.write("No timings recorded yet.")
+            return
+        total = sum(summary.total_seconds for summary in summaries) or 1.0
+        st.table([
+            {
+                "stage": summary.name,
+                "count": summary.count,
+                "share": f"{summary.total_seconds / total:.0%}",
+                "p50 ms": round(summary.p50_ms, 2),
+                "p95 ms": round(summary.p95_ms, 2),
+                "p99 ms": round(summary.p99_ms, 2),
+            }
+            for summary in sorted(summaries, key=lambda summary: summary.total_seconds, reverse=True)
+        ])
+        st.download_button("Download Prometheus metrics", get_metrics().to_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
@@ -1,10 +1,40 @@
 import os
-import boto3
-from botocore import UNSIGNED
-from botocore.client import Config
-import requests
+import json
+import time
+import hashlib
+import threading
+
+# boto3 and requests take a few hundred milliseconds to import, so they are only
+# imported when the network is actually used (not on every page load)
 
 bucket_name = "ai-for-eng"
+models_dir = "models"
+manifest_path = os.path.join(models_dir, "manifest.json")
+catalog_ttl = 6 * 60 * 60  # seconds before the manifest is refreshed in the background
+catalog_retry_ttl = 5 * 60  # seconds before a failed refresh is attempted again
+download_chunk_size = 1024 * 1024
+download_timeout = 30  # seconds without data before a download attempt is abandoned
+download_retries = 3
+s3_transfer_options = {
+    'multipart_threshold': 8 * 1024 * 1024,
+    'multipart_chunksize': 8 * 1024 * 1024,
+    'max_concurrency': 8,
+}
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+def get_s3_client():
+    """Returns a shared anonymous S3 client (boto3 clients are thread-safe)."""
+    import boto3
+    from botocore import UNSIGNED
+    from botocore.client import Config
+
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client('s3', config=Config(signature_version=UNSIGNED), region_name='ap-southeast-2')
+        return _s3_client
 
 def get_pt_files(repo_owner="anhminhnguyen3110", repo_name="Road-damaged-dectection-models", folder_path="", bucket_name=bucket_name, prefix=""):
     # Try to get .pt files from GitHub
@@ -26,6 +56,8 @@ def get_pt_files(repo_owner="anhminhnguyen3110", repo_name="Road-damaged-dectect
             return None, None
 
 def get_pt_files_from_github(repo_owner, repo_name, folder_path):
+    import requests
+
     api_url = f"https://api.github.com/repos/{repo_owner}/{repo_name}/contents/{folder_path}"
     response = requests.get(api_url)
     response.raise_for_status()
@@ -34,55 +66,310 @@ def get_pt_files_from_github(repo_owner, repo_name, folder_path):
     return pt_files
 
 def get_pt_files_from_s3(bucket_name, prefix=''):
-    s3 = boto3.client('s3', config=Config(signature_version=UNSIGNED), region_name='ap-southeast-2')
-    paginator = s3.get_paginator('list_objects_v2')
+    return [obj['Key'] for obj in get_s3_objects(bucket_name, prefix)]
+
+def get_s3_objects(bucket_name, prefix=''):
+    paginator = get_s3_client().get_paginator('list_objects_v2')
     page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-    pt_files = []
+    objects = []
     for page in page_iterator:
         if 'Contents' in page:
-            pt_files.extend([obj['Key'] for obj in page['Contents'] if obj['Key'].endswith('.pt')])
-    return pt_files
+            objects.extend([obj for obj in page['Contents'] if obj['Key'].endswith('.pt')])
+    return objects
+
+def fetch_model_entries(repo_owner="anhminhnguyen3110", repo_name="Road-damaged-dectection-models", folder_path="", bucket_name=bucket_name, prefix=""):
+    """Lists models remotely (GitHub first, then S3) as catalog entries."""
+    fetched_at = time.time()
+    try:
+        files = get_pt_files_from_github(repo_owner, repo_name, folder_path)
+        return [{
+            'name': file['name'],
+            'key': file['path'],
+            'size': file.get('size'),
+            'sha': file.get('sha'),
+            'etag': None,
+            'download_url': file.get('download_url'),
+            'source': 'github',
+            'fetched_at': fetched_at,
+        } for file in files]
+    except Exception as e:
+        print(f"An error occurred while accessing GitHub: {e}")
+    try:
+        objects = get_s3_objects(bucket_name, prefix)
+        return [{
+            'name': os.path.basename(obj['Key']),
+            'key': obj['Key'],
+            'size': obj.get('Size'),
+            'sha': None,
+            'etag': obj.get('ETag', '').strip('"') or None,
+            'download_url': None,
+            'source': 's3',
+            'fetched_at': fetched_at,
+        } for obj in objects]
+    except Exception as e:
+        print(f"An error occurred while accessing S3: {e}")
+    return None
+
+class ModelCatalog:
+    """Model listing served from an on-disk manifest.
+
+    Listings are answered from ``manifest.json`` plus whatever ``.pt`` files are already in
+    the models directory, so reruns never touch the network. Once the manifest is older
+    than ``ttl`` seconds it is refreshed from GitHub/S3 on a background thread. After a
+    failed refresh the next attempt waits ``retry_ttl`` seconds, so an unreachable or
+    rate-limiting remote is not hit again on every rerun.
+    """
+
+    def __init__(self, manifest_path=manifest_path, models_dir=models_dir, ttl=catalog_ttl, retry_ttl=catalog_retry_ttl):
+        self.manifest_path = manifest_path
+        self.models_dir = models_dir
+        self.ttl = ttl
+        self.retry_ttl = retry_ttl
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+        self._fetched_at = 0.0
+        self._failed_at = 0.0
+        self._entries = {}
+        self._load_manifest()
+
+    def list_models(self, wait=True):
+        """Returns catalog entries sorted by name, refreshing in the background when stale.
+
+        With nothing to serve yet (no manifest and no local models) the first listing
+        has to come from the network: it is fetched in place, or with ``wait=False``
+        started in the background and an empty list returned (see ``wait_for_refresh``).
+        No attempt is made within ``retry_ttl`` seconds of a failed one.
+        """
+        with self._lock:
+            has_remote = bool(self._entries)
+        # After a failed attempt, serve what is known until the retry delay has passed
+        if not self._backing_off():
+            if not has_remote and not self._local_files():
+                if wait:
+                    self.refresh()
+                else:
+                    self.refresh_async()
+            elif self.is_stale():
+                self.refresh_async()
+        with self._lock:
+            entries = dict(self._entries)
+        for name, entry in self._local_entries().items():
+            entries.setdefault(name, entry)
+        return [entries[name] for name in sorted(entries)]
+
+    def get(self, name):
+        """Returns the entry for a model file name, or None if it is unknown."""
+        return next((entry for entry in self.list_models() if entry['name'] == name), None)
+
+    def is_stale(self):
+        return time.time() - self._fetched_at > self.ttl
+
+    def _backing_off(self):
+        return time.time() - self._failed_at < self.retry_ttl
+
+    def refresh(self):
+        """Fetches the remote listing and rewrites the manifest. Returns True on success."""
+        entries = fetch_model_entries()
+        if entries is None:
+            with self._lock:
+                self._failed_at = time.time()
+            return False
+        with self._lock:
+            self._entries = {entry['name']: entry for entry in entries}
+            self._fetched_at = time.time()
+            self._save_manifest()
+        return True
+
+    def refresh_async(self):
+        """Starts a background refresh unless one is already running."""
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return
+            self._refresh_thread = threading.Thread(target=self.refresh, name="model-catalog-refresh", daemon=True)
+            self._refresh_thread.start()
+
+    def wait_for_refresh(self, timeout=None):
+        """Waits for a running background refresh to finish."""
+        with self._lock:
+            thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _local_files(self):
+        if not os.path.isdir(self.models_dir):
+            return []
+        return [name for name in os.listdir(self.models_dir) if name.endswith('.pt')]
+
+    def _local_entries(self):
+        entries = {}
+        for name in self._local_files():
+            stat = os.stat(os.path.join(self.models_dir, name))
+            entries[name] = {
+                'name': name,
+                'key': name,
+                'size': stat.st_size,
+                'sha': None,
+                'etag': None,
+                'download_url': None,
+                'source': 'local',
+                'fetched_at': stat.st_mtime,
+            }
+        return entries
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path) as file:
+                manifest = json.load(file)
+            self._entries = {entry['name']: entry for entry in manifest['models']}
+            self._fetched_at = manifest['fetched_at']
+        except (OSError, ValueError, KeyError) as e:
+            if os.path.exists(self.manifest_path):
+                print(f"Ignoring unreadable model manifest {self.manifest_path}: {e}")
+
+    def _save_manifest(self):
+        os.makedirs(self.models_dir, exist_ok=True)
+        manifest = {'fetched_at': self._fetched_at, 'models': list(self._entries.values())}
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, 'w') as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+def get_model_catalog():
+    """Returns the process-wide model catalog shared by all pages and sessions."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ModelCatalog()
+        return _catalog
+
+def check_and_download_model(pt_file, source=None, bucket_name=bucket_name):
+    """Makes sure a model is present in the models directory and returns its local path.
+
+    ``pt_file`` is a catalog entry, or a file name/key looked up in the catalog. Files are
+    streamed to a ``.part`` file, verified against the catalog size and hash and then
+    renamed into place, so a file in the models directory is always complete. Returns
+    None if the model could not be downloaded.
+    """
+    entry = pt_file if isinstance(pt_file, dict) else _resolve_entry(pt_file, source)
+    source = entry['source']
+    os.makedirs(models_dir, exist_ok=True)
+    local_file_path = os.path.join(models_dir, entry['name'])
+
+    if os.path.exists(local_file_path):
+        if entry.get('size') is None or os.path.getsize(local_file_path) == entry['size']:
+            print(f"{entry['name']} already exists. Skipping download.")
+            return local_file_path
+        print(f"{entry['name']} has an unexpected size. Downloading it again.")
+        os.remove(local_file_path)
 
-def check_and_download_model(pt_file, source, bucket_name=bucket_name):
-    if not os.path.exists('models'):
-        os.makedirs('models')
     if source == 'github':
-        local_file_path = os.path.join('models', pt_file)
-        if os.path.exists(local_file_path):
-            print(f"{pt_file} already exists. Skipping download.")
-        else:
-            try:
-                download_url = pt_file['download_url']
-                response = requests.get(download_url)
-                response.raise_for_status()
-                with open(local_file_path, 'wb') as file:
-                    file.write(response.content)
-                print(f"Downloaded from GitHub: {local_file_path}")
-            except Exception as e:
-                print(f"Failed to download {pt_file} from GitHub: {e}")
-                # If download from GitHub fails, try S3
-                try:
-                    key = pt_file
-                    download_file_from_s3(key, local_file_path, bucket_name)
-                except Exception as e:
-                    print(f"Failed to download {key} from S3: {e}")
+        try:
+            download_file_from_url(entry['download_url'], local_file_path, size=entry.get('size'), sha=entry.get('sha'))
+            print(f"Downloaded from GitHub: {local_file_path}")
+            return local_file_path
+        except Exception as e:
+            print(f"Failed to download {entry['name']} from GitHub: {e}")
+        # If download from GitHub fails, try S3 (only the size is known to match there)
+        try:
+            download_file_from_s3(entry['key'], local_file_path, bucket_name, size=entry.get('size'))
+            return local_file_path
+        except Exception as e:
+            print(f"Failed to download {entry['key']} from S3: {e}")
     elif source == 's3':
-        local_file_path = os.path.join('models', os.path.basename(pt_file))
-        if os.path.exists(local_file_path):
-            print(f"{os.path.basename(pt_file)} already exists. Skipping download.")
-        else:
-            try:
-                download_file_from_s3(pt_file, local_file_path, bucket_name)
-            except Exception as e:
-                print(f"Failed to download {pt_file} from S3: {e}")
+        try:
+            download_file_from_s3(entry['key'], local_file_path, bucket_name, size=entry.get('size'), etag=entry.get('etag'))
+            return local_file_path
+        except Exception as e:
+            print(f"Failed to download {entry['key']} from S3: {e}")
     else:
         print("Unknown source.")
+    return None
+
+def _resolve_entry(pt_file, source):
+    """Finds the catalog entry for a file name or key, falling back to a bare entry."""
+    name = os.path.basename(pt_file)
+    entry = get_model_catalog().get(name)
+    if entry is not None and entry['source'] != 'local':
+        return entry
+    return {'name': name, 'key': pt_file, 'size': None, 'sha': None, 'etag': None,
+            'download_url': None, 'source': source, 'fetched_at': None}
+
+def download_file_from_url(url, local_path, size=None, sha=None, retries=download_retries):
+    """Streams ``url`` to ``local_path``, resuming a partial download with HTTP Range requests."""
+    import requests
+
+    part_path = f"{local_path}.part"
+    for attempt in range(1, retries + 1):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if size is not None and offset > size:
+            os.remove(part_path)
+            offset = 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            if size is None or offset < size:
+                with requests.get(url, headers=headers, stream=True, timeout=download_timeout) as response:
+                    if response.status_code == 416:
+                        # Nothing left to fetch for this range; verification decides if the file is good
+                        pass
+                    else:
+                        response.raise_for_status()
+                        # A 200 means the server ignored the range, so start over
+                        mode = 'ab' if response.status_code == 206 else 'wb'
+                        with open(part_path, mode) as file:
+                            for chunk in response.iter_content(chunk_size=download_chunk_size):
+                                file.write(chunk)
+            verify_file(part_path, size=size, sha=sha)
+            os.replace(part_path, local_path)
+            return
+        except ValueError:
+            # Corrupt data cannot be resumed
+            os.remove(part_path)
+            if attempt == retries:
+                raise
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise
+            print(f"Download interrupted ({e}), resuming (attempt {attempt + 1} of {retries})")
+
+def download_file_from_s3(key, local_path, bucket_name, size=None, etag=None):
+    """Downloads an S3 object with concurrent ranged transfers, then verifies and renames it."""
+    from boto3.s3.transfer import TransferConfig
 
-def download_file_from_s3(key, local_path, bucket_name):
-    s3 = boto3.client('s3', config=Config(signature_version=UNSIGNED), region_name='ap-southeast-2')
-    s3.download_file(bucket_name, key, local_path)
+    part_path = f"{local_path}.part"
+    get_s3_client().download_file(bucket_name, key, part_path, Config=TransferConfig(**s3_transfer_options))
+    try:
+        verify_file(part_path, size=size, etag=etag)
+    except ValueError:
+        os.remove(part_path)
+        raise
+    os.replace(part_path, local_path)
     print(f"Downloaded from S3: {local_path}")
 
+def verify_file(path, size=None, sha=None, etag=None):
+    """Checks a file against its expected size, git blob sha (GitHub) or ETag (S3).
+
+    Raises ValueError on a mismatch. Multipart S3 ETags are not content hashes, so
+    those are only checked by size.
+    """
+    actual_size = os.path.getsize(path)
+    if size is not None and actual_size != size:
+        raise ValueError(f"{path} is {actual_size} bytes, expected {size}")
+    if sha is None and (etag is None or '-' in etag):
+        return
+    if sha is not None:
+        digest = hashlib.sha1(f"blob {actual_size}\0".encode())
+    else:
+        digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(download_chunk_size), b''):
+            digest.update(chunk)
+    expected = sha if sha is not None else etag
+    if digest.hexdigest() != expected:
+        raise ValueError(f"{path} failed checksum verification")
+
 if __name__ == "__main__":
     pt_files, source = get_pt_files()
     print(pt_files)
@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+from backends import DEFAULT_BACKEND, load_model
+
+logger = logging.getLogger(__name__)
+
+# Pool defaults, overridable from the environment
+DEFAULT_MEMORY_BUDGET_MB = int(os.environ.get("RDD_MODEL_MEMORY_MB", "1024"))
+DEFAULT_WARMUP = os.environ.get("RDD_MODEL_WARMUP", "1") == "1"
+PRELOAD_AT_STARTUP = os.environ.get("RDD_PRELOAD_MODELS", "0") == "1"
+WARMUP_SHAPE = (640, 640, 3)
+
+class ModelInfo(NamedTuple):
+    path: str
+    backend: str
+    size_bytes: int
+    load_seconds: float
+    uses: int
+
+class PoolStats(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    total_load_seconds: float
+    resident_bytes: int
+    process_rss_bytes: Optional[int]
+    models: List[ModelInfo]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+class PooledModel:
+    """A loaded model shared between sessions.
+
+    ``predict`` is serialized with a per-model lock because a YOLO predictor keeps
+    per-call state; every other attribute is delegated to the wrapped model.
+    """
+
+    def __init__(self, path: str, backend: str, model, size_bytes: int, load_seconds: float):
+        self.path = path
+        self.backend = backend
+        self.model = model
+        self.size_bytes = size_bytes
+        self.load_seconds = load_seconds
+        self.uses = 0
+        self._lock = threading.Lock()
+
+    def predict(self, *args, **kwargs):
+        with self._lock:
+            self.uses += 1
+            return self.model.predict(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+class ModelPool:
+    """Process-wide LRU cache of loaded models with a memory budget.
+
+    When the estimated size of the resident models exceeds ``memory_budget_mb`` the
+    least recently used models are dropped (the most recent one is always kept).
+    Models are keyed by weights path, backend and INT8 flag (see ``backends``).
+    With ``warmup`` each model runs one dummy prediction right after loading so the
+    first real request does not pay for lazy initialization.
+    """
+
+    def __init__(self, memory_budget_mb: int = DEFAULT_MEMORY_BUDGET_MB, warmup: bool = DEFAULT_WARMUP):
+        self.memory_budget_bytes = memory_budget_mb * 1024 * 1024
+        self.warmup = warmup
+        self._models: "OrderedDict[str, PooledModel]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._total_load_seconds = 0.0
+        self._preload_thread: Optional[threading.Thread] = None
+
+    def get(self, model_path: str, backend: str = DEFAULT_BACKEND, int8: bool = False) -> PooledModel:
+        """Returns the model at ``model_path``, loading it once even under concurrent calls."""
+        model_path = str(model_path)
+        key = _pool_key(model_path, backend, int8)
+        with self._lock:
+            pooled = self._lookup(key)
+            if pooled is not None:
+                self._hits += 1
+                return pooled
+            loading_lock = self._loading.setdefault(key, threading.Lock())
+
+        with loading_lock:
+            with self._lock:
+                # Another session may have finished loading while we waited
+                pooled = self._lookup(key)
+                if pooled is not None:
+                    self._hits += 1
+                    return pooled
+                self._misses += 1
+            try:
+                pooled = self._load(model_path, backend, int8)
+            except BaseException:
+                with self._lock:
+                    self._loading.pop(key, None)
+                raise
+            # Publish and release in one step, so no caller can miss both and load again
+            with self._lock:
+                self._models[key] = pooled
+                self._loading.pop(key, None)
+                self._evict()
+        return pooled
+
+    def preload(self, model_paths: Iterable[str]) -> None:
+        """Loads (and warms up) models ahead of the first request."""
+        for model_path in model_paths:
+            try:
+                self.get(model_path)
+            except Exception as e:
+                logger.warning("Failed to preload %s: %s", model_path, e)
+
+    def preload_async(self, model_paths: Iterable[str]) -> threading.Thread:
+        """Preloads models on a background thread so startup is not blocked."""
+        thread = threading.Thread(target=self.preload, args=(list(model_paths),), name="model-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def preload_directory(self, models_dir: str = "models") -> None:
+        """Preloads every downloaded model in the background, once per process."""
+        with self._lock:
+            if self._preload_thread is not None or not os.path.isdir(models_dir):
+                return
+            model_paths = sorted(os.path.join(models_dir, name) for name in os.listdir(models_dir) if name.endswith(".pt"))
+            self._preload_thread = self.preload_async(model_paths)
+
+    def evict(self, model_path: str, backend: str = DEFAULT_BACKEND, int8: bool = False) -> bool:
+        """Drops a model from the pool. Sessions still holding it keep a working reference."""
+        with self._lock:
+            return self._models.pop(_pool_key(str(model_path), backend, int8), None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._models.clear()
+
+    def stats(self) -> PoolStats:
+        with self._lock:
+            models = [ModelInfo(p.path, p.backend, p.size_bytes, p.load_seconds, p.uses) for p in self._models.values()]
+            return PoolStats(
+                hits=self._hits,
+                misses=self._misses,
+                evictions=self._evictions,
+                total_load_seconds=self._total_load_seconds,
+                resident_bytes=sum(model.size_bytes for model in models),
+                process_rss_bytes=process_rss_bytes(),
+                models=models,
+            )
+
+    def _lookup(self, key: str) -> Optional[PooledModel]:
+        pooled = self._models.get(key)
+        if pooled is not None:
+            self._models.move_to_end(key)
+        return pooled
+
+    def _load(self, model_path: str, backend: str, int8: bool) -> PooledModel:
+        t0 = time.perf_counter()
+        model = load_model(model_path, backend, int8)
+        if self.warmup:
+            model.predict(np.zeros(WARMUP_SHAPE, dtype=np.uint8), verbose=False)
+        load_seconds = time.perf_counter() - t0
+        size_bytes = estimate_model_bytes(model, model_path)
+        with self._lock:
+            self._total_load_seconds += load_seconds
+        logger.info("Loaded %s (%s) in %.2fs (~%.0f MB)", model_path, backend, load_seconds, size_bytes / 1e6)
+        label = f"{backend}-int8" if int8 else backend
+        return PooledModel(model_path, label, model, size_bytes, load_seconds)
+
+    def _evict(self) -> None:
+        resident = sum(model.size_bytes for model in self._models.values())
+        while resident > self.memory_budget_bytes and len(self._models) > 1:
+            model_path, pooled = self._models.popitem(last=False)
+            resident -= pooled.size_bytes
+            self._evictions += 1
+            logger.info("Evicted %s from the model pool", model_path)
+
+def _pool_key(model_path: str, backend: str, int8: bool) -> str:
+    return f"{model_path}|{backend}{'|int8' if int8 else ''}"
+
+def estimate_model_bytes(model, model_path: str) -> int:
+    """Estimates the memory held by a model from its parameters and buffers.
+
+    Exported backends do not expose their tensors, so the size of the exported
+    artifact (file or directory) is used instead.
+    """
+    try:
+        module = model.model
+        tensors = list(module.parameters()) + list(module.buffers())
+        return sum(t.numel() * t.element_size() for t in tensors)
+    except Exception:
+        path = getattr(model, "ckpt_path", None) or str(getattr(model, "model", "") or model_path)
+        if not os.path.exists(path):
+            path = model_path
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+        return os.path.getsize(path)
+
+def process_rss_bytes() -> Optional[int]:
+    """Current resident set size of this process, where /proc is available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_model_pool() -> ModelPool:
+    """Returns the model pool shared by all pages and sessions."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ModelPool()
+        return _pool
@@ -1,17 +1,26 @@
+import hashlib
 import logging
-from typing import NamedTuple, List
+import tempfile
+from collections import OrderedDict
+from typing import Tuple
 from pathlib import Path
 import numpy as np
-import cv2
-from ultralytics import YOLO
 import streamlit as st
 from io import BytesIO
 from PIL import Image
-import os
 
 # Import functions from model.py
-# Import get_pt_files instead of get_pt_files_from_s3
-from model import get_pt_files, check_and_download_model
+from model import get_model_catalog, check_and_download_model
+from model_pool import get_model_pool
+from metrics import get_metrics, metrics_panel
+from backends import DEFAULT_BACKEND, available_backends, DEFAULT_INT8, weights_hash
+from result_cache import FLOOR_CONFIDENCE, cache_key, get_result_cache
+from detection import CLASSES, DetectionBatch, draw_detections
+from preprocess import Letterbox
+from tiling import TileConfig
+from inference import predict_image
+from image_batch import (BUNDLE_DIR, ImageResult, ImageSource, class_summary, detect_images, evict_bundles,
+                         expand_uploads, open_image, render_thumbnail, write_bundle)
 
 # Configure Streamlit page settings
 st.set_page_config(
@@ -28,34 +37,28 @@ logger = logging.getLogger(__name__)
 
 # Model configuration
 MODELS_DIR = ROOT / "models"
-CLASSES = [
-    'Alligator Crack',
-    'Vertical Crack',
-    'Potholes',
-    'Raveling',
-    'Shoving',
-    'Horizontal Crack'
-]
-
-# Function to load the selected model
-@st.cache_resource
-def load_model(model_path):
-    return YOLO(model_path)
 
 # Sidebar configuration for model selection
 st.sidebar.header("🔧 Settings")
 st.sidebar.subheader("Model Selection")
 
-# Get available models, trying GitHub first and falling back to S3
-available_models, source = get_pt_files()
+# Get available models from the shared catalog (served from the local manifest,
+# refreshed from GitHub/S3 in the background). Only the very first start has to wait
+# for the network, and then the sidebar is already drawn.
+catalog = get_model_catalog()
+available_models = catalog.list_models(wait=False)
+if not available_models:
+    with st.sidebar, st.spinner("Fetching the model list..."):
+        catalog.wait_for_refresh(timeout=60)
+    available_models = catalog.list_models(wait=False)
 
 # Check if models were retrieved successfully
 if not available_models:
-    st.error("Failed to retrieve models from both GitHub and S3.")
+    st.error("Failed to retrieve models from GitHub, S3 or the local models folder.")
     st.stop()
 
 # Display a dropdown for model selection without the .pt extension
-model_options = [os.path.basename(model).replace('.pt', '') for model in available_models]
+model_options = [entry['name'].replace('.pt', '') for entry in available_models]
 selected_model_name = st.sidebar.selectbox("Select a model:", model_options)
 
 # Get the selected model's full file name with .pt extension
@@ -64,24 +67,45 @@ selected_model_path = MODELS_DIR / full_model_name
 
 # Check if the selected model is downloaded
 if not selected_model_path.exists():
-    with st.spinner(f"Downloading {full_model_name} from {source.upper()}... Please wait."):
-        # Download the selected model
-        selected_model = next(model for model in available_models if os.path.basename(model) == full_model_name)
-        # Pass the source to check_and_download_model
-        check_and_download_model(selected_model, source)
+    selected_model = next(entry for entry in available_models if entry['name'] == full_model_name)
+    with st.spinner(f"Downloading {full_model_name} from {selected_model['source'].upper()}... Please wait."):
+        # Stream, verify and atomically store the model file
+        downloaded_path = check_and_download_model(selected_model)
+
+    if downloaded_path is None:
+        st.error(f"Failed to download {full_model_name}. Please try again or select another model.")
+        st.stop()
     
     st.sidebar.success(f"{full_model_name} downloaded successfully!")
 
-# Load the selected model
+# Inference backend (PyTorch, or an exported ONNX Runtime / OpenVINO model for CPU); only installed ones are offered
+backends = available_backends()
+backend = st.sidebar.selectbox("Inference backend", backends,
+                               index=backends.index(DEFAULT_BACKEND) if DEFAULT_BACKEND in backends else 0,
+                               help="ONNX and OpenVINO models are exported once and cached next to the weights")
+int8 = backend == "onnx" and st.sidebar.checkbox("INT8 quantization", value=DEFAULT_INT8, help="Dynamically quantized ONNX weights")
+
 MODEL_LOCAL_PATH = str(selected_model_path)
-net = load_model(MODEL_LOCAL_PATH)
+model_pool = get_model_pool()
+
+def load_model():
+    """The selected model from the shared pool, loaded (and warmed up) on first inference."""
+    with st.spinner(f"Loading {full_model_name} ({backend}{' INT8' if int8 else ''})..."):
+        return model_pool.get(MODEL_LOCAL_PATH, backend, int8)
 
-# Detection named tuple
-class Detection(NamedTuple):
-    class_id: int
-    label: str
-    score: float
-    box: np.ndarray
+# Model pool statistics
+with st.sidebar.expander("📦 Model Pool"):
+    pool_stats = model_pool.stats()
+    st.write(f"**Hit rate:** {pool_stats.hit_rate:.0%} ({pool_stats.hits} hits, {pool_stats.misses} loads, {pool_stats.evictions} evictions)")
+    st.write(f"**Total load time:** {pool_stats.total_load_seconds:.1f}s")
+    st.write(f"**Resident models:** {len(pool_stats.models)} (~{pool_stats.resident_bytes / 1e6:.0f} MB)")
+    if pool_stats.process_rss_bytes:
+        st.write(f"**Process memory:** {pool_stats.process_rss_bytes / 1e6:.0f} MB")
+    cache_stats = get_result_cache().stats()
+    st.write(f"**Result cache:** {cache_stats.hit_rate:.0%} hit rate ({cache_stats.memory_hits} memory, {cache_stats.disk_hits} disk, {cache_stats.misses} misses)")
+
+# Recent per-stage latency of this page's processing path
+metrics_panel("image.")
 
 # Sidebar for detection parameters
 st.sidebar.subheader("Detection Parameters")
@@ -98,6 +122,16 @@ st.sidebar.write(
     "🔍 **Tip**: Lowering the threshold may help detect subtle damage, but could increase false positives."
 )
 
+# Sidebar for sliced inference on high-resolution images
+st.sidebar.subheader("Sliced Inference")
+tiling = None
+if st.sidebar.checkbox("Enable sliced inference", help="Predict overlapping full-resolution tiles so thin cracks survive on 4K-8K images"):
+    tiling = TileConfig(
+        tile_size=st.sidebar.slider("Tile size", 320, 1280, 640, 32),
+        overlap=st.sidebar.slider("Tile overlap", 0.0, 0.5, 0.2, 0.05),
+        batch_size=st.sidebar.slider("Tiles per batch", 1, 32, 8),
+    )
+
 # Main title and description
 st.title("🚧 Road Damage Detection System")
 st.markdown(
@@ -111,51 +145,163 @@ st.markdown(
 )
 st.markdown('<div class="description">Upload an image of a road to detect various types of damage, including Alligator Cracks, Potholes, and more. The system will analyze the image and highlight detected damage.</div>', unsafe_allow_html=True)
 
+# Reusable letterbox buffer for model input
+letterbox = Letterbox()
+
+# Raw detections shared across reruns and sessions
+result_cache = get_result_cache()
+
+# Cache settings that change the raw detections of an image
+image_cache_settings = {'kind': 'image', 'orientation': 'exif', 'backend': backend, 'int8': int8,
+                        'tiling': list(tiling) if tiling else None, 'floor': FLOOR_CONFIDENCE}
+
+# Batch processing and gallery settings
+BATCH_SIZE = 8
+DECODE_WORKERS = 4
+GALLERY_COLUMNS = 4
+GALLERY_PAGE_SIZE = 12
+MAX_CACHED_THUMBNAILS = 4 * GALLERY_PAGE_SIZE
+
 # File uploader
-st.markdown("### 📸 Upload an Image")
-image_file = st.file_uploader(
-    "Accepted formats: PNG, JPG, JPEG",
-    type=['png', 'jpg', 'jpeg'],
-    help="Upload an image file to begin detection."
+st.markdown("### 📸 Upload Images")
+uploaded_files = st.file_uploader(
+    "Accepted formats: PNG, JPG, JPEG, or ZIP archives of images",
+    type=['png', 'jpg', 'jpeg', 'zip'],
+    accept_multiple_files=True,
+    help="Upload one image, many images or zip files to begin detection."
 )
 
-def predict_damage(image: Image.Image, model, threshold: float) -> List[Detection]:
-    """Run the YOLO model to detect damage in the image."""
-    image = image.convert("RGB")
-    _image = np.array(image)
-    original_size = _image.shape[:2]
-
-    # Resize image for prediction
-    resized_image = cv2.resize(_image, (640, 640), interpolation=cv2.INTER_AREA)
-    results = model.predict(resized_image, conf=threshold)
-
-    # Extract detections
-    detections = []
-    for result in results:
-        boxes = result.boxes.cpu().numpy()
-        for box in boxes:
-            detection = Detection(
-                class_id=int(box.cls),
-                label=CLASSES[int(box.cls)],
-                score=float(box.conf),
-                box=box.xyxy[0].astype(int)
-            )
-            detections.append(detection)
-
-    # Annotate results back to original image size
-    annotated_frame = results[0].plot()
-    output_image = cv2.resize(annotated_frame, original_size[::-1], interpolation=cv2.INTER_AREA)
+# A single image gets the detailed view, anything else the batch gallery
+image_file = None
+if len(uploaded_files) == 1 and not uploaded_files[0].name.lower().endswith('.zip'):
+    image_file = uploaded_files[0]
+
+def predict_damage(image: Image.Image, threshold: float, tiling: TileConfig = None,
+                   key: str = None) -> Tuple[DetectionBatch, np.ndarray]:
+    """Run the YOLO model to detect damage in the image.
+
+    Raw detections are cached under ``key`` at the cache's floor confidence, so a new
+    threshold only re-filters them (and the model is not even loaded).
+    """
+    metrics = get_metrics()
+    with metrics.timer("image.decode"):
+        image = image.convert("RGB")
+        _image = np.array(image)
+
+    def _predict() -> DetectionBatch:
+        # Detections come back in original image coordinates
+        raw, timings = predict_image(load_model(), _image, FLOOR_CONFIDENCE, tiling=tiling, letterbox=letterbox, rgb=True)
+        if timings is not None:
+            st.caption(f"⏱️ {timings.tiles} tiles: preprocess {timings.preprocess_seconds * 1000:.0f} ms, "
+                       f"inference {timings.inference_seconds * 1000:.0f} ms, merge {timings.merge_seconds * 1000:.0f} ms")
+        return raw
+
+    raw_detections = result_cache.get_or_compute(key, _predict) if key else _predict()
+    detections = raw_detections.filter(min_score=threshold)
+
+    # Annotate the original image directly
+    with metrics.timer("image.annotate"):
+        output_image = draw_detections(_image, detections, rgb=True)
 
     return detections, output_image
 
+def _thumbnail(source: ImageSource, result: ImageResult, threshold: float) -> np.ndarray:
+    """Renders a gallery thumbnail on first view, keeping the most recent ones per session."""
+    thumbnails = st.session_state.setdefault('thumbnails', OrderedDict())
+    key = (result.digest, threshold)
+    if key not in thumbnails:
+        thumbnails[key] = render_thumbnail(source.read(), result.detections.filter(min_score=threshold))
+        while len(thumbnails) > MAX_CACHED_THUMBNAILS:
+            thumbnails.popitem(last=False)
+    thumbnails.move_to_end(key)
+    return thumbnails[key]
+
+def _drop_bundle() -> None:
+    """Forgets this session's download bundle and deletes its file."""
+    bundle = st.session_state.pop('batch_bundle', None)
+    if bundle is not None:
+        bundle[1].unlink(missing_ok=True)
+
+def show_batch(files, threshold: float, tiling: TileConfig = None) -> None:
+    """Batched detection over many images with a class summary, paginated gallery and bundled download."""
+    sources = expand_uploads(files)
+    if not sources:
+        st.warning("No PNG or JPEG images found in the upload.")
+        return
+
+    # Raw detections are kept for the session; a new threshold only re-filters them
+    run_key = (tuple(getattr(f, "file_id", None) or (f.name, f.size) for f in files), MODEL_LOCAL_PATH, backend, int8,
+               tuple(tiling) if tiling else None)
+    if st.session_state.get('batch_key') != run_key:
+        progress_bar = st.progress(0, text="🔍 Detecting road damage...")
+        results = detect_images(
+            load_model(), sources, FLOOR_CONFIDENCE, batch_size=BATCH_SIZE, workers=DECODE_WORKERS, tiling=tiling,
+            cache=result_cache, model_digest=weights_hash(MODEL_LOCAL_PATH), cache_settings=image_cache_settings,
+            on_progress=lambda done, total: progress_bar.progress(done / total, text=f"🔍 Detecting road damage in image {done} of {total}"),
+        )
+        progress_bar.empty()
+        st.session_state.batch_key = run_key
+        st.session_state.batch_results = results
+        _drop_bundle()
+    results = st.session_state.batch_results
+    filtered = [result.detections.filter(min_score=threshold) for result in results]
+
+    # Per-class summary
+    st.markdown("### 📊 Summary")
+    summary = class_summary(results, threshold)
+    damaged = sum(1 for detections in filtered if len(detections))
+    st.write(f"**{len(results)} images**, {damaged} with damage, {sum(row['detections'] for row in summary)} detections")
+    col1, col2 = st.columns(2)
+    col1.table(summary)
+    col2.bar_chart({row['class']: row['detections'] for row in summary})
+
+    # Paginated gallery; thumbnails are only rendered for the visible page
+    st.markdown("### 🖼️ Gallery")
+    only_damaged = st.checkbox("Only images with damage")
+    indices = [i for i, detections in enumerate(filtered) if len(detections) or not only_damaged]
+    page_count = max(1, -(-len(indices) // GALLERY_PAGE_SIZE))
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1)
+    columns = st.columns(GALLERY_COLUMNS)
+    for slot, i in enumerate(indices[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]):
+        with columns[slot % GALLERY_COLUMNS]:
+            st.image(_thumbnail(sources[i], results[i], threshold), use_column_width=True)
+            labels = ", ".join(sorted({CLASSES[class_id] for class_id in filtered[i].class_id.tolist()})) or "no damage"
+            st.caption(f"**{sources[i].name}**: {len(filtered[i])} detections ({labels})")
+
+    # One zip with every annotated image and all detections, kept on disk rather than in the session
+    bundle = st.session_state.get('batch_bundle')
+    if bundle is not None and (bundle[0] != threshold or not bundle[1].exists()):
+        _drop_bundle()
+        bundle = None
+    if bundle is None and st.button("📦 Prepare Download Bundle"):
+        if 'bundle_dir' not in st.session_state:
+            BUNDLE_DIR.mkdir(parents=True, exist_ok=True)
+            st.session_state.bundle_dir = Path(tempfile.mkdtemp(dir=BUNDLE_DIR))
+        # Recreated if eviction removed it since the last bundle
+        st.session_state.bundle_dir.mkdir(parents=True, exist_ok=True)
+        progress_bar = st.progress(0, text="📦 Annotating images...")
+        bundle_path = write_bundle(st.session_state.bundle_dir / f"bundle-{threshold:.2f}.zip", sources, results, threshold,
+                                   on_progress=lambda done, total: progress_bar.progress(done / total, text=f"📦 Annotating image {done} of {total}"))
+        progress_bar.empty()
+        st.session_state.batch_bundle = bundle = (threshold, bundle_path)
+        # Bundles of sessions that are long gone
+        evict_bundles()
+    if bundle is not None:
+        with open(bundle[1], 'rb') as f:
+            st.download_button("📥 Download Annotated Images and Detections", f,
+                               file_name="road_damage_predictions.zip", mime="application/zip")
+
 if image_file:
     # Display original image
     st.image(image_file, caption="Uploaded Image", use_column_width=True)
-    image = Image.open(image_file)
+    image = open_image(image_file)
+
+    # Same image, model and tiling reuse cached detections
+    result_key = cache_key(hashlib.sha256(image_file.getvalue()).hexdigest(), weights_hash(MODEL_LOCAL_PATH), image_cache_settings)
 
     # Perform detection with a progress indicator
     with st.spinner("🔍 Detecting road damage... Please wait."):
-        detections, annotated_image = predict_damage(image, net, score_threshold)
+        detections, annotated_image = predict_damage(image, score_threshold, tiling, result_key)
     
     # Display results in two columns
     col1, col2 = st.columns(2)
@@ -168,9 +314,10 @@ if image_file:
         st.image(annotated_image, use_column_width=True)
 
         # Allow downloading the prediction image
-        buffer = BytesIO()
-        prediction_image = Image.fromarray(annotated_image)
-        prediction_image.save(buffer, format="PNG")
+        with get_metrics().timer("image.encode"):
+            buffer = BytesIO()
+            prediction_image = Image.fromarray(annotated_image)
+            prediction_image.save(buffer, format="PNG")
         st.download_button(
             label="📥 Download Prediction Image",
             data=buffer.getvalue(),
@@ -182,9 +329,11 @@ if image_file:
     st.markdown("### 📊 Detection Details")
     if detections:
         st.write(f"**Total Detections:** {len(detections)}")
-        for detection in detections:
+        for detection in detections.to_detections():
             st.markdown(f"- **{detection.label}** detected with a confidence of `{detection.score:.2f}` at `{detection.box}`")
     else:
         st.info("No damage detected. Try adjusting the confidence threshold.")
+elif uploaded_files:
+    show_batch(uploaded_files, score_threshold, tiling)
 else:
     st.info("Please upload an image to start the detection process.")
\ No newline at end of file
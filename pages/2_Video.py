@@ -1,11 +1,19 @@
-import os
+import json
 import logging
+import tempfile
+import time
 from pathlib import Path
-from typing import NamedTuple
-import numpy as np
-from model import get_pt_files, check_and_download_model
-import cv2
-from ultralytics import YOLO
+from model import get_model_catalog, check_and_download_model
+from metrics import metrics_panel
+from backends import DEFAULT_BACKEND, available_backends, DEFAULT_INT8, export_model
+from video_engine import probe_video, DEFAULT_BATCH_SIZE, DEFAULT_QUEUE_DEPTH
+from video_io import VIDEO_BACKENDS, DEFAULT_VIDEO_BACKEND, DEFAULT_CRF, DEFAULT_PRESET
+from tiling import TileConfig
+from jobs import JOBS_DIR, get_job_queue, job_directory, new_job_id
+from upload_store import StoredUpload, get_upload_store
+from progress import PREVIEW_FILE, read_progress
+from geo import DEFECT_INDEX_PATH, DefectIndex
+from export import available_export_formats
 import streamlit as st
 
 # Streamlit page configuration
@@ -23,30 +31,28 @@ logger = logging.getLogger(__name__)
 
 # Model configuration
 MODELS_DIR = ROOT / "models"
-CLASSES = [
-    'Alligator Crack', 'Vertical Crack', 'Potholes',
-    'Raveling', 'Shoving', 'Horizontal Crack'
-]
-
-# Function to load the selected model
-@st.cache_resource
-def load_model(model_path):
-    return YOLO(model_path)
 
 # Sidebar: Model selection
 st.sidebar.header("🔧 Settings")
 st.sidebar.subheader("Model Selection")
 
-# Get available models, trying GitHub first and falling back to S3
-available_models, source = get_pt_files()
+# Get available models from the shared catalog (served from the local manifest,
+# refreshed from GitHub/S3 in the background). Only the very first start has to wait
+# for the network, and then the sidebar is already drawn.
+catalog = get_model_catalog()
+available_models = catalog.list_models(wait=False)
+if not available_models:
+    with st.sidebar, st.spinner("Fetching the model list..."):
+        catalog.wait_for_refresh(timeout=60)
+    available_models = catalog.list_models(wait=False)
 
 # Check if models were retrieved successfully
 if not available_models:
-    st.error("Failed to retrieve models from both GitHub and S3.")
+    st.error("Failed to retrieve models from GitHub, S3 or the local models folder.")
     st.stop()
 
 # Display a dropdown for model selection without the .pt extension
-model_options = [os.path.basename(model).replace('.pt', '') for model in available_models]
+model_options = [entry['name'].replace('.pt', '') for entry in available_models]
 selected_model_name = st.sidebar.selectbox("Select a model:", model_options)
 
 # Get the selected model's full file name with .pt extension
@@ -55,104 +61,231 @@ selected_model_path = MODELS_DIR / full_model_name
 
 # Check if the selected model is downloaded
 if not selected_model_path.exists():
-    with st.spinner(f"Downloading {full_model_name} from {source.upper()}... Please wait."):
-        # Download the selected model
-        selected_model = next(model for model in available_models if os.path.basename(model) == full_model_name)
-        # Pass the source to check_and_download_model
-        check_and_download_model(selected_model, source)
-
-    st.sidebar.success(f"{full_model_name} downloaded successfully!")
-
-# Load the selected model
-MODEL_LOCAL_PATH = str(selected_model_path)
-net = load_model(MODEL_LOCAL_PATH)
-
-# Detection named tuple
-class Detection(NamedTuple):
-    class_id: int
-    label: str
-    score: float
-    box: np.ndarray
+    selected_model = next(entry for entry in available_models if entry['name'] == full_model_name)
+    with st.spinner(f"Downloading {full_model_name} from {selected_model['source'].upper()}... Please wait."):
+        # Stream, verify and atomically store the model file
+        downloaded_path = check_and_download_model(selected_model)
 
-# Create temporary folder for saving videos
-TEMP_DIR = Path('./temp')
-TEMP_DIR.mkdir(exist_ok=True)
+    if downloaded_path is None:
+        st.error(f"Failed to download {full_model_name}. Please try again or select another model.")
+        st.stop()
 
-temp_file_input = TEMP_DIR / "video_input.mp4"
-temp_file_output = TEMP_DIR / "video_output.mp4"
+    st.sidebar.success(f"{full_model_name} downloaded successfully!")
 
-# Initialize processing state
-st.session_state.setdefault('processing', False)
+# Inference backend (PyTorch, or an exported ONNX Runtime / OpenVINO model for CPU); only installed ones are offered
+backends = available_backends()
+backend = st.sidebar.selectbox("Inference backend", backends,
+                               index=backends.index(DEFAULT_BACKEND) if DEFAULT_BACKEND in backends else 0,
+                               help="ONNX and OpenVINO models are exported once and cached next to the weights")
+int8 = backend == "onnx" and st.sidebar.checkbox("INT8 quantization", value=DEFAULT_INT8, help="Dynamically quantized ONNX weights")
 
-def save_uploaded_file(file_path: Path, file_bytes) -> None:
-    """Saves the uploaded file to the specified path."""
-    with open(file_path, "wb") as f:
-        f.write(file_bytes.getbuffer())
+# Models are loaded by the job workers; export once here so workers never race on it
+MODEL_LOCAL_PATH = str(selected_model_path)
+if backend != "torch":
+    with st.spinner(f"Preparing {full_model_name} ({backend}{' INT8' if int8 else ''})..."):
+        export_model(MODEL_LOCAL_PATH, backend, int8)
+
+# Recent per-stage latency of this page's processing path
+metrics_panel("video.")
+
+# Background jobs: videos are processed by worker processes, not in this script run
+job_queue = get_job_queue()
+upload_store = get_upload_store()
+st.session_state.setdefault('session_id', new_job_id())
+
+# Job queue status and this session's recent jobs
+with st.sidebar.expander("🗂️ Jobs"):
+    recent_jobs = job_queue.store.list_jobs(st.session_state.session_id, limit=10)
+    st.write(f"**Running:** {job_queue.running} of {job_queue.max_concurrent} workers")
+    for recent_job in recent_jobs:
+        st.markdown(f"- [{time.strftime('%H:%M:%S', time.localtime(recent_job.created_at))}](?job={recent_job.id}) {recent_job.state}")
+
+# Defects located across all surveys processed with a GPS track
+with st.sidebar.expander("🗺️ Defect Index"):
+    if not DEFECT_INDEX_PATH.exists():
+        st.write("No survey with a GPS track has been processed yet.")
+    elif st.button("Export all surveys as GeoJSON"):
+        with st.spinner("Exporting defects..."), tempfile.TemporaryDirectory() as temp_dir:
+            defect_index = DefectIndex.load(DEFECT_INDEX_PATH)
+            geojson = defect_index.write_geojson(Path(temp_dir) / "defects.geojson").read_bytes()
+        st.write(f"**{len(defect_index)} defects** from {len(defect_index.surveys)} surveys")
+        st.download_button("📥 Download GeoJSON", geojson, file_name="road_damage_all_defects.geojson", mime="application/geo+json")
+
+MAX_TRACK_CROPS = 12
+
+# Seconds between progress refreshes of a running job
+POLL_SECONDS = 1.0
+
+EXPORT_MIME_TYPES = {
+    "jsonl": "application/x-ndjson",
+    "npz": "application/octet-stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def _rerun() -> None:
+    (st.rerun if hasattr(st, "rerun") else st.experimental_rerun)()
+
+def _get_job_param():
+    """The job shown on this page, kept in the URL so it survives reloads."""
+    if hasattr(st, "query_params"):
+        return st.query_params.get("job")
+    return st.experimental_get_query_params().get("job", [None])[0]
+
+def _set_job_param(job_id) -> None:
+    if hasattr(st, "query_params"):
+        if job_id:
+            st.query_params["job"] = job_id
+        else:
+            st.query_params.pop("job", None)
+    else:
+        st.experimental_set_query_params(**({"job": job_id} if job_id else {}))
+
+def store_uploaded_file(uploaded_file) -> StoredUpload:
+    """Streams the upload into the content-addressed store once per session and file."""
+    cache = st.session_state.setdefault('stored_uploads', {})
+    file_key = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    stored = cache.get(file_key)
+    if stored is None or not stored.path.exists():
+        stored = cache[file_key] = upload_store.put(uploaded_file, Path(uploaded_file.name).suffix.lower())
+    return stored
+
+def _protected_paths():
+    """Inputs and output directories of jobs that are queued or running."""
+    for job in job_queue.store.active_jobs():
+        yield Path(job.input_path)
+        yield Path(job.output_path).parent
+
+def submit_video(stored: StoredUpload, settings: dict, export_format: str, gps_file=None, gps_offset: float = 0.0):
+    """Queues a stored upload for processing; outputs go to the job's own directory."""
+    job_id = new_job_id()
+    job_dir = job_directory(job_id)
+    if gps_file is not None:
+        # Kept with the job so it is cleaned up together with its outputs
+        gps_path = job_dir / f"gps{Path(gps_file.name).suffix.lower()}"
+        gps_path.write_bytes(gps_file.getvalue())
+        settings = {**settings, 'gps': {'path': str(gps_path), 'offset': gps_offset}}
+    export_path = job_dir / f"detections.{export_format}" if export_format != "None" else None
+    job = job_queue.submit(job_id, st.session_state.session_id, stored.path, job_dir / "output.mp4", settings, export_path)
+    # Drop old uploads and job outputs in the background
+    upload_store.evict_async([JOBS_DIR], lambda: list(_protected_paths()))
+    return job
+
+def show_job(job) -> None:
+    """Displays the state of a job, polling until it finishes."""
+    info = probe_video(job.input_path)
+    if info is not None and info.fps > 0:
+        st.write(f"**Video Properties:** {_format_duration(info.frame_count/info.fps)}, {info.width}x{info.height} @ {info.fps:.2f} FPS")
+
+    if not job.finished:
+        if job.state == "queued":
+            ahead = job_queue.store.queue_position(job.id)
+            st.progress(0, text=f"⏳ Waiting in queue ({ahead} job{'s' if ahead != 1 else ''} ahead)...")
+        else:
+            st.progress(job.progress, text=f"⏳ Processing frame {job.frames_done} of {job.frame_count}")
+            _show_live_progress(job)
+        st.caption("Processing continues in the background; you can close or reload this page.")
+        if st.button("⛔ Cancel Job"):
+            job_queue.cancel(job.id)
+            _rerun()
+        time.sleep(POLL_SECONDS)
+        _rerun()
+        return
 
-def process_video(video_path: Path, output_path: Path, threshold: float) -> None:
-    """Performs damage detection on the uploaded video."""
-    video_capture = cv2.VideoCapture(str(video_path))
+    if job.state == "failed":
+        st.error(f"🚨 Video processing failed: {job.error}")
+        return
+    if job.state == "cancelled":
+        st.warning("Video processing was cancelled.")
+        return
 
-    if not video_capture.isOpened():
-        st.error('🚨 Error opening video file. Please upload a valid video.')
+    if not Path(job.output_path).parent.exists():
+        st.warning("The outputs of this job have been cleaned up. Please process the video again.")
         return
 
-    # Video properties
-    width = int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = video_capture.get(cv2.CAP_PROP_FPS)
-    frame_count = int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT))
-
-    # Display video properties
-    st.write(f"**Video Properties:** {_format_duration(frame_count/fps)}, {width}x{height} @ {fps:.2f} FPS")
-
-    # Setup video writer
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    video_writer = cv2.VideoWriter(str(output_path), fourcc, fps, (width, height))
-
-    # Processing loop
-    progress_bar = st.progress(0, text="⏳ Processing video...")
-    for frame_idx in range(frame_count):
-        ret, frame = video_capture.read()
-        if not ret:
-            break
-
-        # Perform inference on the frame
-        detections, annotated_frame = _detect_and_annotate(frame, threshold)
-
-        # Save the processed frame
-        video_writer.write(cv2.cvtColor(annotated_frame, cv2.COLOR_RGB2BGR))
-
-        # Update progress
-        progress_bar.progress((frame_idx + 1) / frame_count, text=f"Processing frame {frame_idx + 1} of {frame_count}")
-
-    # Finalize processing
-    video_capture.release()
-    video_writer.release()
-    progress_bar.empty()
-    st.success("✅ Video processing completed!")
-
-def _detect_and_annotate(frame: np.ndarray, threshold: float):
-    """Runs the YOLO model on the frame and annotates it with detection results."""
-    resized_frame = cv2.resize(frame, (640, 640))
-    results = net.predict(resized_frame, conf=threshold)
-
-    # Extract detections
-    detections = []
-    for result in results:
-        for box in result.boxes.cpu().numpy():
-            detection = Detection(
-                class_id=int(box.cls),
-                label=CLASSES[int(box.cls)],
-                score=float(box.conf),
-                box=box.xyxy[0].astype(int)
-            )
-            detections.append(detection)
-
-    # Annotate frame
-    annotated_frame = results[0].plot()
-    annotated_frame = cv2.resize(annotated_frame, (frame.shape[1], frame.shape[0]))
-    return detections, annotated_frame
+    result = job.result
+    st.success("✅ Video processing completed!" + (" (detections replayed from cache)" if result.get('cached') else ""))
+    _show_throughput(result)
+    if job.export_path:
+        st.write(f"**Exported detections:** {result.get('rows_written', 0)} rows in {result.get('chunks_written', 0)} chunks")
+    if 'tracks' in result:
+        _show_tracks(result['tracks'])
+    if 'geo' in result:
+        _show_geo(result['geo'])
+
+    # No video is written when only the detections were requested
+    if Path(job.output_path).exists():
+        if job.settings.get('io', {}).get('backend') == "pyav":
+            # H.264 output plays in the browser
+            st.video(job.output_path)
+
+        # Download links for the processed video and detections
+        with open(job.output_path, "rb") as f:
+            st.download_button("📥 Download Processed Video", f, file_name="road_damage_output.mp4", mime="video/mp4")
+    if job.export_path:
+        export_format = Path(job.export_path).suffix.lstrip('.')
+        with open(job.export_path, "rb") as f:
+            st.download_button("📥 Download Detections", f, file_name=f"road_damage_detections.{export_format}", mime=EXPORT_MIME_TYPES[export_format])
+
+def _show_live_progress(job) -> None:
+    """Speed, ETA, running counts and the latest preview frame published by the job's worker."""
+    job_dir = Path(job.output_path).parent
+    snapshot = read_progress(job_dir)
+    if snapshot is None:
+        return
+    columns = st.columns(3)
+    columns[0].metric("Processing FPS", f"{snapshot.fps:.1f}")
+    columns[1].metric("Elapsed", _format_duration(snapshot.elapsed_seconds))
+    columns[2].metric("Remaining", _format_duration(snapshot.eta_seconds) if snapshot.eta_seconds is not None else "–")
+    col1, col2 = st.columns([3, 2])
+    preview_path = job_dir / PREVIEW_FILE
+    if preview_path.exists():
+        col1.image(preview_path.read_bytes(), caption=f"Frame {snapshot.frames_done}", use_column_width=True)
+    counts = snapshot.defects if snapshot.defects is not None else snapshot.detections
+    col2.markdown("**Unique defects so far**" if snapshot.defects is not None else "**Detections so far**")
+    col2.bar_chart(counts)
+
+def _show_geo(geo: dict) -> None:
+    """Geo-deduplicated defects of this survey and how they matched earlier surveys."""
+    st.markdown("### 🗺️ Defect Locations")
+    st.write(f"**{geo['defects']} located defects**: {geo['matched_known']} seen in earlier surveys, {geo['added_new']} new")
+    if geo['untagged_detections']:
+        st.caption(f"{geo['untagged_detections']} detections fell outside the GPS track and were not located.")
+    geojson_path = Path(geo['geojson'])
+    if geojson_path.exists():
+        features = json.loads(geojson_path.read_text())['features']
+        if features:
+            st.map({'lat': [f['geometry']['coordinates'][1] for f in features],
+                    'lon': [f['geometry']['coordinates'][0] for f in features]})
+        st.download_button("📥 Download Defects (GeoJSON)", geojson_path.read_bytes(), file_name="road_damage_defects.geojson",
+                           mime="application/geo+json")
+
+def _show_tracks(tracks) -> None:
+    """Displays unique defect counts and the best crop of the highest-scoring tracks."""
+    st.markdown("### 🧭 Unique Defects")
+    if not tracks:
+        st.info("No defect was tracked across enough frames.")
+        return
+    counts = {}
+    for track in tracks:
+        counts[track['label']] = counts.get(track['label'], 0) + 1
+    st.write(f"**{len(tracks)} unique defects:** " + ", ".join(f"{label}: {count}" for label, count in sorted(counts.items())))
+    best = sorted(tracks, key=lambda track: track['best_score'], reverse=True)[:MAX_TRACK_CROPS]
+    columns = st.columns(min(len(best), 6))
+    for i, track in enumerate(best):
+        with columns[i % len(columns)]:
+            if track.get('crop'):
+                st.image(track['crop'], use_column_width=True)
+            st.caption(f"#{track['track_id']} {track['label']} {track['best_score']:.2f}, frames {track['first_frame']}-{track['last_frame']}")
+
+def _show_throughput(result: dict) -> None:
+    """Displays overall and per-stage throughput of the video engine."""
+    frames, inferred, wall_seconds = result['frames'], result['frames_inferred'], result['wall_seconds']
+    st.write(f"**Throughput:** {frames} frames in {wall_seconds:.1f}s ({frames / wall_seconds if wall_seconds else 0:.1f} effective FPS), "
+             f"{inferred} frames inferred ({inferred / frames if frames else 0:.0%})")
+    columns = st.columns(len(result['stages']))
+    for column, (name, stage) in zip(columns, result['stages'].items()):
+        stage_fps = stage['frames'] / stage['busy_seconds'] if stage['busy_seconds'] else 0.0
+        column.metric(f"{name.capitalize()} FPS", f"{stage_fps:.1f}")
 
 def _format_duration(duration: float) -> str:
     """Formats duration in seconds into a human-readable format."""
@@ -163,6 +296,62 @@ def _format_duration(duration: float) -> str:
 st.sidebar.subheader("Detection Parameters")
 threshold = st.sidebar.slider("Confidence Threshold", 0.0, 1.0, 0.5, 0.05, help="Adjust detection sensitivity")
 
+# Sidebar: Video engine parameters
+st.sidebar.subheader("Video Engine")
+batch_size = st.sidebar.slider("Batch Size", 1, 16, DEFAULT_BATCH_SIZE, help="Frames sent to the model per predict call")
+queue_depth = st.sidebar.slider("Queue Depth", 1, 64, DEFAULT_QUEUE_DEPTH, help="Frames buffered between the decode, inference and encode stages")
+video_backend = st.sidebar.selectbox("Video I/O", VIDEO_BACKENDS, index=VIDEO_BACKENDS.index(DEFAULT_VIDEO_BACKEND),
+                                     help="pyav: threaded FFmpeg decode and browser-playable H.264 with audio; opencv: mp4v")
+decode_scale = st.sidebar.select_slider("Decode resolution", [0.25, 0.5, 0.75, 1.0], value=1.0,
+                                        help="Decode frames at a fraction of the input resolution (output is at this resolution too)")
+crf = DEFAULT_CRF
+preset = DEFAULT_PRESET
+if video_backend == "pyav":
+    crf = st.sidebar.slider("H.264 quality (CRF)", 15, 35, DEFAULT_CRF, help="Lower is better quality and larger files")
+    preset = st.sidebar.selectbox("H.264 preset", ["ultrafast", "superfast", "veryfast", "faster", "fast", "medium"],
+                                  index=2, help="Faster presets encode quicker but produce larger files")
+
+# Sidebar: Annotated output video
+RENDER_OPTIONS = {
+    "Every frame": 1,
+    "Every k-th frame (preview)": None,
+    "None (detections only)": 0,
+}
+render_label = st.sidebar.selectbox("Annotated video", list(RENDER_OPTIONS), help="Drawing and encoding fewer frames speeds up processing; detections are unaffected")
+render_every = RENDER_OPTIONS[render_label]
+if render_every is None:
+    render_every = st.sidebar.slider("Render every k frames", 2, 30, 5)
+
+# Sidebar: Frame sampling
+SAMPLING_OPTIONS = {
+    "Every frame": "all",
+    "Every k-th frame": "stride",
+    "On scene change": "difference",
+}
+sampling_label = st.sidebar.selectbox("Frame Sampling", list(SAMPLING_OPTIONS), help="Skipped frames reuse the boxes of the last inferred frame")
+sampling_mode = SAMPLING_OPTIONS[sampling_label]
+sampling_stride = 1
+diff_threshold = 0.05
+if sampling_mode == "stride":
+    sampling_stride = st.sidebar.slider("Infer every k frames", 2, 30, 5)
+elif sampling_mode == "difference":
+    diff_threshold = st.sidebar.slider("Frame difference threshold", 0.01, 0.30, 0.05, 0.01, help="Mean grayscale change needed to run the model again")
+
+# Sidebar: Sliced inference for high-resolution footage
+tiling = None
+if st.sidebar.checkbox("Sliced inference", help="Predict overlapping full-resolution tiles to keep thin cracks visible"):
+    tiling = TileConfig(
+        tile_size=st.sidebar.slider("Tile size", 320, 1280, 640, 32),
+        overlap=st.sidebar.slider("Tile overlap", 0.0, 0.5, 0.2, 0.05),
+        batch_size=st.sidebar.slider("Tiles per batch", 1, 32, 8),
+    )
+
+# Sidebar: Detection export
+st.sidebar.subheader("Detection Export")
+export_format = st.sidebar.selectbox("Per-frame detections", ["None", *available_export_formats()],
+                                     help="Stream frame index, timestamp, class, score and box of every detection to a file")
+track_defects = st.sidebar.checkbox("Track defects", value=True, help="Follow each defect across frames so it is counted once")
+
 # Main interface
 st.title("🚧 Road Damage Detection - Video 📹")
 st.markdown(
@@ -176,24 +365,44 @@ st.markdown(
 )
 st.markdown('<div class="description-text">Upload a video to detect road damage, including various types of cracks, potholes, and other issues. The system will process the video and annotate detected damage.</div>', unsafe_allow_html=True)
 
-# Video file upload
-st.markdown("### 📤 Upload Video (.mp4)")
-video_file = st.file_uploader("Drag and drop or browse to upload", type=["mp4"], disabled=st.session_state.processing)
-
-if video_file:
-    save_uploaded_file(temp_file_input, video_file)
-
-    if st.button("🚀 Start Detection", disabled=st.session_state.processing):
-        st.session_state.processing = True
-        process_video(temp_file_input, temp_file_output, threshold)
-        st.session_state.processing = False
-
-        # Download link for the processed video
-        with open(temp_file_output, "rb") as f:
-            st.download_button("📥 Download Processed Video", f, file_name="road_damage_output.mp4", mime="video/mp4")
+# Job submitted from this page (or reopened from the URL)
+active_job = job_queue.store.get(_get_job_param()) if _get_job_param() else None
 
-        # Restart option
-        if st.button("🔄 Restart Application"):
-            st.experimental_rerun()
+if active_job is not None:
+    show_job(active_job)
+    if active_job.finished and st.button("🔄 Process Another Video"):
+        _set_job_param(None)
+        _rerun()
 else:
-    st.info("⚠️ Please upload a video file to start processing.")
\ No newline at end of file
+    # Video file upload
+    st.markdown("### 📤 Upload Video (.mp4)")
+    video_file = st.file_uploader("Drag and drop or browse to upload", type=["mp4"])
+    gps_file = st.file_uploader("GPS track (optional)", type=["gpx", "csv"],
+                                help="GPX, or CSV with time, lat and lon columns; detections are located and merged with earlier surveys")
+    gps_offset = 0.0
+    if gps_file:
+        gps_offset = st.number_input("GPS offset (seconds)", value=0.0, step=0.5,
+                                     help="Seconds into the GPS track at which the video starts")
+
+    if video_file:
+        stored_upload = store_uploaded_file(video_file)
+        if st.button("🚀 Start Detection"):
+            settings = {
+                'model_path': MODEL_LOCAL_PATH,
+                'backend': backend,
+                'int8': int8,
+                'threshold': threshold,
+                'batch_size': batch_size,
+                'queue_depth': queue_depth,
+                'sampling': {'mode': sampling_mode, 'stride': sampling_stride, 'diff_threshold': diff_threshold},
+                'tiling': list(tiling) if tiling else None,
+                'track': track_defects,
+                'content_digest': stored_upload.digest,
+                'render_every': render_every,
+                'io': {'backend': video_backend, 'decode_scale': decode_scale, 'preset': preset, 'crf': crf},
+            }
+            job = submit_video(stored_upload, settings, export_format, gps_file, gps_offset)
+            _set_job_param(job.id)
+            _rerun()
+    else:
+        st.info("⚠️ Please upload a video file to start processing.")
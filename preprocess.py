@@ -0,0 +1,64 @@
+from typing import NamedTuple, Tuple
+
+import cv2
+import numpy as np
+
+# Square input size expected by the models
+INPUT_SIZE = 640
+PAD_VALUE = 114
+
+class LetterboxInfo(NamedTuple):
+    """How an original image was placed inside the letterboxed model input."""
+    ratio: float
+    pad_left: int
+    pad_top: int
+    shape: Tuple[int, int]  # original (height, width)
+
+class Letterbox:
+    """Resizes images into a square model input, keeping their aspect ratio.
+
+    Each call writes into one of ``slots`` preallocated buffers (round robin), so a
+    batch of up to ``slots`` images can be prepared without allocating new inputs.
+    A returned buffer is overwritten ``slots`` calls later.
+    """
+
+    def __init__(self, size: int = INPUT_SIZE, slots: int = 1, pad_value: int = PAD_VALUE):
+        self.size = size
+        self.pad_value = pad_value
+        self._buffers = [np.full((size, size, 3), pad_value, dtype=np.uint8) for _ in range(slots)]
+        self._placements = [None] * slots
+        self._next = 0
+
+    @property
+    def slots(self) -> int:
+        return len(self._buffers)
+
+    def __call__(self, image: np.ndarray) -> Tuple[np.ndarray, LetterboxInfo]:
+        height, width = image.shape[:2]
+        ratio = min(self.size / height, self.size / width)
+        new_width, new_height = round(width * ratio), round(height * ratio)
+        pad_left = (self.size - new_width) // 2
+        pad_top = (self.size - new_height) // 2
+
+        slot = self._next
+        self._next = (self._next + 1) % len(self._buffers)
+        buffer = self._buffers[slot]
+        placement = (pad_left, pad_top, new_width, new_height)
+        if self._placements[slot] != placement:
+            # Only repaint the border when the image geometry changes
+            buffer[:] = self.pad_value
+            self._placements[slot] = placement
+
+        interpolation = cv2.INTER_AREA if ratio < 1 else cv2.INTER_LINEAR
+        cv2.resize(image, (new_width, new_height),
+                   dst=buffer[pad_top:pad_top + new_height, pad_left:pad_left + new_width],
+                   interpolation=interpolation)
+        return buffer, LetterboxInfo(ratio, pad_left, pad_top, (height, width))
+
+def scale_boxes(xyxy: np.ndarray, info: LetterboxInfo) -> np.ndarray:
+    """Maps (N, 4) boxes from letterboxed input space back to original image pixels."""
+    boxes = (xyxy - np.array([info.pad_left, info.pad_top, info.pad_left, info.pad_top], dtype=np.float32)) / info.ratio
+    height, width = info.shape
+    np.clip(boxes[:, 0::2], 0, width, out=boxes[:, 0::2])
+    np.clip(boxes[:, 1::2], 0, height, out=boxes[:, 1::2])
+    return boxes
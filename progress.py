@@ -0,0 +1,134 @@
+"""Rate-limited progress and live preview for long video jobs.
+
+``ProgressReporter`` is a ``VideoEngine`` sink. Every frame only adds its detections
+to the running per-class counts; at most once per ``interval`` seconds of wall-clock
+time it publishes a ``ProgressSnapshot`` (frames done, FPS, ETA, counts) and a
+downscaled, annotated JPEG of the current frame. The cost of reporting therefore
+grows with the job's duration, not with the number of frames, and a viewer polling
+``read_progress`` sees the same constant-size update however long the video is.
+
+Both files are replaced atomically in the job's directory, so the Streamlit page can
+read them from another process while the worker keeps writing.
+"""
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from detection import CLASSES, DetectionBatch, draw_detections
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_INTERVAL = float(os.environ.get("RDD_PREVIEW_INTERVAL", "1.0"))
+PREVIEW_WIDTH = 480
+PREVIEW_QUALITY = 70
+PROGRESS_FILE = "progress.json"
+PREVIEW_FILE = "preview.jpg"
+
+class ProgressSnapshot(NamedTuple):
+    frames_done: int
+    frame_count: int
+    elapsed_seconds: float
+    fps: float                              # over the last reporting interval
+    eta_seconds: Optional[float]
+    detections: Dict[str, int]              # boxes per class, summed over frames
+    defects: Optional[Dict[str, int]]       # finished tracks per class, when tracking
+
+    @property
+    def progress(self) -> float:
+        return min(self.frames_done / self.frame_count, 1.0) if self.frame_count > 0 else 0.0
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    temp_path = path.with_name(f".{path.name}.tmp")
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+class ProgressReporter:
+    """Publishes progress and a preview frame into ``directory`` at most every ``interval`` seconds.
+
+    With a ``tracker`` (a ``DefectTracker`` placed before this reporter in the sinks)
+    the snapshot also carries its per-class count of unique defects.
+    """
+
+    def __init__(self, directory: Path, frame_count: int, interval: float = PREVIEW_INTERVAL,
+                 preview_width: int = PREVIEW_WIDTH, tracker=None):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.frame_count = frame_count
+        self.interval = interval
+        self.preview_width = preview_width
+        self.tracker = tracker
+        self.counts = np.zeros(len(CLASSES), dtype=np.int64)
+        self.frames_done = 0
+        self._start = time.monotonic()
+        self._last_time = self._start
+        self._last_frames = 0
+        self._fps = 0.0
+
+    @property
+    def progress_path(self) -> Path:
+        return self.directory / PROGRESS_FILE
+
+    @property
+    def preview_path(self) -> Path:
+        return self.directory / PREVIEW_FILE
+
+    def write(self, frame_idx: int, frame: np.ndarray, detections: DetectionBatch) -> None:
+        self.counts += np.bincount(detections.class_id, minlength=len(CLASSES))
+        self.frames_done = frame_idx + 1
+        now = time.monotonic()
+        if now - self._last_time >= self.interval:
+            self._publish(now, frame, detections)
+
+    def close(self) -> None:
+        """Publishes the final counts (the last preview is kept)."""
+        self._publish(time.monotonic())
+
+    def _publish(self, now: float, frame: Optional[np.ndarray] = None, detections: Optional[DetectionBatch] = None) -> None:
+        if now > self._last_time:
+            self._fps = (self.frames_done - self._last_frames) / (now - self._last_time)
+        self._last_time, self._last_frames = now, self.frames_done
+        try:
+            if frame is not None:
+                self._write_preview(frame, detections)
+            _write_atomic(self.progress_path, json.dumps(self.snapshot(now)._asdict()).encode())
+        except OSError as e:
+            logger.warning("Failed to publish progress to %s: %s", self.directory, e)
+
+    def snapshot(self, now: Optional[float] = None) -> ProgressSnapshot:
+        now = time.monotonic() if now is None else now
+        remaining = self.frame_count - self.frames_done
+        eta = remaining / self._fps if self._fps > 0 and self.frame_count > 0 else None
+        return ProgressSnapshot(
+            frames_done=self.frames_done,
+            frame_count=self.frame_count,
+            elapsed_seconds=now - self._start,
+            fps=self._fps,
+            eta_seconds=max(eta, 0.0) if eta is not None else None,
+            detections={label: int(count) for label, count in zip(CLASSES, self.counts)},
+            defects=self.tracker.counts() if self.tracker is not None else None,
+        )
+
+    def _write_preview(self, frame: np.ndarray, detections: DetectionBatch) -> None:
+        """Downscales first and draws on the small copy, so the full frame is never copied."""
+        scale = min(self.preview_width / frame.shape[1], 1.0)
+        size = (max(round(frame.shape[1] * scale), 1), max(round(frame.shape[0] * scale), 1))
+        preview = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        scaled = DetectionBatch(detections.class_id, detections.score, detections.xyxy * scale, detections.frame_index)
+        ok, encoded = cv2.imencode('.jpg', draw_detections(preview, scaled), [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_QUALITY])
+        if ok:
+            _write_atomic(self.preview_path, encoded.tobytes())
+
+def read_progress(directory: Path) -> Optional[ProgressSnapshot]:
+    """The last published snapshot in ``directory``, or None if there is none yet."""
+    try:
+        with open(Path(directory) / PROGRESS_FILE) as f:
+            return ProgressSnapshot(**json.load(f))
+    except (OSError, ValueError, TypeError):
+        return None
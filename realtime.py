@@ -0,0 +1,208 @@
+"""Live detection with bounded latency.
+
+``LatestFrameDetector`` runs the model on a background thread that always takes the
+newest submitted frame; frames that arrive while the model is busy replace each other
+and are dropped, so detections are never more than about one inference behind the
+live picture however slow the CPU is. Every displayed frame is overlaid with the most
+recent detections.
+
+``StreamReader`` reads an RTSP/HTTP stream or a video file on its own thread and
+likewise keeps only the newest frame (files are paced at their native frame rate to
+behave like a live stream).
+"""
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+from detection import DetectionBatch, draw_detections
+from metrics import get_metrics
+from preprocess import Letterbox
+
+logger = logging.getLogger(__name__)
+
+# Samples used for the rolling FPS and latency figures
+STATS_WINDOW = 60
+
+class RealtimeStats(NamedTuple):
+    frames_submitted: int
+    frames_inferred: int
+    frames_dropped: int
+    inference_fps: float
+    inference_ms: float
+    latency_ms: float         # capture -> displayed with overlay
+    detection_age_ms: float   # how old the frame behind the shown detections is
+
+def _mean(values) -> float:
+    return float(np.mean(values)) if values else 0.0
+
+class LatestFrameDetector:
+    """Runs ``model`` on the newest submitted frame on a background thread."""
+
+    def __init__(self, model, threshold: float = 0.5):
+        self.model = model
+        self.threshold = threshold
+        self._letterbox = Letterbox()
+        self._condition = threading.Condition()
+        self._pending: Optional[Tuple[np.ndarray, float]] = None
+        self._detections = DetectionBatch.empty()
+        self._detections_captured_at = 0.0
+        self._submitted = 0
+        self._inferred = 0
+        self._dropped = 0
+        self._inference_times = deque(maxlen=STATS_WINDOW)
+        self._inference_done = deque(maxlen=STATS_WINDOW)
+        self._latencies = deque(maxlen=STATS_WINDOW)
+        self._ages = deque(maxlen=STATS_WINDOW)
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="realtime-inference", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray, captured_at: Optional[float] = None) -> None:
+        """Offers a frame to the model, replacing any frame it has not started on yet.
+
+        The frame must not be modified afterwards (``process`` draws on a copy).
+        """
+        with self._condition:
+            if self._pending is not None:
+                self._dropped += 1
+            self._pending = (frame, captured_at if captured_at is not None else time.perf_counter())
+            self._submitted += 1
+            self._condition.notify()
+
+    def latest(self) -> Tuple[DetectionBatch, float]:
+        """Most recent detections and the capture time of the frame they came from."""
+        with self._condition:
+            return self._detections, self._detections_captured_at
+
+    def process(self, frame: np.ndarray, captured_at: Optional[float] = None) -> np.ndarray:
+        """Submits ``frame`` and returns a copy overlaid with the most recent detections."""
+        captured_at = captured_at if captured_at is not None else time.perf_counter()
+        self.submit(frame, captured_at)
+        detections, detections_captured_at = self.latest()
+        output = draw_detections(frame.copy(), detections)
+        now = time.perf_counter()
+        with self._condition:
+            self._latencies.append(now - captured_at)
+            if detections_captured_at:
+                self._ages.append(now - detections_captured_at)
+        return output
+
+    def stats(self) -> RealtimeStats:
+        with self._condition:
+            done = list(self._inference_done)
+            fps = (len(done) - 1) / (done[-1] - done[0]) if len(done) > 1 and done[-1] > done[0] else 0.0
+            return RealtimeStats(self._submitted, self._inferred, self._dropped, fps,
+                                 _mean(self._inference_times) * 1000, _mean(self._latencies) * 1000,
+                                 _mean(self._ages) * 1000)
+
+    def stop(self, wait: bool = True) -> None:
+        """Ends the inference thread; with ``wait=False`` it is only told to (safe in finalizers)."""
+        with self._condition:
+            self._running = False
+            self._pending = None
+            self._condition.notify()
+        if wait and threading.current_thread() is not self._thread:
+            self._thread.join(timeout=5)
+
+    def _run(self) -> None:
+        metrics = get_metrics()
+        while True:
+            with self._condition:
+                while self._pending is None and self._running:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                frame, captured_at = self._pending
+                self._pending = None
+            try:
+                t0 = time.perf_counter()
+                model_input, info = self._letterbox(frame)
+                results = self.model.predict(model_input, conf=self.threshold, verbose=False)
+                detections = DetectionBatch.from_result(results[0], letterbox_info=info)
+                t1 = time.perf_counter()
+            except Exception:
+                logger.exception("Realtime inference failed")
+                continue
+            metrics.observe("realtime.inference", t1 - t0)
+            with self._condition:
+                self._detections = detections
+                self._detections_captured_at = captured_at
+                self._inferred += 1
+                self._inference_times.append(t1 - t0)
+                self._inference_done.append(t1)
+
+class DetectorHandle:
+    """Owns a ``LatestFrameDetector`` for one Streamlit session and stops it with the session.
+
+    Streamlit has no session-end callback, but a closed session's state is garbage
+    collected. The detector cannot be that state itself (its running thread keeps it
+    alive), so the session keeps this handle, whose finalizer stops the thread.
+    """
+
+    def __init__(self, detector: LatestFrameDetector):
+        self.detector = detector
+        self._finalizer = weakref.finalize(self, detector.stop, False)
+
+    def close(self) -> None:
+        self._finalizer()
+
+class StreamReader:
+    """Reads frames on a background thread, keeping only the newest one."""
+
+    def __init__(self, source: Union[str, Path], loop: bool = False):
+        self.source = str(source)
+        self._capture = cv2.VideoCapture(self.source)
+        if not self._capture.isOpened():
+            raise IOError(f"Cannot open stream: {self.source}")
+        self.is_file = Path(self.source).is_file()
+        fps = self._capture.get(cv2.CAP_PROP_FPS)
+        # Files are paced like a live stream; live sources deliver at their own rate
+        self._frame_interval = 1 / fps if self.is_file and fps and fps > 0 else 0.0
+        self.loop = loop and self.is_file
+        self._lock = threading.Lock()
+        self._frame: Optional[np.ndarray] = None
+        self._captured_at = 0.0
+        self._index = -1
+        self._returned_index = -1
+        self.finished = False
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="stream-reader", daemon=True)
+        self._thread.start()
+
+    def read_latest(self) -> Optional[Tuple[np.ndarray, float]]:
+        """Newest frame not returned before, with its capture time, or None."""
+        with self._lock:
+            if self._frame is None or self._index == self._returned_index:
+                return None
+            self._returned_index = self._index
+            return self._frame, self._captured_at
+
+    def stop(self) -> None:
+        self._running = False
+        self._thread.join(timeout=5)
+        self._capture.release()
+
+    def _run(self) -> None:
+        next_time = time.perf_counter()
+        while self._running:
+            ret, frame = self._capture.read()
+            if not ret:
+                if self.loop:
+                    self._capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                self.finished = True
+                return
+            captured_at = time.perf_counter()
+            with self._lock:
+                self._frame, self._captured_at = frame, captured_at
+                self._index += 1
+            if self._frame_interval:
+                next_time = max(next_time + self._frame_interval, captured_at - self._frame_interval)
+                time.sleep(max(next_time - time.perf_counter(), 0))
@@ -0,0 +1,88 @@
+"""Fast box and label drawing onto full-resolution frames.
+
+Labels are composed from cached sprites: one per class name and one per score glyph
+(``0``-``9`` and ``.``), rendered once per class color and line size. Drawing a
+detection is then one ``cv2.rectangle`` on the frame plus a few small array copies
+into it, so nothing frame-sized is allocated and no text is rasterized per frame.
+"""
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+TEXT_COLOR = (255, 255, 255)
+SCORE_GLYPHS = "0123456789."
+
+class Renderer:
+    """Draws detections in place with a fixed color per class.
+
+    ``colors`` are in the channel order of the frames that will be drawn on.
+    """
+
+    def __init__(self, labels: Sequence[str], colors: Sequence[Tuple[int, int, int]]):
+        self.labels = list(labels)
+        self.colors = [tuple(int(c) for c in color) for color in colors]
+        # thickness -> (label sprites per class, glyph sprites per class)
+        self._sprites: Dict[int, Tuple[List[np.ndarray], List[Dict[str, np.ndarray]]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def thickness_for(shape: Tuple[int, ...]) -> int:
+        """Line width scaled to the image size."""
+        return max(round(sum(shape[:2]) / 2 * 0.003), 2)
+
+    def _render_text(self, text: str, color: Tuple[int, int, int], font_scale: float, text_thickness: int,
+                     height: int, baseline_y: int) -> np.ndarray:
+        (width, _), _ = cv2.getTextSize(text, FONT, font_scale, text_thickness)
+        sprite = np.empty((height, max(width, 1), 3), np.uint8)
+        sprite[:] = color
+        cv2.putText(sprite, text, (0, baseline_y), FONT, font_scale, TEXT_COLOR, text_thickness, lineType=cv2.LINE_AA)
+        return sprite
+
+    def _sprites_for(self, thickness: int) -> Tuple[List[np.ndarray], List[Dict[str, np.ndarray]]]:
+        sprites = self._sprites.get(thickness)
+        if sprites is not None:
+            return sprites
+        font_scale = thickness / 3
+        text_thickness = max(thickness - 1, 1)
+        (_, text_height), _ = cv2.getTextSize("0", FONT, font_scale, text_thickness)
+        height, baseline_y = text_height + 3, text_height + 1
+        labels = [self._render_text(f"{label} ", color, font_scale, text_thickness, height, baseline_y)
+                  for label, color in zip(self.labels, self.colors)]
+        glyphs = [{glyph: self._render_text(glyph, color, font_scale, text_thickness, height, baseline_y)
+                   for glyph in SCORE_GLYPHS} for color in self.colors]
+        with self._lock:
+            sprites = self._sprites.setdefault(thickness, (labels, glyphs))
+        return sprites
+
+    @staticmethod
+    def _blit(image: np.ndarray, sprite: np.ndarray, x: int, y: int) -> None:
+        """Copies ``sprite`` into ``image`` at (x, y), clipped to the image bounds."""
+        height, width = sprite.shape[:2]
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, image.shape[1]), min(y + height, image.shape[0])
+        if x0 < x1 and y0 < y1:
+            image[y0:y1, x0:x1] = sprite[y0 - y:y1 - y, x0 - x:x1 - x]
+
+    def draw(self, image: np.ndarray, detections) -> np.ndarray:
+        """Draws boxes and ``"<label> <score>"`` tags onto ``image`` in place and returns it."""
+        if not len(detections):
+            return image
+        thickness = self.thickness_for(image.shape)
+        labels, glyphs = self._sprites_for(thickness)
+        boxes = detections.xyxy.astype(int).tolist()
+        for class_id, score, (x1, y1, x2, y2) in zip(detections.class_id.tolist(), detections.score.tolist(), boxes):
+            cv2.rectangle(image, (x1, y1), (x2, y2), self.colors[class_id], thickness)
+
+            label = labels[class_id]
+            height = label.shape[0]
+            top = y1 - height if y1 - height >= 0 else y1
+            self._blit(image, label, x1, top)
+            x = x1 + label.shape[1]
+            for glyph in f"{score:.2f}":
+                sprite = glyphs[class_id][glyph]
+                self._blit(image, sprite, x, top)
+                x += sprite.shape[1]
+        return image
@@ -0,0 +1,175 @@
+"""Cache of raw detections keyed by input content, model and inference settings.
+
+Detections are cached at a low floor confidence (``FLOOR_CONFIDENCE``) so any higher
+threshold can be served by filtering the cached rows, without running the model
+again. Filtering after NMS gives the same boxes as predicting at the higher
+threshold, because a box can only be suppressed by a higher-scoring one.
+
+Two tiers: an in-memory LRU bounded by ``RDD_CACHE_MEMORY_MB`` and a directory of
+``.npz`` files bounded by ``RDD_CACHE_DISK_MB`` (oldest used first), shared by all
+processes on the machine.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+import numpy as np
+
+from detection import DetectionBatch
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.environ.get("RDD_CACHE_DIR", "temp/result_cache"))
+MEMORY_LIMIT_BYTES = int(float(os.environ.get("RDD_CACHE_MEMORY_MB", "256")) * 1024 * 1024)
+DISK_LIMIT_BYTES = int(float(os.environ.get("RDD_CACHE_DISK_MB", "2048")) * 1024 * 1024)
+FLOOR_CONFIDENCE = float(os.environ.get("RDD_CACHE_FLOOR", "0.05"))
+
+class CacheStats(NamedTuple):
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    memory_entries: int
+    memory_bytes: int
+    disk_bytes: int
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+def cache_key(content_digest: str, model_digest: str, settings: Optional[dict] = None) -> str:
+    """Key for one input, model and the settings that change the raw detections."""
+    payload = json.dumps([content_digest, model_digest, settings or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _batch_bytes(batch: DetectionBatch) -> int:
+    return (batch.class_id.nbytes + batch.score.nbytes + batch.xyxy.nbytes + batch.frame_index.nbytes
+            + batch.timestamp.nbytes)
+
+class ResultCache:
+    def __init__(self, directory: Path = CACHE_DIR, memory_limit: int = MEMORY_LIMIT_BYTES,
+                 disk_limit: int = DISK_LIMIT_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._memory: "OrderedDict[str, DetectionBatch]" = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = sum(path.stat().st_size for path in self.directory.glob('*/*.npz'))
+        self._lock = threading.Lock()
+        self._memory_hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.npz"
+
+    def get(self, key: str) -> Optional[DetectionBatch]:
+        with self._lock:
+            batch = self._memory.get(key)
+            if batch is not None:
+                self._memory.move_to_end(key)
+                self._memory_hits += 1
+                return batch
+
+        path = self._path(key)
+        try:
+            with np.load(path) as archive:
+                batch = DetectionBatch(archive['class_id'], archive['score'], archive['xyxy'], archive['frame_index'])
+            os.utime(path)
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._disk_hits += 1
+        self._remember(key, batch)
+        return batch
+
+    def put(self, key: str, batch: DetectionBatch) -> None:
+        self._remember(key, batch)
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, temp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, class_id=batch.class_id, score=batch.score, xyxy=batch.xyxy, frame_index=batch.frame_index)
+            size = os.path.getsize(temp_name)
+            os.replace(temp_name, path)
+        except OSError as e:
+            logger.warning("Failed to write result cache entry %s: %s", path, e)
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+            return
+        with self._lock:
+            self._disk_bytes += size
+            over_limit = self._disk_bytes > self.disk_limit
+        if over_limit:
+            self._evict_disk()
+
+    def get_or_compute(self, key: str, compute: Callable[[], DetectionBatch]) -> DetectionBatch:
+        """Returns the cached detections for ``key``, computing and storing them on a miss."""
+        batch = self.get(key)
+        if batch is None:
+            batch = compute()
+            self.put(key, batch)
+        return batch
+
+    def _remember(self, key: str, batch: DetectionBatch) -> None:
+        size = _batch_bytes(batch)
+        if size > self.memory_limit:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= _batch_bytes(previous)
+            self._memory[key] = batch
+            self._memory_bytes += size
+            while self._memory_bytes > self.memory_limit:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= _batch_bytes(evicted)
+
+    def _evict_disk(self) -> None:
+        """Removes least recently used files until the directory is back under its limit."""
+        files = []
+        for path in self.directory.glob('*/*.npz'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.disk_limit * 0.9:
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return CacheStats(self._memory_hits, self._disk_hits, self._misses, len(self._memory),
+                              self._memory_bytes, self._disk_bytes)
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache() -> ResultCache:
+    """Process-wide result cache."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
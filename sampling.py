@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+
+# Sampling modes understood by FrameSampler
+SAMPLING_MODES = ("all", "stride", "difference")
+
+# Size of the grayscale thumbnail compared between frames
+DIFF_THUMBNAIL_SIZE = (64, 36)
+
+class FrameSampler:
+    """Decides which frames of a video go through the model.
+
+    ``all`` infers every frame, ``stride`` every ``stride``-th frame and ``difference``
+    only frames whose downscaled grayscale thumbnail differs from the last inferred
+    frame by more than ``diff_threshold`` (mean absolute delta, 0-1). ``max_gap`` forces
+    a refresh in ``difference`` mode after that many skipped frames. The first frame is
+    always inferred so skipped frames always have detections to carry forward.
+    """
+
+    def __init__(self, mode: str = "all", stride: int = 1, diff_threshold: float = 0.05, max_gap: int = 30):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode: {mode}")
+        if stride < 1:
+            raise ValueError("stride must be at least 1")
+        self.mode = mode
+        self.stride = stride
+        self.diff_threshold = diff_threshold
+        self.max_gap = max_gap
+        self.frames_seen = 0
+        self.frames_inferred = 0
+        self._last_inferred_idx = None
+        self._last_thumbnail = None
+
+    @property
+    def inferred_fraction(self) -> float:
+        return self.frames_inferred / self.frames_seen if self.frames_seen else 0.0
+
+    def should_infer(self, frame_idx: int, frame: np.ndarray) -> bool:
+        """Returns True if ``frame`` should be sent to the model."""
+        self.frames_seen += 1
+        thumbnail = self._thumbnail(frame) if self.mode == "difference" else None
+        if self.mode == "all" or self._last_inferred_idx is None:
+            infer = True
+        elif self.mode == "stride":
+            infer = frame_idx - self._last_inferred_idx >= self.stride
+        else:
+            infer = (frame_idx - self._last_inferred_idx >= self.max_gap
+                     or self._difference(thumbnail) > self.diff_threshold)
+
+        if infer:
+            self.frames_inferred += 1
+            self._last_inferred_idx = frame_idx
+            self._last_thumbnail = thumbnail
+        return infer
+
+    def _difference(self, thumbnail: np.ndarray) -> float:
+        """Mean absolute grayscale delta between a thumbnail and the last inferred frame's."""
+        delta = cv2.absdiff(thumbnail, self._last_thumbnail)
+        return float(delta.mean()) / 255.0
+
+    @staticmethod
+    def _thumbnail(frame: np.ndarray) -> np.ndarray:
+        small = cv2.resize(frame, DIFF_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
@@ -0,0 +1,124 @@
+"""Import-time profile of the app's entry points, to track startup cost across releases.
+
+For ``Home.py`` and every page the module-level imports are executed in a fresh
+interpreter with ``python -X importtime`` (several runs, median reported). Import
+time is broken down by top-level package (self time, so each package is counted
+once) and any of the heavy packages that should only load on first inference or
+download (``HEAVY_PACKAGES``) are flagged if a page pulls them in at startup.
+Imports that fail (e.g. an optional dependency that is not installed) are listed
+rather than aborting the profile.
+
+Examples:
+    python startup_profile.py --output startup.json
+    python startup_profile.py --compare before.json after.json
+"""
+import argparse
+import ast
+import json
+import platform
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+ROOT = Path(__file__).parent
+HEAVY_PACKAGES = ("torch", "ultralytics", "boto3", "botocore", "requests", "onnxruntime", "openvino", "av")
+TOP_PACKAGES = 10
+
+_CHILD = """
+import json, sys, time
+missing = []
+start = time.perf_counter()
+for statement in json.loads(sys.argv[1]):
+    try:
+        exec(statement, {})
+    except ImportError as e:
+        missing.append(e.name or str(e))
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'missing': missing, 'modules': sorted(sys.modules)}))
+"""
+
+def entry_points() -> List[Path]:
+    return [ROOT / "Home.py"] + sorted((ROOT / "pages").glob("*.py"))
+
+def module_imports(path: Path) -> List[str]:
+    """Source of the module-level import statements of a script."""
+    source = path.read_text()
+    tree = ast.parse(source)
+    return [ast.get_source_segment(source, node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+def parse_importtime(stderr: str) -> Dict[str, float]:
+    """Self import time in seconds per top-level package from ``-X importtime`` output."""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1e6
+    return packages
+
+def profile(path: Path, runs: int) -> dict:
+    statements = module_imports(path)
+    samples, packages = [], defaultdict(list)
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD, json.dumps(statements)],
+                                   cwd=ROOT, capture_output=True, text=True, check=True)
+        run = json.loads(completed.stdout.strip().splitlines()[-1])
+        samples.append(run['seconds'])
+        for name, seconds in parse_importtime(completed.stderr).items():
+            packages[name].append(seconds)
+    breakdown = {name: statistics.median(values) for name, values in packages.items()}
+    top = sorted(breakdown.items(), key=lambda item: item[1], reverse=True)[:TOP_PACKAGES]
+    loaded = {module.split(".")[0] for module in run['modules']}
+    return {
+        'import_seconds': statistics.median(samples),
+        'packages': {name: round(seconds, 4) for name, seconds in top},
+        'heavy': sorted(loaded & set(HEAVY_PACKAGES)),
+        'missing': run['missing'],
+    }
+
+def report(results: Dict[str, dict]) -> None:
+    for name, result in results.items():
+        print(f"{name}: {result['import_seconds'] * 1000:.0f} ms")
+        for package, seconds in result['packages'].items():
+            print(f"    {package:<24} {seconds * 1000:8.1f} ms")
+        if result['heavy']:
+            print(f"    heavy packages imported at startup: {', '.join(result['heavy'])}")
+        if result['missing']:
+            print(f"    not installed (not measured): {', '.join(result['missing'])}")
+
+def compare(before_path: str, after_path: str) -> None:
+    with open(before_path) as f:
+        before = json.load(f)['results']
+    with open(after_path) as f:
+        after = json.load(f)['results']
+    print(f"{'entry point':<36} {'before ms':>10} {'after ms':>10} {'change':>8}")
+    for name in sorted(set(before) | set(after)):
+        old = before.get(name, {}).get('import_seconds')
+        new = after.get(name, {}).get('import_seconds')
+        change = f"{(new - old) / old:+.0%}" if old and new else ""
+        print(f"{name:<36} {old * 1000 if old else float('nan'):>10.0f} {new * 1000 if new else float('nan'):>10.0f} {change:>8}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure import time of the app's entry points.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per entry point (median is reported)")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="Compare two result files and exit")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = {str(path.relative_to(ROOT)): profile(path, args.runs) for path in entry_points()}
+    report(results)
+    if args.output:
+        environment = {'python': platform.python_version(), 'platform': platform.platform()}
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment, 'results': results}, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Backend availability, and parity of the exported ONNX model with PyTorch on a small random
+YOLOv8n (no download needed; skipped without onnxruntime, torch and ultralytics)."""
+import cv2
+import numpy as np
+import pytest
+
+import backends
+from backends import available_backends, check_parity
+from benchmark import SEED, build_model, synthetic_frame
+from preprocess import Letterbox
+
+IMAGES = 4
+# Added to the class logits so the random model produces a few confident boxes per image
+CLASS_BIAS_SHIFT = 4.0
+
+def test_only_installed_backends_are_available(monkeypatch):
+    installed = {"torch", "onnxruntime"}
+    monkeypatch.setattr(backends.importlib.util, "find_spec", lambda name: object() if name in installed else None)
+
+    # ONNX export also needs the onnx package
+    assert available_backends() == ["torch"]
+    installed.add("onnx")
+    assert available_backends() == ["torch", "onnx"]
+
+def test_unavailable_backend_is_refused(monkeypatch):
+    monkeypatch.setattr(backends, "available_backends", lambda: ["torch"])
+
+    with pytest.raises(ImportError, match="openvino"):
+        backends.load_model("model.pt", "openvino")
+
+@pytest.fixture(scope="module")
+def torch():
+    for package in ("onnxruntime", "onnx", "ultralytics"):
+        pytest.importorskip(package)
+    return pytest.importorskip("torch")
+
+@pytest.fixture(scope="module")
+def images(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("images")
+    rng = np.random.default_rng(SEED)
+    paths = []
+    for t in range(IMAGES):
+        path = directory / f"road_{t}.png"
+        cv2.imwrite(str(path), synthetic_frame(rng, 1280, 720, t))
+        paths.append(str(path))
+    return paths
+
+@pytest.fixture(scope="module")
+def weights(torch, images, tmp_path_factory):
+    """Random weights whose detections have distinct scores.
+
+    A freshly initialized network's activations vanish before the head, so every box
+    would get the same score; BatchNorm statistics are calibrated on the test images first.
+    """
+    model = build_model(None)
+    letterbox = Letterbox()
+    batch = np.stack([letterbox(cv2.imread(path))[0][..., ::-1] for path in images])
+    inputs = torch.from_numpy(batch.copy()).permute(0, 3, 1, 2).float() / 255
+    for module in model.model.modules():
+        if isinstance(module, torch.nn.BatchNorm2d):
+            module.reset_running_stats()
+            module.momentum = None
+    model.model.train()
+    with torch.no_grad():
+        model.model(inputs)
+        for branch in model.model.model[-1].cv3:
+            branch[-1].bias += CLASS_BIAS_SHIFT
+    model.model.eval()
+
+    path = tmp_path_factory.mktemp("weights") / "random.pt"
+    model.save(str(path))
+    return str(path)
+
+def test_onnx_matches_torch(weights, images):
+    report = check_parity(weights, "onnx", images=images)
+
+    assert report.images == IMAGES
+    assert report.reference_detections > 0
+    assert report.passed, report
+    assert report.max_score_diff < 1e-3
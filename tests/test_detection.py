@@ -0,0 +1,54 @@
+import numpy as np
+
+from detection import CLASSES, DetectionBatch, draw_detections
+
+def make_batch(rows, frames=None) -> DetectionBatch:
+    """Batch from (class_id, score, x1, y1, x2, y2) rows."""
+    rows = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    frames = np.zeros(len(rows), np.int64) if frames is None else np.array(frames, np.int64)
+    return DetectionBatch(rows[:, 0].astype(np.int32), rows[:, 1], rows[:, 2:], frames)
+
+def test_filter_by_class_and_score():
+    batch = make_batch([(0, 0.9, 0, 0, 10, 10), (1, 0.4, 0, 0, 10, 10), (2, 0.7, 0, 0, 10, 10)])
+
+    assert batch.filter(min_score=0.5).class_id.tolist() == [0, 2]
+    assert batch.filter(classes=[1, 2]).class_id.tolist() == [1, 2]
+    assert batch.filter(classes=[1], min_score=0.5).class_id.tolist() == []
+    # Nothing removed returns the batch itself
+    assert batch.filter(min_score=0.1) is batch
+
+def test_for_frame_is_a_view():
+    batch = make_batch([(0, 0.9, 0, 0, 1, 1), (1, 0.8, 0, 0, 1, 1), (2, 0.7, 0, 0, 1, 1)], frames=[0, 2, 2])
+
+    frame = batch.for_frame(2)
+    assert frame.class_id.tolist() == [1, 2]
+    assert np.shares_memory(frame.xyxy, batch.xyxy)
+    assert len(batch.for_frame(1)) == 0
+
+def test_concatenate_and_carry_forward():
+    first = make_batch([(0, 0.9, 0, 0, 1, 1)], frames=[0])
+    second = make_batch([(3, 0.6, 2, 2, 4, 4)], frames=[1]).with_frame_index(5)
+
+    combined = DetectionBatch.concatenate([first, second])
+    assert combined.class_id.tolist() == [0, 3]
+    assert combined.frame_index.tolist() == [0, 5]
+    assert len(DetectionBatch.concatenate([])) == 0
+
+def test_records():
+    batch = make_batch([(2, 0.87654, 1.04, 2, 30.26, 40)], frames=[7])
+
+    assert batch.to_records() == [
+        {'frame': 7, 'class_id': 2, 'label': CLASSES[2], 'score': 0.8765, 'box': [1.0, 2.0, 30.3, 40.0]},
+    ]
+    detection, = batch.to_detections()
+    assert detection.label == CLASSES[2]
+    assert detection.box.tolist() == [1, 2, 30, 40]
+
+def test_draw_detections_in_place():
+    image = np.zeros((100, 200, 3), np.uint8)
+    batch = make_batch([(0, 0.9, 20, 30, 120, 90)])
+
+    assert draw_detections(image, batch) is image
+    assert image[60, 20].any() and not image[60, 60].any()
+    # Boxes near the border still draw their label without errors
+    draw_detections(image, make_batch([(5, 0.5, -10, -10, 5, 5)]))
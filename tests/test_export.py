@@ -0,0 +1,39 @@
+import json
+
+import numpy as np
+import pytest
+
+from detection import DetectionBatch
+from export import available_export_formats, load_npz_detections, open_exporter
+
+def frame_batch(frame_index, timestamp=None) -> DetectionBatch:
+    batch = DetectionBatch(np.array([2], np.int32), np.array([0.9], np.float32),
+                           np.array([[10, 20, 30, 40]], np.float32), np.array([frame_index], np.int64))
+    return batch if timestamp is None else batch.with_timestamp(timestamp)
+
+def test_decoder_timestamps_are_exported(tmp_path):
+    path = tmp_path / "detections.jsonl"
+    # A variable frame rate clip: frame 2 comes 0.5 s after frame 1
+    with open_exporter(path, fps=10.0, chunk_rows=2) as exporter:
+        for frame_index, timestamp in [(0, 0.0), (1, 0.1), (2, 0.6)]:
+            exporter.write(frame_index, None, frame_batch(frame_index, timestamp))
+
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [row['timestamp'] for row in rows] == [0.0, 0.1, 0.6]
+    assert exporter.chunks_written == 2
+
+def test_frame_rate_fallback_without_timestamps(tmp_path):
+    path = tmp_path / "detections.npz"
+    with open_exporter(path, fps=25.0) as exporter:
+        exporter.write(50, None, frame_batch(50))
+        exporter.write(51, None, DetectionBatch.empty())
+
+    columns = load_npz_detections(path)
+    assert columns['frame_index'].tolist() == [50]
+    assert columns['timestamp'].tolist() == [2.0]
+    assert columns['x2'].tolist() == [30.0]
+
+def test_unknown_format():
+    assert {"jsonl", "npz"} <= set(available_export_formats())
+    with pytest.raises(ValueError):
+        open_exporter("detections.csv", fps=25.0)
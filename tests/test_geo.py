@@ -0,0 +1,31 @@
+import numpy as np
+
+from detection import DetectionBatch
+from geo import DefectIndex, GeoTagger, GpsTrack, METERS_PER_DEGREE
+
+def detections(class_ids) -> DetectionBatch:
+    count = len(class_ids)
+    return DetectionBatch(np.array(class_ids, np.int32), np.full(count, 0.8, np.float32),
+                          np.zeros((count, 4), np.float32), np.zeros(count, np.int64))
+
+def test_nearby_sightings_merge_per_class():
+    index = DefectIndex(radius_m=3)
+    step = 1 / METERS_PER_DEGREE  # one metre north
+    ids = index.add("survey", [0, step, 10 * step, 0], [0, 0, 0, 0], [2, 2, 2, 1], [0.5, 0.9, 0.7, 0.6])
+
+    assert ids.tolist() == [0, 0, 1, 2]
+    assert index.column('sightings').tolist() == [2, 1, 1]
+    assert index.query(0, 0).tolist() == [0, 2]
+
+def test_geotagger_buffers_sightings_until_close():
+    # Driving north at 1 m/s for 100 s
+    track = GpsTrack(np.arange(101.0), np.arange(101.0) / METERS_PER_DEGREE, np.zeros(101))
+    tagger = GeoTagger(track, fps=1.0, survey="drive", radius_m=3, chunk_rows=4)
+    for second in range(0, 100, 20):
+        tagger.write(second, None, detections([2, 4]))
+    tagger.write(500, None, detections([2]))  # beyond the track
+
+    assert len(tagger.index) == 8  # two full chunks added, the last frame still buffered
+    index = tagger.close()
+    assert len(index) == 10
+    assert tagger.untagged == 1
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from preprocess import PAD_VALUE, Letterbox, scale_boxes
+
+@pytest.mark.parametrize("shape", [(720, 1280), (1080, 608), (300, 300), (2000, 500)])
+def test_letterbox_round_trip(shape):
+    height, width = shape
+    image = np.zeros((height, width, 3), np.uint8)
+    box = np.array([[width * 0.25, height * 0.5, width * 0.75, height * 0.9]], np.float32)
+
+    model_input, info = Letterbox()(image)
+    assert model_input.shape == (640, 640, 3)
+    assert info.shape == (height, width)
+
+    # Map the box into the model input and back
+    in_input = box * info.ratio + np.array([info.pad_left, info.pad_top] * 2, np.float32)
+    np.testing.assert_allclose(scale_boxes(in_input, info), box, atol=1e-3)
+
+def test_scale_boxes_clips_to_image():
+    _, info = Letterbox()(np.zeros((320, 640, 3), np.uint8))
+
+    boxes = scale_boxes(np.array([[-50, 0, 700, 660]], np.float32), info)
+    assert boxes.tolist() == [[0, 0, 640, 320]]
+
+def test_padding_and_slots():
+    letterbox = Letterbox(slots=2)
+    wide = np.full((100, 400, 3), 255, np.uint8)
+
+    first, info = letterbox(wide)
+    second, _ = letterbox(wide)
+    assert first is not second
+    # The image fills the full width, the border above and below is padding
+    assert (first[:info.pad_top] == PAD_VALUE).all()
+    assert (first[info.pad_top:640 - info.pad_top] == 255).all()
+
+    # A square image in the same slot repaints the old border
+    third, _ = letterbox(np.zeros((50, 50, 3), np.uint8))
+    assert third is first
+    assert (third == 0).all()
@@ -0,0 +1,13 @@
+import gc
+
+from realtime import DetectorHandle, LatestFrameDetector
+
+def test_detector_stops_when_its_session_handle_is_collected():
+    detector = LatestFrameDetector(model=None)
+    handle = DetectorHandle(detector)
+    assert detector._thread.is_alive()
+
+    del handle
+    gc.collect()
+    detector._thread.join(timeout=5)
+    assert not detector._thread.is_alive()
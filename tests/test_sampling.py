@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from sampling import FrameSampler
+
+def frames(count, value=0):
+    return [np.full((72, 128, 3), value, np.uint8) for _ in range(count)]
+
+def decisions(sampler, video):
+    return [sampler.should_infer(i, frame) for i, frame in enumerate(video)]
+
+def test_all_infers_every_frame():
+    sampler = FrameSampler("all")
+
+    assert all(decisions(sampler, frames(5)))
+    assert sampler.inferred_fraction == 1.0
+
+def test_stride():
+    sampler = FrameSampler("stride", stride=3)
+
+    assert decisions(sampler, frames(7)) == [True, False, False, True, False, False, True]
+    assert sampler.frames_inferred == 3
+
+def test_difference_skips_static_frames_until_the_scene_changes():
+    sampler = FrameSampler("difference", diff_threshold=0.05, max_gap=100)
+    video = frames(4, 100) + frames(2, 200)
+
+    assert decisions(sampler, video) == [True, False, False, False, True, False]
+
+def test_difference_refreshes_after_max_gap():
+    sampler = FrameSampler("difference", diff_threshold=0.05, max_gap=3)
+
+    assert decisions(sampler, frames(7)) == [True, False, False, True, False, False, True]
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        FrameSampler("sometimes")
+    with pytest.raises(ValueError):
+        FrameSampler("stride", stride=0)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from detection import DetectionBatch
+from tiling import class_aware_nms, tile_windows
+
+def make_batch(rows) -> DetectionBatch:
+    """Batch from (class_id, score, x1, y1, x2, y2) rows."""
+    rows = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return DetectionBatch(rows[:, 0].astype(np.int32), rows[:, 1], rows[:, 2:], np.zeros(len(rows), np.int64))
+
+def test_nms_keeps_best_of_overlapping_same_class():
+    batch = make_batch([
+        (0, 0.6, 0, 0, 100, 100),
+        (0, 0.9, 5, 5, 105, 105),
+        (0, 0.8, 300, 300, 400, 400),
+    ])
+
+    kept = class_aware_nms(batch, iou_threshold=0.5)
+    # Survivors keep their original order
+    assert kept.score.tolist() == np.float32([0.9, 0.8]).tolist()
+
+def test_nms_never_suppresses_across_classes():
+    batch = make_batch([(0, 0.9, 0, 0, 100, 100), (1, 0.5, 0, 0, 100, 100)])
+
+    assert len(class_aware_nms(batch, iou_threshold=0.5)) == 2
+
+def test_nms_threshold():
+    # IoU of these two boxes is 1/3
+    batch = make_batch([(2, 0.9, 0, 0, 100, 100), (2, 0.8, 50, 0, 150, 100)])
+
+    assert len(class_aware_nms(batch, iou_threshold=0.5)) == 2
+    assert len(class_aware_nms(batch, iou_threshold=0.3)) == 1
+
+def test_tile_windows_cover_the_image_with_full_tiles():
+    windows = tile_windows(1080, 1920, tile_size=640, overlap=0.2)
+
+    assert ((windows[:, 2] - windows[:, 0]) == 640).all()
+    assert ((windows[:, 3] - windows[:, 1]) == 640).all()
+    covered = np.zeros((1080, 1920), bool)
+    for x1, y1, x2, y2 in windows:
+        covered[y1:y2, x1:x2] = True
+    assert covered.all()
+
+def test_small_image_is_a_single_window():
+    assert tile_windows(300, 500, tile_size=640, overlap=0.2).tolist() == [[0, 0, 500, 300]]
@@ -0,0 +1,55 @@
+import numpy as np
+
+from detection import CLASSES, DetectionBatch
+from tracker import DefectTracker, greedy_match, iou_matrix
+
+def make_batch(rows, frame=0) -> DetectionBatch:
+    """Batch from (class_id, score, x1, y1, x2, y2) rows."""
+    rows = np.array(rows, dtype=np.float32).reshape(-1, 6)
+    return DetectionBatch(rows[:, 0].astype(np.int32), rows[:, 1], rows[:, 2:], np.full(len(rows), frame, np.int64))
+
+def test_iou_matrix():
+    a = np.array([[0, 0, 10, 10], [20, 20, 30, 30]], np.float32)
+    b = np.array([[0, 0, 10, 10], [5, 0, 15, 10]], np.float32)
+
+    np.testing.assert_allclose(iou_matrix(a, b), [[1, 1 / 3], [0, 0]], atol=1e-6)
+    assert iou_matrix(a, np.empty((0, 4), np.float32)).shape == (2, 0)
+
+def test_greedy_match_prefers_highest_scores():
+    scores = np.array([[0.9, 0.8], [0.85, 0.1]])
+
+    rows, cols = greedy_match(scores, min_score=0.5)
+    assert list(zip(rows.tolist(), cols.tolist())) == [(0, 0)]
+
+def test_moving_defect_is_counted_once():
+    tracker = DefectTracker(high_score=0.5, min_hits=3, max_age=5, keep_crops=False)
+    ids = set()
+    for frame in range(20):
+        # A pothole drifting down the frame as the car drives over it
+        y = 100 + frame * 8
+        assigned = tracker.update(frame, make_batch([(2, 0.8, 200, y, 260, y + 40)], frame))
+        ids.update(assigned.tolist())
+
+    records = tracker.close()
+    assert len(ids) == 1
+    assert len(records) == 1
+    assert records[0].label == CLASSES[2]
+    assert (records[0].first_frame, records[0].last_frame, records[0].hits) == (0, 19, 20)
+
+def test_classes_are_tracked_separately_and_short_tracks_dropped():
+    tracker = DefectTracker(high_score=0.5, min_hits=3, max_age=2, keep_crops=False)
+    for frame in range(6):
+        rows = [(0, 0.9, 10, 10, 60, 60), (1, 0.9, 12, 12, 62, 62)]
+        if frame == 0:
+            rows.append((3, 0.9, 300, 300, 340, 340))  # seen once: noise
+        tracker.update(frame, make_batch(rows, frame))
+
+    tracker.close()
+    assert tracker.counts() == {**{label: 0 for label in CLASSES}, CLASSES[0]: 1, CLASSES[1]: 1}
+
+def test_low_score_detections_only_extend_tracks():
+    tracker = DefectTracker(high_score=0.5, min_hits=1, max_age=5, keep_crops=False)
+
+    assert tracker.update(0, make_batch([(4, 0.3, 0, 0, 50, 50)], 0)).tolist() == [0]
+    track_id, = tracker.update(1, make_batch([(4, 0.9, 0, 0, 50, 50)], 1)).tolist()
+    assert tracker.update(2, make_batch([(4, 0.3, 2, 0, 52, 50)], 2)).tolist() == [track_id]
@@ -0,0 +1,24 @@
+import io
+import os
+
+from upload_store import UploadStore
+
+def test_pinned_uploads_survive_eviction(tmp_path):
+    store = UploadStore(tmp_path / "uploads")
+    streamed = store.put(io.BytesIO(b"streamed video"), ".mp4")
+    idle = store.put(io.BytesIO(b"idle video"), ".mp4")
+    for stored in (streamed, idle):
+        os.utime(stored.path, (0, 0))
+
+    with store.pinned(streamed.path):
+        assert store.evict(max_age=60).removed == 1
+        assert streamed.path.exists() and not idle.path.exists()
+    assert store.evict(max_age=60).removed == 1
+    assert not streamed.path.exists()
+
+def test_same_content_is_stored_once(tmp_path):
+    store = UploadStore(tmp_path / "uploads")
+
+    first = store.put(io.BytesIO(b"video"), ".mp4")
+    second = store.put(io.BytesIO(b"video"), ".mp4")
+    assert (first.path, first.reused, second.reused) == (second.path, False, True)
@@ -0,0 +1,104 @@
+import time
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from detection import DetectionBatch
+from preprocess import Letterbox, LetterboxInfo, INPUT_SIZE
+
+class TileConfig(NamedTuple):
+    tile_size: int = INPUT_SIZE
+    overlap: float = 0.2            # fraction of the tile shared with its neighbour
+    batch_size: int = 8             # tiles per predict call, 0 sends all tiles at once
+    iou_threshold: float = 0.5      # class-aware NMS threshold when merging tiles
+    include_full_image: bool = True # also run the downscaled full image for large defects
+
+class TileTimings(NamedTuple):
+    tiles: int
+    preprocess_seconds: float
+    inference_seconds: float
+    merge_seconds: float
+
+    @property
+    def total_seconds(self) -> float:
+        return self.preprocess_seconds + self.inference_seconds + self.merge_seconds
+
+def tile_windows(height: int, width: int, tile_size: int, overlap: float) -> np.ndarray:
+    """Returns (T, 4) x1, y1, x2, y2 windows covering the image with the given overlap.
+
+    The last row and column are aligned to the image edge so every tile is full size
+    (images smaller than a tile give a single window covering the image).
+    """
+    stride = max(int(tile_size * (1 - overlap)), 1)
+
+    def starts(length: int) -> np.ndarray:
+        if length <= tile_size:
+            return np.array([0])
+        positions = np.arange(0, length - tile_size, stride)
+        return np.append(positions, length - tile_size)
+
+    xs, ys = np.meshgrid(starts(width), starts(height))
+    x1, y1 = xs.ravel(), ys.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile_size, width), np.minimum(y1 + tile_size, height)], axis=1)
+
+def class_aware_nms(detections: DetectionBatch, iou_threshold: float) -> DetectionBatch:
+    """Greedy NMS that only suppresses boxes of the same class."""
+    if len(detections) < 2:
+        return detections
+    # Shift each class into its own coordinate range so classes never overlap
+    offset = detections.class_id[:, None].astype(np.float32) * (detections.xyxy.max() + 1)
+    boxes = detections.xyxy + offset
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-detections.score)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        intersection = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = intersection / (areas[i] + areas[rest] - intersection + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return detections[np.sort(np.array(keep))]
+
+def sliced_predict(model, image: np.ndarray, threshold: float, config: TileConfig = TileConfig(),
+                   frame_index: int = 0, letterbox: Optional[Letterbox] = None) -> Tuple[DetectionBatch, TileTimings]:
+    """Runs the model over overlapping tiles of a full-resolution BGR image.
+
+    Tiles are predicted in batches of ``config.batch_size`` and their boxes are merged
+    with class-aware NMS in original image coordinates. Pass a ``letterbox`` with at
+    least ``config.batch_size`` slots to reuse its buffers across calls.
+    """
+    height, width = image.shape[:2]
+    windows = tile_windows(height, width, config.tile_size, config.overlap)
+    crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in windows]
+    offsets = [(x1, y1) for x1, y1, _, _ in windows]
+    if config.include_full_image and len(windows) > 1:
+        crops.append(image)
+        offsets.append((0, 0))
+
+    batch_size = config.batch_size or len(crops)
+    if letterbox is None or letterbox.slots < batch_size:
+        letterbox = Letterbox(INPUT_SIZE, slots=batch_size)
+    parts = []
+    preprocess_seconds = inference_seconds = 0.0
+    for start in range(0, len(crops), batch_size):
+        t0 = time.perf_counter()
+        inputs, infos = zip(*(letterbox(crop) for crop in crops[start:start + batch_size]))
+        t1 = time.perf_counter()
+        results = model.predict(list(inputs), conf=threshold, verbose=False)
+        for result, info, (x1, y1) in zip(results, infos, offsets[start:start + batch_size]):
+            # Map to the crop, then shift the crop into place in the full image
+            shifted = LetterboxInfo(info.ratio, info.pad_left - x1 * info.ratio, info.pad_top - y1 * info.ratio, (height, width))
+            parts.append(DetectionBatch.from_result(result, frame_index, shifted))
+        t2 = time.perf_counter()
+        preprocess_seconds += t1 - t0
+        inference_seconds += t2 - t1
+
+    t0 = time.perf_counter()
+    detections = class_aware_nms(DetectionBatch.concatenate(parts), config.iou_threshold)
+    merge_seconds = time.perf_counter() - t0
+    return detections, TileTimings(len(crops), preprocess_seconds, inference_seconds, merge_seconds)
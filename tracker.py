@@ -0,0 +1,270 @@
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from detection import CLASSES, DetectionBatch
+
+# Largest side of the stored best crop per track
+MAX_CROP_SIZE = 256
+
+class TrackRecord(NamedTuple):
+    """One physical defect, aggregated over all frames it was tracked in."""
+    track_id: int
+    class_id: int
+    label: str
+    first_frame: int
+    last_frame: int
+    hits: int
+    best_score: float
+    best_frame: int
+    best_box: np.ndarray
+    best_crop: Optional[np.ndarray]
+
+    def to_record(self) -> dict:
+        """JSON-serializable summary without the crop."""
+        return {
+            'track_id': self.track_id,
+            'class_id': self.class_id,
+            'label': self.label,
+            'first_frame': self.first_frame,
+            'last_frame': self.last_frame,
+            'hits': self.hits,
+            'best_score': round(self.best_score, 4),
+            'best_frame': self.best_frame,
+            'best_box': [round(v, 1) for v in self.best_box.tolist()],
+        }
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) xyxy boxes."""
+    if not len(a) or not len(b):
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return intersection / (area_a[:, None] + area_b[None, :] - intersection + 1e-9)
+
+def greedy_match(scores: np.ndarray, min_score: float):
+    """Greedily pairs rows and columns by descending score. Returns (rows, cols)."""
+    rows, cols = [], []
+    if scores.size == 0:
+        return np.array(rows, dtype=int), np.array(cols, dtype=int)
+    used_rows, used_cols = set(), set()
+    for flat in np.argsort(-scores, axis=None):
+        row, col = divmod(int(flat), scores.shape[1])
+        if scores[row, col] < min_score:
+            break
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        rows.append(row)
+        cols.append(col)
+    return np.array(rows, dtype=int), np.array(cols, dtype=int)
+
+def _to_cxcywh(xyxy: np.ndarray) -> np.ndarray:
+    return np.stack([(xyxy[:, 0] + xyxy[:, 2]) / 2, (xyxy[:, 1] + xyxy[:, 3]) / 2,
+                     xyxy[:, 2] - xyxy[:, 0], xyxy[:, 3] - xyxy[:, 1]], axis=1)
+
+def _to_xyxy(cxcywh: np.ndarray) -> np.ndarray:
+    half = cxcywh[:, 2:] / 2
+    return np.concatenate([cxcywh[:, :2] - half, cxcywh[:, :2] + half], axis=1)
+
+class DefectTracker:
+    """ByteTrack-style multi-object tracker that counts each physical defect once.
+
+    Use as a ``VideoEngine`` sink. Every track keeps a constant-velocity Kalman filter
+    per box coordinate (cx, cy, w, h); all track state lives in flat NumPy arrays so a
+    frame costs a handful of vectorized operations. Detections at or above
+    ``high_score`` are matched first, then the remaining low-score detections rescue
+    tracks that would otherwise be lost. Matching is class-aware. A track that misses
+    ``max_age`` frames is finished and, if it was seen in at least ``min_hits`` frames,
+    emitted as a ``TrackRecord`` (also passed to ``on_track``).
+    """
+
+    def __init__(self, high_score: float = 0.5, match_iou: float = 0.3, max_age: int = 30, min_hits: int = 3,
+                 keep_crops: bool = True, on_track: Optional[Callable[[TrackRecord], None]] = None):
+        self.high_score = high_score
+        self.match_iou = match_iou
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.keep_crops = keep_crops
+        self.on_track = on_track
+        self.records: List[TrackRecord] = []
+        self._next_id = 1
+        self._empty()
+
+    def _empty(self) -> None:
+        # Per-track columns
+        self.ids = np.empty(0, np.int64)
+        self.class_id = np.empty(0, np.int32)
+        self.pos = np.empty((0, 4), np.float32)      # cx, cy, w, h
+        self.vel = np.empty((0, 4), np.float32)
+        self.p_pp = np.empty((0, 4), np.float32)     # Kalman covariance terms per coordinate
+        self.p_pv = np.empty((0, 4), np.float32)
+        self.p_vv = np.empty((0, 4), np.float32)
+        self.first_frame = np.empty(0, np.int64)
+        self.last_frame = np.empty(0, np.int64)
+        self.hits = np.empty(0, np.int32)
+        self.best_score = np.empty(0, np.float32)
+        self.best_frame = np.empty(0, np.int64)
+        self.best_box = np.empty((0, 4), np.float32)
+        self.crops: Dict[int, np.ndarray] = {}
+
+    @property
+    def active_tracks(self) -> int:
+        return len(self.ids)
+
+    def counts(self) -> Dict[str, int]:
+        """Number of finished defect tracks per class label."""
+        counts = {label: 0 for label in CLASSES}
+        for record in self.records:
+            counts[record.label] += 1
+        return counts
+
+    def write(self, frame_idx: int, frame: np.ndarray, detections: DetectionBatch) -> None:
+        self.update(frame_idx, detections, frame)
+
+    def update(self, frame_idx: int, detections: DetectionBatch, frame: Optional[np.ndarray] = None) -> np.ndarray:
+        """Advances all tracks by one frame and returns the track id of each detection (0 if unassigned)."""
+        self._predict()
+        assigned = np.zeros(len(detections), dtype=np.int64)
+        unmatched_tracks = np.arange(len(self.ids))
+
+        high = np.flatnonzero(detections.score >= self.high_score)
+        low = np.flatnonzero(detections.score < self.high_score)
+        for candidates in (high, low):
+            if not len(candidates) or not len(unmatched_tracks):
+                continue
+            matched_tracks, matched_dets = self._associate(unmatched_tracks, candidates, detections)
+            if len(matched_tracks):
+                self._update_tracks(matched_tracks, matched_dets, frame_idx, detections, frame)
+                assigned[matched_dets] = self.ids[matched_tracks]
+                unmatched_tracks = np.setdiff1d(unmatched_tracks, matched_tracks)
+
+        # Unmatched confident detections start new tracks
+        new = high[assigned[high] == 0]
+        if len(new):
+            assigned[new] = self._start_tracks(new, frame_idx, detections, frame)
+
+        self._finish(frame_idx - self.last_frame > self.max_age)
+        return assigned
+
+    def close(self) -> List[TrackRecord]:
+        """Finishes all remaining tracks and returns every record."""
+        self._finish(np.ones(len(self.ids), dtype=bool))
+        return self.records
+
+    def _predict(self) -> None:
+        if not len(self.ids):
+            return
+        scale = self.pos[:, 3:4] ** 2
+        self.pos += self.vel
+        np.maximum(self.pos[:, 2:], 1.0, out=self.pos[:, 2:])
+        self.p_pp += 2 * self.p_pv + self.p_vv + (1 / 20) ** 2 * scale
+        self.p_pv += self.p_vv
+        self.p_vv += (1 / 160) ** 2 * scale
+
+    def _associate(self, tracks: np.ndarray, dets: np.ndarray, detections: DetectionBatch):
+        iou = iou_matrix(_to_xyxy(self.pos[tracks]), detections.xyxy[dets])
+        iou[self.class_id[tracks][:, None] != detections.class_id[dets][None, :]] = 0
+        rows, cols = greedy_match(iou, self.match_iou)
+        return tracks[rows], dets[cols]
+
+    def _update_tracks(self, tracks: np.ndarray, dets: np.ndarray, frame_idx: int,
+                       detections: DetectionBatch, frame: Optional[np.ndarray]) -> None:
+        measurement = _to_cxcywh(detections.xyxy[dets])
+        noise = (1 / 20) ** 2 * measurement[:, 3:4] ** 2
+        innovation = measurement - self.pos[tracks]
+        s = self.p_pp[tracks] + noise
+        k_p = self.p_pp[tracks] / s
+        k_v = self.p_pv[tracks] / s
+        self.pos[tracks] += k_p * innovation
+        self.vel[tracks] += k_v * innovation
+        self.p_vv[tracks] -= k_v * self.p_pv[tracks]
+        self.p_pv[tracks] *= 1 - k_p
+        self.p_pp[tracks] *= 1 - k_p
+
+        self.last_frame[tracks] = frame_idx
+        self.hits[tracks] += 1
+        scores = detections.score[dets]
+        better = scores > self.best_score[tracks]
+        for track, det in zip(tracks[better], dets[better]):
+            self.best_score[track] = detections.score[det]
+            self.best_frame[track] = frame_idx
+            self.best_box[track] = detections.xyxy[det]
+            self._keep_crop(int(self.ids[track]), frame, detections.xyxy[det])
+
+    def _start_tracks(self, dets: np.ndarray, frame_idx: int, detections: DetectionBatch,
+                      frame: Optional[np.ndarray]) -> np.ndarray:
+        count = len(dets)
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._next_id += count
+        measurement = _to_cxcywh(detections.xyxy[dets])
+        scale = measurement[:, 3:4] ** 2
+        self.ids = np.concatenate([self.ids, ids])
+        self.class_id = np.concatenate([self.class_id, detections.class_id[dets]])
+        self.pos = np.concatenate([self.pos, measurement.astype(np.float32)])
+        self.vel = np.concatenate([self.vel, np.zeros((count, 4), np.float32)])
+        self.p_pp = np.concatenate([self.p_pp, ((2 / 20) ** 2 * scale).repeat(4, axis=1).astype(np.float32)])
+        self.p_pv = np.concatenate([self.p_pv, np.zeros((count, 4), np.float32)])
+        self.p_vv = np.concatenate([self.p_vv, ((10 / 160) ** 2 * scale).repeat(4, axis=1).astype(np.float32)])
+        self.first_frame = np.concatenate([self.first_frame, np.full(count, frame_idx, np.int64)])
+        self.last_frame = np.concatenate([self.last_frame, np.full(count, frame_idx, np.int64)])
+        self.hits = np.concatenate([self.hits, np.ones(count, np.int32)])
+        self.best_score = np.concatenate([self.best_score, detections.score[dets]])
+        self.best_frame = np.concatenate([self.best_frame, np.full(count, frame_idx, np.int64)])
+        self.best_box = np.concatenate([self.best_box, detections.xyxy[dets]])
+        for track_id, det in zip(ids.tolist(), dets):
+            self._keep_crop(track_id, frame, detections.xyxy[det])
+        return ids
+
+    def _keep_crop(self, track_id: int, frame: Optional[np.ndarray], box: np.ndarray) -> None:
+        if not self.keep_crops or frame is None:
+            return
+        x1, y1, x2, y2 = box.astype(int)
+        crop = frame[max(y1, 0):max(y2, 0), max(x1, 0):max(x2, 0)]
+        if not crop.size:
+            return
+        scale = MAX_CROP_SIZE / max(crop.shape[:2])
+        if scale < 1:
+            crop = cv2.resize(crop, (max(int(crop.shape[1] * scale), 1), max(int(crop.shape[0] * scale), 1)),
+                              interpolation=cv2.INTER_AREA)
+        else:
+            crop = crop.copy()
+        self.crops[track_id] = crop
+
+    def _finish(self, done: np.ndarray) -> None:
+        """Removes finished tracks, emitting records for the confirmed ones."""
+        if not done.any():
+            return
+        for track in np.flatnonzero(done):
+            track_id = int(self.ids[track])
+            crop = self.crops.pop(track_id, None)
+            if self.hits[track] < self.min_hits:
+                continue
+            class_id = int(self.class_id[track])
+            record = TrackRecord(
+                track_id=track_id,
+                class_id=class_id,
+                label=CLASSES[class_id],
+                first_frame=int(self.first_frame[track]),
+                last_frame=int(self.last_frame[track]),
+                hits=int(self.hits[track]),
+                best_score=float(self.best_score[track]),
+                best_frame=int(self.best_frame[track]),
+                best_box=self.best_box[track].copy(),
+                best_crop=crop,
+            )
+            self.records.append(record)
+            if self.on_track:
+                self.on_track(record)
+
+        keep = ~done
+        for name in ("ids", "class_id", "pos", "vel", "p_pp", "p_pv", "p_vv", "first_frame", "last_frame",
+                     "hits", "best_score", "best_frame", "best_box"):
+            setattr(self, name, getattr(self, name)[keep])
@@ -0,0 +1,183 @@
+"""Content-addressed storage for uploaded files and cleanup of processing artifacts.
+
+Uploads are hashed while they are streamed to disk in chunks and stored once under
+their SHA-256 (``temp/uploads/objects/ab/abcdef....mp4``), so the same video uploaded
+twice, or seen again on a Streamlit rerun, is not written again. Jobs reference the
+stored object instead of a copy and write their outputs to their own directory.
+
+``evict`` removes stored uploads and job directories that are older than
+``RDD_STORE_MAX_AGE_HOURS`` and then, oldest first, until the total is below
+``RDD_STORE_MAX_MB``. Paths in use by queued or running jobs are never removed, nor
+are uploads ``pinned`` by a page that is reading them (e.g. a realtime file stream).
+"""
+import contextlib
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path(os.environ.get("RDD_UPLOAD_DIR", "temp/uploads"))
+MAX_STORE_BYTES = int(float(os.environ.get("RDD_STORE_MAX_MB", "20000")) * 1024 * 1024)
+MAX_ARTIFACT_AGE = float(os.environ.get("RDD_STORE_MAX_AGE_HOURS", "24")) * 3600
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Minimum seconds between two background evictions
+EVICTION_INTERVAL = 300
+
+class StoredUpload(NamedTuple):
+    digest: str
+    path: Path
+    size: int
+    reused: bool  # content was already in the store
+
+class EvictionStats(NamedTuple):
+    removed: int
+    freed_bytes: int
+    remaining_bytes: int
+
+def _tree_size_and_mtime(path: Path) -> Tuple[int, float]:
+    """Total size and newest modification time of a file or directory tree."""
+    if path.is_file():
+        stat = path.stat()
+        return stat.st_size, stat.st_mtime
+    size, mtime = 0, path.stat().st_mtime
+    for child in path.rglob('*'):
+        if child.is_file():
+            stat = child.stat()
+            size += stat.st_size
+            mtime = max(mtime, stat.st_mtime)
+    return size, mtime
+
+class UploadStore:
+    def __init__(self, root: Path = UPLOAD_DIR):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self._last_eviction = 0.0
+        self._eviction_lock = threading.Lock()
+        self._pins = Counter()
+        self._pins_lock = threading.Lock()
+
+    def path_for(self, digest: str, suffix: str = "") -> Path:
+        return self.objects_dir / digest[:2] / f"{digest}{suffix}"
+
+    def put(self, file_obj, suffix: str = "") -> StoredUpload:
+        """Streams a binary file object into the store, hashing it on the way."""
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_name = tempfile.mkstemp(dir=self.objects_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if hasattr(file_obj, 'seek'):
+                    file_obj.seek(0)
+                for chunk in iter(lambda: file_obj.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            path = self.path_for(digest.hexdigest(), suffix)
+            if path.exists():
+                # Same content already stored; refresh its age instead of rewriting it
+                os.utime(path)
+                return StoredUpload(digest.hexdigest(), path, size, reused=True)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temp_name, path)
+            return StoredUpload(digest.hexdigest(), path, size, reused=False)
+        finally:
+            if os.path.exists(temp_name):
+                os.remove(temp_name)
+
+    @contextlib.contextmanager
+    def pinned(self, path: Path) -> Iterator[Path]:
+        """Keeps ``path`` from being evicted while the block runs."""
+        path = Path(path).resolve()
+        with self._pins_lock:
+            self._pins[path] += 1
+        try:
+            yield path
+        finally:
+            with self._pins_lock:
+                self._pins[path] -= 1
+                if self._pins[path] <= 0:
+                    del self._pins[path]
+
+    def _entries(self, artifact_dirs: Iterable[Path]) -> List[Tuple[Path, int, float]]:
+        """Evictable units: every stored object and every directory inside ``artifact_dirs``."""
+        entries = []
+        candidates = [path for path in self.objects_dir.glob('*/*') if path.suffix != '.part']
+        for directory in artifact_dirs:
+            if Path(directory).is_dir():
+                candidates.extend(path for path in Path(directory).iterdir() if path.is_dir())
+        for path in candidates:
+            try:
+                entries.append((path, *_tree_size_and_mtime(path)))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def evict(self, artifact_dirs: Iterable[Path] = (), protected: Iterable[Path] = (),
+              max_bytes: int = MAX_STORE_BYTES, max_age: float = MAX_ARTIFACT_AGE) -> EvictionStats:
+        """Removes old uploads and artifact directories by age, then oldest first until under ``max_bytes``."""
+        protected: Set[Path] = {Path(path).resolve() for path in protected}
+        with self._pins_lock:
+            protected.update(self._pins)
+        entries = sorted(self._entries(artifact_dirs), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        removed, freed = 0, 0
+        for path, size, mtime in entries:
+            if now - mtime < max_age and total <= max_bytes:
+                break
+            resolved = path.resolve()
+            if resolved in protected or any(p.is_relative_to(resolved) for p in protected):
+                continue
+            try:
+                shutil.rmtree(path) if path.is_dir() else path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+            freed += size
+            removed += 1
+        if removed:
+            logger.info("Evicted %d uploads/artifacts (%.1f MB), %.1f MB remaining", removed, freed / 1e6, total / 1e6)
+        return EvictionStats(removed, freed, total)
+
+    def evict_async(self, artifact_dirs: Iterable[Path] = (), protected: Callable[[], Iterable[Path]] = tuple) -> bool:
+        """Runs ``evict`` in the background at most every ``EVICTION_INTERVAL`` seconds.
+
+        ``protected`` is called in the background thread, right before evicting.
+        """
+        with self._eviction_lock:
+            if time.monotonic() - self._last_eviction < EVICTION_INTERVAL and self._last_eviction:
+                return False
+            self._last_eviction = time.monotonic()
+        artifact_dirs = list(artifact_dirs)
+
+        def _run():
+            try:
+                self.evict(artifact_dirs, protected())
+            except Exception:
+                logger.exception("Upload store eviction failed")
+
+        threading.Thread(target=_run, name="upload-eviction", daemon=True).start()
+        return True
+
+_upload_store: Optional[UploadStore] = None
+_upload_store_lock = threading.Lock()
+
+def get_upload_store() -> UploadStore:
+    """Process-wide upload store."""
+    global _upload_store
+    if _upload_store is None:
+        with _upload_store_lock:
+            if _upload_store is None:
+                _upload_store = UploadStore()
+    return _upload_store
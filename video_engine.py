@@ -0,0 +1,355 @@
+import logging
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, NamedTuple, Optional, Sequence
+
+import cv2
+
+from detection import DetectionBatch, draw_detections
+from metrics import get_metrics
+from preprocess import Letterbox, INPUT_SIZE
+from sampling import FrameSampler
+from tiling import TileConfig, sliced_predict
+from video_io import VideoIOConfig, open_reader, open_writer
+
+logger = logging.getLogger(__name__)
+
+# Engine defaults
+DEFAULT_BATCH_SIZE = 4
+DEFAULT_QUEUE_DEPTH = 8
+
+# Upper bound on frames held back while a sampled batch fills up
+MAX_PENDING_FRAMES = 64
+
+# Marks the end of the stream on every queue
+_END = object()
+
+class VideoInfo(NamedTuple):
+    width: int
+    height: int
+    fps: float
+    frame_count: int
+
+def probe_video(video_path: Path) -> Optional[VideoInfo]:
+    """Reads the basic properties of a video, or returns None if it cannot be opened."""
+    video_capture = cv2.VideoCapture(str(video_path))
+    if not video_capture.isOpened():
+        return None
+    info = VideoInfo(
+        width=int(video_capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        height=int(video_capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        fps=video_capture.get(cv2.CAP_PROP_FPS),
+        frame_count=int(video_capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+    )
+    video_capture.release()
+    return info
+
+class StageStats:
+    """Frames handled and time spent working (not waiting on queues) by one stage."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.frames = 0
+        self.busy_seconds = 0.0
+
+    @property
+    def fps(self) -> float:
+        return self.frames / self.busy_seconds if self.busy_seconds > 0 else 0.0
+
+class EngineStats(NamedTuple):
+    frames: int
+    frames_inferred: int
+    wall_seconds: float
+    stages: Dict[str, StageStats]
+
+    @property
+    def fps(self) -> float:
+        """Effective frames per second over the whole run, skipped frames included."""
+        return self.frames / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    @property
+    def inferred_fraction(self) -> float:
+        return self.frames_inferred / self.frames if self.frames else 0.0
+
+class VideoEngine:
+    """Runs decode, batched inference and encode on separate threads joined by bounded queues.
+
+    Frames flow reader -> inference -> writer in index order, so the output video keeps
+    the input frame order. Each stage records its own throughput in ``EngineStats``.
+    With a ``FrameSampler`` only the sampled frames are sent to the model and the
+    detections of the last inferred frame are carried forward onto the skipped ones.
+    With a ``TileConfig`` each inferred frame is predicted as overlapping full-resolution
+    tiles instead of one downscaled image.
+
+    ``sinks`` receive every frame's detections in order from the writer thread through
+    ``sink.write(frame_idx, frame, detections)``, before boxes are drawn on the frame.
+    Their ``timestamp`` column holds the frame's decoder timestamp (see ``video_io``).
+    Sinks are owned (and closed) by the caller.
+
+    With ``record_floor`` the model runs at that lower confidence and every frame's raw
+    detections are kept in ``raw_detections`` (e.g. for the result cache), while sinks
+    and the output still only see boxes above ``threshold``. With ``replay`` (raw
+    detections of a previous run) no model is called: each frame's rows are filtered
+    by ``threshold`` and drawn.
+
+    ``io`` selects the decode/encode backend (see ``video_io``). With a ``decode_scale``
+    below 1, boxes and the output video are at the reduced resolution.
+
+    ``render_every`` N > 1 draws and encodes only every Nth frame (a shorter preview at
+    a 1/N frame rate with the same duration); 0 writes no video at all, for runs where
+    only the detections passed to ``sinks`` are needed. Inference is unaffected.
+    """
+
+    def __init__(self, model, threshold: float, batch_size: int = DEFAULT_BATCH_SIZE,
+                 queue_depth: int = DEFAULT_QUEUE_DEPTH, sampler: Optional[FrameSampler] = None,
+                 tiling: Optional[TileConfig] = None, sinks: Sequence = (),
+                 record_floor: Optional[float] = None, replay: Optional[DetectionBatch] = None,
+                 io: VideoIOConfig = VideoIOConfig(), render_every: int = 1):
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if queue_depth < 1:
+            raise ValueError("queue_depth must be at least 1")
+        if render_every < 0:
+            raise ValueError("render_every must be 0 (no video) or at least 1")
+        self.model = model
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.queue_depth = queue_depth
+        self.sampler = sampler
+        self.tiling = tiling
+        self.sinks = list(sinks)
+        self.record_floor = record_floor
+        self.replay = replay
+        self.io = io
+        self.render_every = render_every
+        self.raw_detections: Optional[DetectionBatch] = None
+        self.frames_written = 0
+        self.metrics = get_metrics()
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        # Decoder timestamps of frames between the reader and writer stages
+        self._timestamps: Dict[int, Optional[float]] = {}
+
+    def run(self, video_path: Path, output_path: Optional[Path],
+            on_progress: Optional[Callable[[int, int], None]] = None,
+            progress_interval: float = 0.1) -> EngineStats:
+        """Processes ``video_path`` into ``output_path`` and returns per-stage throughput.
+
+        No video is written when ``render_every`` is 0 or ``output_path`` is None.
+
+        ``on_progress(frames_written, frame_count)`` is called from the calling thread,
+        so it may safely update Streamlit elements.
+        """
+        video_capture = open_reader(video_path, self.io)
+        video_writer = None
+        try:
+            if self.render_every and output_path is not None:
+                info = video_capture.info
+                video_writer = open_writer(output_path, info._replace(fps=info.fps / self.render_every),
+                                           self.io, source=video_capture)
+        except BaseException:
+            video_capture.close()
+            raise
+        frame_count = video_capture.info.frame_count
+
+        self.frames_written = 0
+        self.raw_detections = None
+        sampler = self.sampler or FrameSampler("all")
+        self._stop.clear()
+        self._error = None
+        self._timestamps = {}
+        stages = {name: StageStats(name) for name in ("decode", "inference", "encode")}
+        decoded = queue.Queue(maxsize=self.queue_depth)
+        inferred = queue.Queue(maxsize=self.queue_depth)
+
+        threads = [
+            threading.Thread(target=self._guard, args=(self._read, video_capture, sampler, decoded, stages["decode"]),
+                             name="video-reader", daemon=True),
+            threading.Thread(target=self._guard, args=(self._infer, decoded, inferred, stages["inference"]),
+                             name="video-inference", daemon=True),
+            threading.Thread(target=self._guard, args=(self._write, inferred, video_writer, stages["encode"]),
+                             name="video-writer", daemon=True),
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            writer_thread = threads[-1]
+            while writer_thread.is_alive():
+                writer_thread.join(timeout=progress_interval)
+                if on_progress:
+                    on_progress(self.frames_written, frame_count)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            video_capture.close()
+            if video_writer is not None:
+                video_writer.close()
+        wall_seconds = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+        stats = EngineStats(frames=self.frames_written, frames_inferred=stages["inference"].frames,
+                            wall_seconds=wall_seconds, stages=stages)
+        logger.info("Processed %d frames (%.0f%% inferred) in %.1fs (%.1f FPS)", stats.frames,
+                    100 * stats.inferred_fraction, stats.wall_seconds, stats.fps)
+        return stats
+
+    def _guard(self, stage, *args) -> None:
+        """Runs a stage and stops the whole pipeline if it fails."""
+        try:
+            stage(*args)
+        except BaseException as e:
+            logger.exception("Video pipeline stage failed")
+            if self._error is None:
+                self._error = e
+            self._stop.set()
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocks until ``item`` is queued, giving up if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        """Blocks until an item is available, returning ``_END`` if the pipeline is stopping."""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _read(self, video_capture, sampler: FrameSampler, out_q: queue.Queue, stats: StageStats) -> None:
+        frame_idx = 0
+        while True:
+            t0 = time.perf_counter()
+            ret, frame = video_capture.read()
+            t1 = time.perf_counter()
+            if not ret:
+                stats.busy_seconds += t1 - t0
+                break
+            infer = sampler.should_infer(frame_idx, frame)
+            t2 = time.perf_counter()
+            self.metrics.observe("video.decode", t1 - t0)
+            self.metrics.observe("video.sample", t2 - t1)
+            stats.busy_seconds += t2 - t0
+            stats.frames += 1
+            self._timestamps[frame_idx] = video_capture.timestamp
+            if not self._put(out_q, (frame_idx, frame, infer)):
+                return
+            frame_idx += 1
+        self._put(out_q, _END)
+
+    def _replay(self, in_q: queue.Queue, out_q: queue.Queue, stats: StageStats) -> None:
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                break
+            frame_idx, frame, _ = item
+            t0 = time.perf_counter()
+            detections = self.replay.for_frame(frame_idx).filter(min_score=self.threshold)
+            stats.busy_seconds += time.perf_counter() - t0
+            if not self._put(out_q, (frame_idx, frame, detections)):
+                return
+        self._put(out_q, _END)
+
+    def _infer(self, in_q: queue.Queue, out_q: queue.Queue, stats: StageStats) -> None:
+        if self.replay is not None:
+            return self._replay(in_q, out_q, stats)
+        # Predict at the recording floor, then filter down to the threshold per frame
+        conf = min(self.record_floor, self.threshold) if self.record_floor is not None else self.threshold
+        recorded = []
+        slots = self.tiling.batch_size if self.tiling is not None else self.batch_size
+        letterbox = Letterbox(INPUT_SIZE, slots=max(slots, 1))
+        pending = []
+        keyframes = 0
+        last_detections = None
+        finished = False
+        while not finished:
+            item = self._get(in_q)
+            if item is _END:
+                finished = True
+            else:
+                pending.append(item)
+                keyframes += item[2]
+            if not pending or not (finished or keyframes == self.batch_size or len(pending) >= MAX_PENDING_FRAMES):
+                continue
+
+            batch_detections = iter(())
+            if keyframes and self.tiling is not None:
+                # Tiles of each frame are batched together instead of frames
+                t0 = time.perf_counter()
+                batch_detections = iter([sliced_predict(self.model, frame, conf, self.tiling, frame_idx, letterbox)[0]
+                                         for frame_idx, frame, infer in pending if infer])
+                t1 = time.perf_counter()
+                self.metrics.observe("video.sliced_inference", t1 - t0, keyframes)
+                stats.busy_seconds += t1 - t0
+                stats.frames += keyframes
+            elif keyframes:
+                t0 = time.perf_counter()
+                keyframe_indices = [frame_idx for frame_idx, _, infer in pending if infer]
+                inputs, infos = zip(*(letterbox(frame) for _, frame, infer in pending if infer))
+                t1 = time.perf_counter()
+                results = self.model.predict(list(inputs), conf=conf, verbose=False)
+                t2 = time.perf_counter()
+                # Extract before the letterbox buffers are reused by the next batch
+                batch_detections = iter([DetectionBatch.from_result(result, frame_idx, info)
+                                         for result, frame_idx, info in zip(results, keyframe_indices, infos)])
+                t3 = time.perf_counter()
+                self.metrics.observe("video.preprocess", t1 - t0, keyframes)
+                self.metrics.observe("video.inference", t2 - t1, keyframes)
+                self.metrics.observe("video.postprocess", t3 - t2, keyframes)
+                stats.busy_seconds += t3 - t0
+                stats.frames += keyframes
+
+            for frame_idx, frame, infer in pending:
+                if infer:
+                    detections = last_detections = next(batch_detections)
+                else:
+                    # Skipped frames carry forward the boxes of the last inferred frame
+                    detections = last_detections.with_frame_index(frame_idx)
+                if self.record_floor is not None:
+                    recorded.append(detections)
+                    detections = detections.filter(min_score=self.threshold)
+                if not self._put(out_q, (frame_idx, frame, detections)):
+                    return
+            pending = []
+            keyframes = 0
+        if self.record_floor is not None:
+            self.raw_detections = DetectionBatch.concatenate(recorded)
+        self._put(out_q, _END)
+
+    def _write(self, in_q: queue.Queue, video_writer, stats: StageStats) -> None:
+        while True:
+            item = self._get(in_q)
+            if item is _END:
+                break
+            frame_idx, frame, detections = item
+            t0 = time.perf_counter()
+            detections = detections.with_timestamp(self._timestamps.pop(frame_idx, None))
+            for sink in self.sinks:
+                sink.write(frame_idx, frame, detections)
+            t1 = t2 = t3 = time.perf_counter()
+            if video_writer is not None and frame_idx % self.render_every == 0:
+                # Boxes are already in original coordinates, so draw straight onto the decoded frame
+                draw_detections(frame, detections)
+                t2 = time.perf_counter()
+                video_writer.write(frame, frame_idx)
+                t3 = time.perf_counter()
+                self.metrics.observe("video.annotate", t2 - t1)
+                self.metrics.observe("video.encode", t3 - t2)
+            if self.sinks:
+                self.metrics.observe("video.sinks", t1 - t0)
+            stats.busy_seconds += t3 - t0
+            stats.frames += 1
+            self.frames_written = frame_idx + 1
@@ -0,0 +1,238 @@
+"""Video decode/encode backends for the video engine.
+
+``opencv`` is ``cv2.VideoCapture`` / ``cv2.VideoWriter`` with the ``mp4v`` codec.
+``pyav`` decodes with FFmpeg's frame and slice threads, can scale frames down during
+pixel format conversion (cheaper than decoding and then resizing), and encodes H.264
+(``libx264`` or a hardware encoder such as ``h264_nvenc``) with a configurable preset
+and CRF. Its output keeps the input's frame timestamps and audio track and starts
+with the ``moov`` atom, so it plays in browsers.
+
+Readers return ``(ok, frame)`` like ``cv2.VideoCapture.read`` (and keep the frame's
+decoder timestamp in ``timestamp``, seconds from the start of the stream) and writers take BGR
+frames like ``cv2.VideoWriter.write`` (plus the optional index of the frame in the
+input, so a writer that drops frames keeps the right timestamps), so either backend can be selected (e.g. to
+benchmark them against each other) without touching the pipeline.
+"""
+import importlib.util
+import logging
+import os
+from fractions import Fraction
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# PyAV is imported on first use (by _require_av), not when the pages load
+av = None
+
+VIDEO_BACKENDS = ("opencv", "pyav")
+DEFAULT_VIDEO_BACKEND = os.environ.get("RDD_VIDEO_BACKEND", "pyav" if importlib.util.find_spec("av") else "opencv")
+DEFAULT_CODEC = os.environ.get("RDD_VIDEO_CODEC", "libx264")
+DEFAULT_PRESET = "veryfast"
+DEFAULT_CRF = 23
+
+class VideoIOConfig(NamedTuple):
+    backend: str = DEFAULT_VIDEO_BACKEND
+    decode_scale: float = 1.0   # < 1 decodes frames at a lower resolution
+    codec: str = DEFAULT_CODEC  # pyav only
+    preset: str = DEFAULT_PRESET
+    crf: int = DEFAULT_CRF
+    threads: int = 0            # decoder/encoder threads, 0 lets FFmpeg decide
+
+class StreamInfo(NamedTuple):
+    width: int          # of the decoded (possibly scaled) frames
+    height: int
+    fps: float
+    frame_count: int
+
+def _require_av():
+    global av
+    if av is None:
+        try:
+            import av as module
+        except ImportError:
+            raise ImportError("The pyav video backend requires PyAV: pip install av") from None
+        av = module
+    return av
+
+def _scaled_size(width: int, height: int, scale: float) -> Tuple[int, int]:
+    if scale >= 1:
+        return width, height
+    # Even dimensions keep the H.264 (yuv420p) encoder happy
+    return max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+
+class OpenCVReader:
+    def __init__(self, path: Path, decode_scale: float = 1.0):
+        self._capture = cv2.VideoCapture(str(path))
+        if not self._capture.isOpened():
+            raise IOError(f"Cannot open video file: {path}")
+        width = int(self._capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(self._capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self._source_size = (width, height)
+        width, height = _scaled_size(width, height, decode_scale)
+        self.info = StreamInfo(width, height, self._capture.get(cv2.CAP_PROP_FPS),
+                               int(self._capture.get(cv2.CAP_PROP_FRAME_COUNT)))
+        self.timestamp: Optional[float] = None
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ret, frame = self._capture.read()
+        # Position of the frame just decoded
+        self.timestamp = self._capture.get(cv2.CAP_PROP_POS_MSEC) / 1000 if ret else None
+        if ret and (self.info.width, self.info.height) != self._source_size:
+            frame = cv2.resize(frame, (self.info.width, self.info.height), interpolation=cv2.INTER_AREA)
+        return ret, frame
+
+    def close(self) -> None:
+        self._capture.release()
+
+class OpenCVWriter:
+    def __init__(self, path: Path, info: StreamInfo):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self._writer = cv2.VideoWriter(str(path), fourcc, info.fps, (info.width, info.height))
+
+    def write(self, frame: np.ndarray, index: Optional[int] = None) -> None:
+        self._writer.write(frame)
+
+    def close(self) -> None:
+        self._writer.release()
+
+class PyAVReader:
+    """Threaded FFmpeg decode; keeps every frame's timestamp for ``PyAVWriter``."""
+
+    def __init__(self, path: Path, decode_scale: float = 1.0, threads: int = 0):
+        _require_av()
+        self.path = Path(path)
+        try:
+            self.container = av.open(str(path))
+        except av.error.FFmpegError as e:
+            raise IOError(f"Cannot open video file: {path}") from e
+        if not self.container.streams.video:
+            self.container.close()
+            raise IOError(f"No video stream in file: {path}")
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = "AUTO"
+        if threads:
+            self.stream.codec_context.thread_count = threads
+        self.time_base = self.stream.time_base
+        self.timestamps: List[Optional[int]] = []
+        self.timestamp: Optional[float] = None
+        self._start_pts = self.stream.start_time
+
+        rate = self.stream.average_rate or self.stream.guessed_rate or 0
+        fps = float(rate) if rate else 0.0
+        frame_count = self.stream.frames
+        if not frame_count and self.stream.duration and self.time_base and fps:
+            frame_count = int(self.stream.duration * self.time_base * fps)
+        width, height = _scaled_size(self.stream.codec_context.width, self.stream.codec_context.height, decode_scale)
+        self.info = StreamInfo(width, height, fps, frame_count)
+        self._scale = (width, height) != (self.stream.codec_context.width, self.stream.codec_context.height)
+        self._frames = self.container.decode(self.stream)
+
+    @property
+    def has_audio(self) -> bool:
+        return bool(self.container.streams.audio)
+
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        try:
+            frame = next(self._frames)
+        except StopIteration:
+            return False, None
+        self.timestamps.append(frame.pts)
+        if frame.pts is None or not self.time_base:
+            self.timestamp = None
+        else:
+            if self._start_pts is None:
+                self._start_pts = frame.pts
+            self.timestamp = float((frame.pts - self._start_pts) * self.time_base)
+        if self._scale:
+            # Scaled by swscale as part of the YUV -> BGR conversion
+            return True, frame.to_ndarray(format='bgr24', width=self.info.width, height=self.info.height)
+        return True, frame.to_ndarray(format='bgr24')
+
+    def close(self) -> None:
+        self.container.close()
+
+class PyAVWriter:
+    """H.264 encode; with a ``PyAVReader`` source it reuses its timestamps and audio."""
+
+    def __init__(self, path: Path, info: StreamInfo, codec: str = DEFAULT_CODEC, preset: str = DEFAULT_PRESET,
+                 crf: int = DEFAULT_CRF, threads: int = 0, source: Optional[PyAVReader] = None):
+        _require_av()
+        self.path = Path(path)
+        self.source = source
+        # Put the index first so browsers can start playing before the download ends
+        self.container = av.open(str(path), 'w', options={'movflags': '+faststart'})
+        rate = Fraction(info.fps).limit_denominator(100000) if info.fps > 0 else Fraction(30)
+        options = {'preset': preset, 'crf': str(crf)} if codec == "libx264" else {}
+        self.stream = self.container.add_stream(codec, rate=rate, options=options)
+        self.stream.width = info.width - info.width % 2
+        self.stream.height = info.height - info.height % 2
+        self.stream.pix_fmt = 'yuv420p'
+        if threads:
+            self.stream.codec_context.thread_count = threads
+        self.time_base = source.time_base if source is not None and source.time_base else 1 / rate
+        self.stream.time_base = self.time_base
+        self.audio_stream = None
+        if source is not None and source.has_audio:
+            self.audio_stream = self.container.add_stream_from_template(source.container.streams.audio[0])
+        self._count = 0
+        self._last_pts = None
+
+    def _next_pts(self, index: int) -> int:
+        pts = None
+        if self.source is not None and index < len(self.source.timestamps):
+            pts = self.source.timestamps[index]
+        if pts is None or (self._last_pts is not None and pts <= self._last_pts):
+            # No (or non-increasing) source timestamp: continue one frame later
+            step = max(int(round(1 / (self.stream.average_rate * self.time_base))), 1) if self.stream.average_rate else 1
+            pts = 0 if self._last_pts is None else self._last_pts + step
+        self._last_pts = pts
+        return pts
+
+    def write(self, frame: np.ndarray, index: Optional[int] = None) -> None:
+        """Encodes ``frame``; ``index`` is its position in the source (default: frames written so far)."""
+        if frame.shape[1] != self.stream.width or frame.shape[0] != self.stream.height:
+            frame = frame[:self.stream.height, :self.stream.width]
+        video_frame = av.VideoFrame.from_ndarray(np.ascontiguousarray(frame), format='bgr24')
+        video_frame.pts = self._next_pts(self._count if index is None else index)
+        video_frame.time_base = self.time_base
+        self._count += 1
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    def close(self) -> None:
+        try:
+            for packet in self.stream.encode(None):
+                self.container.mux(packet)
+            if self.audio_stream is not None:
+                self._copy_audio()
+        finally:
+            self.container.close()
+
+    def _copy_audio(self) -> None:
+        """Remuxes the source's audio packets unchanged."""
+        with av.open(str(self.source.path)) as source:
+            for packet in source.demux(source.streams.audio[0]):
+                if packet.dts is None:
+                    continue
+                packet.stream = self.audio_stream
+                self.container.mux(packet)
+
+def open_reader(path: Path, config: VideoIOConfig = VideoIOConfig()):
+    if config.backend == "pyav":
+        return PyAVReader(path, config.decode_scale, config.threads)
+    if config.backend == "opencv":
+        return OpenCVReader(path, config.decode_scale)
+    raise ValueError(f"Unknown video backend: {config.backend}")
+
+def open_writer(path: Path, info: StreamInfo, config: VideoIOConfig = VideoIOConfig(), source=None):
+    """Opens a writer for ``info``-sized frames; ``source`` is the reader of the input video."""
+    if config.backend == "pyav":
+        return PyAVWriter(path, info, config.codec, config.preset, config.crf, config.threads,
+                          source if isinstance(source, PyAVReader) else None)
+    if config.backend == "opencv":
+        return OpenCVWriter(path, info)
+    raise ValueError(f"Unknown video backend: {config.backend}")